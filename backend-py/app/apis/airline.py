@@ -13,16 +13,19 @@ import datetime
 
 from app.apis.utils import airline_id_from_user, generate_secure_password
 from app.core.auth import roles_required
+from app.core.flight_rows import airline_flight_page
+from app.core.seat_map import invalidate_layout
 from app.core.stats import calculate_airline_stats
+from app.core.timetable import timetable_index
 from app.extensions import db, redis_client
 from app.models.airlines import Airline, AirlineAircraft, AirlineAircraftSeat
 from app.models.airport import Airport
 from app.models.booking import BookingDepartureFlight, BookingReturnFlight
 from app.models.extra import Extra
-from app.apis.location import nation_model
+from app.apis.location import city_model, nation_model
 from app.models.flight import Route, Flight, FlightExtra
 from app.models.user import User
-from app.schemas.flight import FlightSchema, flight_schema,all_flights_schema, flight_extra_schema, flights_extra_schema
+from app.schemas.flight import FlightSchema, flight_schema, flight_extra_schema, flights_extra_schema
 from app.schemas.airline import AirlineSchema, airline_schema, airlines_schema,route_schema,routes_schema, extra_schema, extras_schema, airline_aircraft_schema, airline_aircrafts_schema
 from app.apis.airport import airport_model
 
@@ -173,11 +176,19 @@ flight_model_output = api.model('AirlineFlightOutput', {
 
 airline_aircraft_minified_model = api.model('AirlineAircraftMinified', {
     "id": fields.String(readonly=True, description='Airline Aircraft ID'),
+    "aircraft_id": fields.Integer(description='Aircraft ID'),
+    "airline_id": fields.String(description='Airline ID'),
     "tail_number": fields.String(required=False, description='Aircraft tail number'),
     "aircraft": fields.Nested(aircraft_model, required=True, description='Aircraft')
 })
 
 
+flight_airport_model = api.clone('FlightAirport', airport_model, {
+    'city_id': fields.Integer(description='City ID'),
+    'city': fields.Nested(city_model, description='Associated City'),
+})
+
+
 all_flight_output_model = api.model('AllFlightOutput', {
     'id': fields.String(readonly=True, description='Flight ID'),
     'flight_number': fields.String(required=True, description='Flight number'),
@@ -185,8 +196,10 @@ all_flight_output_model = api.model('AllFlightOutput', {
     'route_id': fields.String(readonly=True, description='Route ID'),
     'departure_time': fields.DateTime(required=True, description='Departure time'),
     'arrival_time': fields.DateTime(required=True, description='Arrival time'),
-    'departure_airport': fields.Nested(airport_model, description='Departure Airport'),
-    'arrival_airport': fields.Nested(airport_model, description='Arrival Airport'),
+    'departure_airport': fields.Nested(flight_airport_model, description='Departure Airport'),
+    'arrival_airport': fields.Nested(flight_airport_model, description='Arrival Airport'),
+    'fully_booked': fields.Boolean(description='Is the flight fully booked'),
+    'is_editable': fields.Boolean(description='Is editable'),
 })
 
 seats_info_model = api.model('SeatsInfo', {
@@ -561,6 +574,9 @@ class AirlineAircraftResource(Resource):
             aircraft.tail_number = data['tail_number']
 
         db.session.commit()
+        if 'aircraft_id' in data:
+            # The rows of the layout come from the aircraft model
+            invalidate_layout(aircraft.id)
         return marshal(airline_aircraft_schema.dump(aircraft),airline_aircraft_model), 200
     
     @jwt_required()
@@ -657,6 +673,8 @@ class AirlineRouteResource(Resource):
         # Update the route instance with the new data
 
         db.session.commit()
+        # Airports and flight number are denormalized into every cached flight of the route
+        timetable_index.invalidate_all()
         return marshal(route_schema.dump(route),route_model), 200
 
     @jwt_required()
@@ -698,7 +716,7 @@ class MyAirlineFlightsList(Resource):
     @api.response(200, 'OK', flights_pagination_model)
     @api.response(404, 'Not Found')
     def get(self, airline_id):
-        """Get all flights for the current airline"""
+        """Get all flights for the current airline, ordered by departure time"""
         # Handle pagination parameters
         page_number = request.args.get('page_number', 1, type=int)
         limit = request.args.get('limit', 10, type=int)
@@ -708,35 +726,26 @@ class MyAirlineFlightsList(Resource):
         if limit < 1:
             return {'error': 'Limit must be greater than 0'}, 400
         
-        # Use database pagination instead of loading all flights
-        flights_query = Flight.query.join(Flight.route).filter(Route.airline_id == airline_id)
-        
-        # Get total count for pagination info
-        total_flights = flights_query.count()
-        
+        # Database pagination over a projection of the listed columns, bookings are only checked for existence
+        offset = (page_number - 1) * limit
+        total_flights, flights = airline_flight_page(airline_id, offset, limit)
+
         if total_flights == 0:
             return {
                 'items': [],
                 'total_pages': 0
             }, 200
-        
+
         # Calculate pagination
         total_pages = (total_flights + limit - 1) // limit
-        offset = (page_number - 1) * limit
-        
-        # Apply pagination at database level
-        flights = flights_query.offset(offset).limit(limit).all()
-        
-        # Serialize the flights
-        flight_data = all_flights_schema.dump(flights)
-        
+
         # Return paginated response
         flights_pagination = {
-            'items': flight_data,
+            'items': flights,
             'total_pages': total_pages
         }
 
-        return flights_pagination, 200
+        return marshal(flights_pagination, flights_pagination_model), 200
 
     @api.expect(flight_model_input)
     @jwt_required()
@@ -794,6 +803,7 @@ class MyAirlineFlightsList(Resource):
                     db.session.add(new_extra)
 
             db.session.commit()
+            timetable_index.invalidate(new_flight.departure_time)
 
             return marshal(flight_schema.dump(new_flight), flight_model_output), 201
         except IntegrityError as err:
@@ -822,8 +832,8 @@ class MyAirlineFlightResource(Resource):
             Route.airline_id == airline_id
         ).first_or_404()
 
+        # The schema already dumps the booked seats
         flight_dump = flight_schema.dump(flight)
-        flight_dump['booked_seats'] = flight.booked_seats
         
         return marshal(flight_dump, flight_model_seats_output), 200
 
@@ -851,6 +861,7 @@ class MyAirlineFlightResource(Resource):
 
         # Extract extras from data before flight update
         extras_data = data.pop('extras', None)
+        previous_departure_time = flight.departure_time
 
         try:
             # Validate data with Marshmallow schema
@@ -890,6 +901,7 @@ class MyAirlineFlightResource(Resource):
                         db.session.add(new_extra)
 
             db.session.commit()
+            timetable_index.invalidate(previous_departure_time, flight.departure_time)
             return marshal(flight_schema.dump(flight), flight_model_output), 200
         except IntegrityError as err:
             db.session.rollback()
@@ -922,8 +934,10 @@ class MyAirlineFlightResource(Resource):
 
 
             try:
+                departure_time = flight.departure_time
                 db.session.delete(flight)
                 db.session.commit()
+                timetable_index.invalidate(departure_time)
             except IntegrityError:
                 import traceback
                 traceback.print_exc()
@@ -4,13 +4,16 @@ from flask import request, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from flask_restx import Namespace, Resource, fields, marshal, reqparse
 from marshmallow import ValidationError
-from sqlalchemy import text
+from sqlalchemy import exists, text
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker
 
 from app.apis.flight import flight_model_output
 from app.apis.utils import price_from_flight
 from app.core.auth import roles_required
+from app.core.seat_holds import get_session, release_session
+from app.core.seat_map import mark_booked, mark_cancelled
+from app.core.timetable import timetable_index
 from app.extensions import db
 from app.models.booking import (
     Booking,
@@ -20,7 +23,6 @@ from app.models.booking import (
 )
 from app.models.common import ClassType
 from app.models.flight import Flight, FlightExtra
-from app.models.seat_session import SeatSession
 from app.schemas.booking import (
     booking_schema,
     booking_output_schema,
@@ -125,12 +127,25 @@ def generate_unique_booking_number(session):
         if not exists:
             return candidate
         
+# Checks if a seat of a flight is already booked, as departure or return flight
+def is_seat_booked(sql_session, flight_id, seat_number) -> bool:
+    for booking_flight_model in (BookingDepartureFlight, BookingReturnFlight):
+        if sql_session.query(exists().where(
+            booking_flight_model.flight_id == flight_id,
+            booking_flight_model.seat_number == seat_number,
+        )).scalar():
+            return True
+    return False
+
 # Checks if a flight is fully booked and updates its status accordingly
 def check_and_update_flight_capacity(sql_session, flight_id):
-    """Check if a flight is fully booked and update the flag"""
+    """
+    Check if a flight is fully booked and update the flag. Returns the departure time of the flight
+    when the flag changed, the caller invalidates the search timetable once its transaction committed
+    """
     flight = sql_session.query(Flight).filter(Flight.id == flight_id).first()
     if not flight:
-        return
+        return None
     
     # Calculate total available seats across all classes
     total_seats = (
@@ -143,8 +158,14 @@ def check_and_update_flight_capacity(sql_session, flight_id):
     booked_seats_count = len(flight.booked_seats_confirmed)
     
     # Update fully_booked flag if all seats are taken
-    flight.fully_booked = booked_seats_count >= total_seats
-    sql_session.commit()
+    fully_booked = booked_seats_count >= total_seats
+    changed = flight.fully_booked != fully_booked
+    flight.fully_booked = fully_booked
+    # Committed with the rest of the booking by the caller
+    sql_session.flush()
+
+    # Fully booked flights are not part of the search timetable
+    return flight.departure_time if changed else None
 
 @api.route("/")
 @api.response(500, "Internal Server Error")
@@ -207,6 +228,35 @@ class BookingList(Resource):
         user_id = get_jwt_identity()
         data = request.json
 
+        try:
+            validated_data = booking_schema.load(data)
+        except ValidationError as err:
+            return {"errors": err.messages}, 400
+
+        # Held seats are written to Postgres only now, the session is released once they are booked
+        seat_session = get_session(validated_data["session_id"])
+        if seat_session is None or seat_session.user_id != str(user_id):
+            return {
+                "error": "Seat session does not belong to the user",
+                "code": 403,
+            }, 403
+
+        departure_flights = validated_data["departure_flights"]
+        return_flights = validated_data["return_flights"]
+        extras = validated_data["extras"]
+        # (booking flight model, held seat) of every seat to book
+        seats_to_book = [
+            (BookingDepartureFlight, seat)
+            for flight_id in departure_flights
+            for seat in seat_session.seats
+            if seat.flight_id == flight_id
+        ] + [
+            (BookingReturnFlight, seat)
+            for flight_id in return_flights
+            for seat in seat_session.seats
+            if seat.flight_id == flight_id
+        ]
+
         with db.engine.begin() as connection:
             connection.execute(text("SET TRANSACTION ISOLATION LEVEL SERIALIZABLE"))
 
@@ -214,98 +264,19 @@ class BookingList(Resource):
             session = sessionmaker(bind=connection)
             sql_session = session()
 
-            try:
-                validated_data = booking_schema.load(data)
-            except ValidationError as err:
-                return {"errors": err.messages}, 400
-
-            seat_session = (
-                sql_session.query(SeatSession)
-                .filter(
-                    SeatSession.id == validated_data["session_id"],
-                    SeatSession.user_id == user_id,
-                )
-                .first()
-            )
-            if seat_session is None:
-                return {
-                    "error": "Seat session does not belong to the user",
-                    "code": 403,
-                }, 403
-            all_seats = seat_session.seats
-            booking = Booking(
-                user_id=user_id,
-                payment_confirmed=True,
-                has_booking_insurance=validated_data["has_booking_insurance"],
-                booking_number=generate_unique_booking_number(sql_session),
-            )
-            sql_session.add(booking)
-            sql_session.commit()
-
-            departure_flights = validated_data["departure_flights"]
-            return_flights = validated_data["return_flights"]
-            
-            extras = validated_data["extras"]
-
-            for flight_id in departure_flights:
-                for seat in all_seats:
-                    if seat.flight_id == flight_id:
-                        flight = (
-                            sql_session.query(Flight)
-                            .filter(Flight.id == flight_id)
-                            .first()
-                        )
-                        already_booked_flight = BookingDepartureFlight.query.filter_by(flight_id=flight_id).first() is None and BookingReturnFlight.query.filter_by(flight_id=flight_id).first() is None
-                        if not already_booked_flight:
-                            return {
-                                "error": "Flight already booked",
-                                "code": 409,
-                            }, 409
-
-
-                        class_type = seat.class_type
-                        flight_price = price_from_flight(flight, class_type)
-                        booking_flight = BookingDepartureFlight(
-                            flight_id=flight_id,
-                            booking_id=booking.id,
-                            seat_number=seat.seat_number,
-                            class_type=class_type,
-                            price=flight_price,
-                        )
-                        sql_session.add(booking_flight)
-                        sql_session.flush()
-                        check_and_update_flight_capacity(sql_session, flight_id)
-                        
-                        
-                        
-
-            for flight_id in return_flights:
-                for seat in all_seats:
-                    if seat.flight_id == flight_id:
-                        flight = (
-                            sql_session.query(Flight)
-                            .filter(Flight.id == flight_id)
-                            .first()
-                        )
-                        class_type = seat.class_type
-                        flight_price = price_from_flight(flight, class_type)
-                        booking_flight = BookingReturnFlight(
-                            flight_id=flight_id,
-                            booking_id=booking.id,
-                            seat_number=seat.seat_number,
-                            class_type=class_type,
-                            price=flight_price,
-                        )
-                        sql_session.add(booking_flight)
-                        sql_session.flush()
-                        check_and_update_flight_capacity(sql_session, flight_id)
+            # Everything is validated before the first write, the whole booking is committed once on exit
+            for _, seat in seats_to_book:
+                if is_seat_booked(sql_session, seat.flight_id, seat.seat_number):
+                    return {
+                        "error": f"Seat {seat.seat_number} already booked",
+                        "code": 409,
+                    }, 409
 
+            extra_objs = []
             for extra in extras:
-                extra_id = extra["id"]
-                quantity = extra["quantity"]
                 extra_obj = (
                     sql_session.query(FlightExtra)
-                    .filter(FlightExtra.id == extra_id)
+                    .filter(FlightExtra.id == extra["id"])
                     .first()
                 )
                 if extra_obj:
@@ -314,20 +285,61 @@ class BookingList(Resource):
                             "error": "Extra does not belong to the selected flights",
                             "code": 403,
                         }, 403
-                        
-                    booking_flight_extra = BookingFlightExtra(
-                        booking_id=booking.id,
-                        flight_id=extra_obj.flight_id,
-                        extra_id=extra_obj.id,
-                        extra_price=extra_obj.price * quantity,
-                        quantity=quantity,
-                    )
-                    sql_session.add(booking_flight_extra)
-            sql_session.commit()
-            sql_session.delete(seat_session)
-            sql_session.commit()
-
-            return {"id": str(booking.id)}, 201
+                    extra_objs.append((extra_obj, extra["quantity"]))
+
+            # Departure times of the flights whose fully booked flag changed, invalidated after the commit
+            changed_departures = []
+            # (flight_id, aircraft_id, seat_number) of every booked seat, set in the seat maps after the commit
+            booked_seats = []
+            booking = Booking(
+                user_id=user_id,
+                payment_confirmed=True,
+                has_booking_insurance=validated_data["has_booking_insurance"],
+                booking_number=generate_unique_booking_number(sql_session),
+            )
+            sql_session.add(booking)
+            sql_session.flush()
+
+            for booking_flight_model, seat in seats_to_book:
+                flight = (
+                    sql_session.query(Flight)
+                    .filter(Flight.id == seat.flight_id)
+                    .first()
+                )
+                class_type = seat.class_type
+                booking_flight = booking_flight_model(
+                    flight_id=seat.flight_id,
+                    booking_id=booking.id,
+                    seat_number=seat.seat_number,
+                    class_type=class_type,
+                    price=price_from_flight(flight, class_type),
+                )
+                sql_session.add(booking_flight)
+                booked_seats.append((flight.id, flight.aircraft_id, seat.seat_number))
+                sql_session.flush()
+                changed_departures.append(check_and_update_flight_capacity(sql_session, seat.flight_id))
+
+            for extra_obj, quantity in extra_objs:
+                booking_flight_extra = BookingFlightExtra(
+                    booking_id=booking.id,
+                    flight_id=extra_obj.flight_id,
+                    extra_id=extra_obj.id,
+                    extra_price=extra_obj.price * quantity,
+                    quantity=quantity,
+                )
+                sql_session.add(booking_flight_extra)
+            sql_session.flush()
+            booking_id = booking.id
+
+        # Redis follows the committed transaction only: a failed commit leaves no booked bits and the
+        # holds in place, and a seat map rebuilt from now on reads the new bookings.
+        # Booked bits are set before the holds go away, so the seats never look free
+        for flight_id, aircraft_id, seat_number in booked_seats:
+            mark_booked(flight_id, aircraft_id, [seat_number])
+        release_session(seat_session.id, user_id)
+        # Workers reloading the days now see the new flags
+        timetable_index.invalidate(*changed_departures)
+        return {"id": str(booking_id)}, 201
 
 
 @api.route("/<uuid:booking_id>")
@@ -383,12 +395,15 @@ class BookingResource(Resource):
                 
                 # Collect flight IDs before deletion to update capacity
         flight_ids = set()
+        cancelled_seats = []
 
 
         for departure_flight in BookingDepartureFlight.query.filter_by(booking_id=booking.id):
             flight_ids.add(departure_flight.flight_id)
+            cancelled_seats.append((departure_flight.flight_id, departure_flight.flight.aircraft_id, departure_flight.seat_number))
         for return_flight in BookingReturnFlight.query.filter_by(booking_id=booking.id):
             flight_ids.add(return_flight.flight_id)
+            cancelled_seats.append((return_flight.flight_id, return_flight.flight.aircraft_id, return_flight.seat_number))
 
 
         try:
@@ -398,9 +413,11 @@ class BookingResource(Resource):
             db.session.rollback()
             return {"error": "Booking cannot be deleted due to existing dependencies"}, 409
 
+        for flight_id, aircraft_id, seat_number in cancelled_seats:
+            mark_cancelled(flight_id, aircraft_id, [seat_number])
+
         # Update flight capacities
-        for flight_id in flight_ids:
-            check_and_update_flight_capacity(db.session, flight_id)
-        
+        changed_departures = [check_and_update_flight_capacity(db.session, flight_id) for flight_id in flight_ids]
         db.session.commit()
+        timetable_index.invalidate(*changed_departures)
         return {"message": "Booking deleted successfully"}, 200
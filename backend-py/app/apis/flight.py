@@ -1,9 +1,14 @@
-from flask_restx import Namespace, Resource, fields, marshal
-from sqlalchemy.orm import joinedload
+from flask import request
+from flask_restx import Namespace, Resource, fields, marshal, reqparse
 
 from app.apis.airport import airport_model
+from app.core.flight_rows import flight_detail
+from app.core.seat_map import encode_bitmap, load_seat_map, occupancy_etag, occupancy_state, seat_layout, \
+    seat_map_changes
+from app.extensions import db
+from app.models.common import ClassType
 from app.models.flight import Flight, FlightExtra
-from app.schemas.flight import flight_schema, flights_extra_schema
+from app.schemas.flight import flights_extra_schema
 
 api = Namespace('flight', description='Flight related operations')
 
@@ -39,11 +44,12 @@ class FlightResource(Resource):
     @api.response(200, 'OK', flight_model_output)
     def get(self, flight_id):
         """Fetch a flight with nested route and airport/city data"""
-        flight = Flight.query.options(
-            joinedload(Flight.route),
-        ).get_or_404(flight_id)
+        # Projection of the returned columns only, no booking or seat is loaded
+        flight = flight_detail(flight_id)
+        if flight is None:
+            return {'error': 'Flight not found', 'code': 404}, 404
 
-        return marshal(flight_schema.dump(flight), flight_model_output), 200
+        return marshal(flight, flight_model_output), 200
 
 seats_info_model = api.model('SeatsInfo', {
     'first_class_seats': fields.List(fields.String, description='First class seats'),
@@ -58,6 +64,31 @@ booked_seats_model = api.model('BookedSeats', {
     'rows': fields.Integer(description='Rows of the aircraft'),
 })
 
+seat_layout_model = api.model('SeatLayout', {
+    'aircraft_id': fields.String(readonly=True, description='Airline aircraft ID'),
+    'layout': fields.String(readonly=True, description='Layout digest, also the ETag of the layout'),
+    'rows': fields.Integer(description='Rows of the aircraft'),
+    'first_class_seats': fields.List(fields.String, description='First class seats, in bitmap order'),
+    'business_class_seats': fields.List(fields.String, description='Business class seats, in bitmap order'),
+    'economy_class_seats': fields.List(fields.String, description='Economy class seats, in bitmap order'),
+})
+
+seat_occupancy_model = api.model('SeatOccupancy', {
+    'flight_id': fields.String(readonly=True, description='Flight ID'),
+    'aircraft_id': fields.String(readonly=True, description='Airline aircraft ID of the layout'),
+    'layout': fields.String(readonly=True, description='Layout digest the bitmap refers to'),
+    'version': fields.Integer(description='Occupancy version, pass it as `since` to get the next changes'),
+    'diff': fields.Boolean(description='Whether only the changes since the given version are returned'),
+    'bitmap': fields.String(description='Base64 booked seats bitmap over the layout seats, full responses only'),
+    'booked': fields.List(fields.String, description='Seats booked since the given version, diffs only'),
+    'cancelled': fields.List(fields.String, description='Seats freed since the given version, diffs only'),
+    'held': fields.List(fields.String, description='Seats currently held by seat sessions'),
+})
+
+seat_occupancy_parser = reqparse.RequestParser()
+seat_occupancy_parser.add_argument('since', type=int, help='Version already known by the client', location='args')
+seat_occupancy_parser.add_argument('layout', type=str, help='Layout digest known by the client', location='args')
+
 extra_flight_model = api.model('FlightExtra', {
     'id': fields.String(readonly=True, description='Flight Extra ID'),
     'name': fields.String(readonly=True,required=True, description='Name of the extra'),
@@ -100,3 +131,69 @@ class FlightSeats(Resource):
             'seats_info': flight.seats_info,
             'rows': flight.rows
         }, booked_seats_model), 200
+
+
+@api.route('/seats/layout/<uuid:aircraft_id>')
+@api.param('aircraft_id', 'The airline aircraft identifier')
+class SeatLayoutResource(Resource):
+    @api.doc(security=None)
+    @api.response(304, 'Not Modified')
+    @api.response(404, 'Not Found')
+    @api.response(200, 'OK', seat_layout_model)
+    def get(self, aircraft_id):
+        """Get the seat layout of an aircraft, the order of the seats is the order of the occupancy bitmap"""
+        layout = seat_layout(aircraft_id)
+        if not layout.seats:
+            return {'error': 'Aircraft not found', 'code': 404}, 404
+
+        headers = {'ETag': '"{}"'.format(layout.digest), 'Cache-Control': 'public, max-age=300'}
+        if layout.digest in request.if_none_match:
+            return '', 304, headers
+
+        return marshal({
+            'aircraft_id': str(aircraft_id),
+            'layout': layout.digest,
+            'rows': layout.rows,
+            'first_class_seats': layout.class_seats(ClassType.FIRST_CLASS),
+            'business_class_seats': layout.class_seats(ClassType.BUSINESS_CLASS),
+            'economy_class_seats': layout.class_seats(ClassType.ECONOMY_CLASS),
+        }, seat_layout_model), 200, headers
+
+
+@api.route('/seats/<uuid:flight_id>/occupancy')
+@api.param('flight_id', 'The flight identifier')
+class FlightSeatOccupancy(Resource):
+    @api.doc(security=None)
+    @api.expect(seat_occupancy_parser)
+    @api.response(304, 'Not Modified')
+    @api.response(404, 'Not Found')
+    @api.response(200, 'OK', seat_occupancy_model)
+    def get(self, flight_id):
+        """
+        Get the occupancy of a flight: 304 when the ETag did not change, the changes since `since` when
+        the change log still covers them, the whole bitmap otherwise
+        """
+        args = seat_occupancy_parser.parse_args()
+        aircraft_id = db.session.query(Flight.aircraft_id).filter(Flight.id == flight_id).scalar()
+        if aircraft_id is None:
+            return {'error': 'Flight not found', 'code': 404}, 404
+
+        digest, version, held = occupancy_state(flight_id, aircraft_id)
+        etag = occupancy_etag(digest, version, len(held))
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if etag.strip('"') in request.if_none_match:
+            return '', 304, headers
+
+        occupancy = {'flight_id': str(flight_id), 'aircraft_id': str(aircraft_id), 'layout': digest}
+        if args['since'] is not None and args['layout'] == digest:
+            changes = seat_map_changes(flight_id, args['since'], version)
+            if changes is not None:
+                occupancy.update(version=version, diff=True, booked=changes[0], cancelled=changes[1], held=held)
+                return marshal(occupancy, seat_occupancy_model), 200, headers
+
+        seat_map = load_seat_map(Flight.query.get(flight_id))
+        held = sorted(seat_map.held)
+        headers['ETag'] = occupancy_etag(seat_map.layout.digest, seat_map.version, len(held))
+        occupancy.update(layout=seat_map.layout.digest, version=seat_map.version, diff=False,
+                         bitmap=encode_bitmap(seat_map.bitmap), held=held)
+        return marshal(occupancy, seat_occupancy_model), 200, headers
@@ -1,14 +1,21 @@
 from collections import defaultdict, deque
+import json
 
 from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from flask import request, Response, stream_with_context
 from flask_restx import Namespace, Resource, fields, reqparse, marshal
 import datetime
 import uuid
 
 from sqlalchemy.orm import joinedload
 
-from app.apis.search_utils import generate_journey, filter_journeys, sort_journeys, get_airports, \
-    lowest_price_multiple_dates, check_duplicate_flight
+from app.apis.search_utils import generate_journey, filter_journeys, select_journeys, get_airports, \
+    lowest_price_multiple_dates, get_booked_flight_ids, validate_time_filters, materialized_lowest_prices, \
+    month_dates, get_departure_airports, explore_destinations, generate_round_trips, generate_multi_city, \
+    stream_journeys
+from app.core import fare_calendar
+from app.core.search_cache import search_cache_key, cached_search, encode_cursor, decode_cursor, get_cached, \
+    set_cached, SEARCH_LOCK_TTL
 from app.extensions import db
 from app.models import Flight
 from app.models.airport import Airport
@@ -49,7 +56,7 @@ def build_base_search_parser():
     parser.add_argument('departure_time_max', type=str,
                         help='Maximum departure time (HH:MM)', location='args')
     parser.add_argument('order_by', type=str, choices=('price', 'duration', 'stops'),
-                        help='Order by field (price_economy, duration_minutes, stops)', location='args')
+                        help='Order by field (price_economy, duration_minutes, stops), departure time by default', location='args')
     parser.add_argument('order_by_desc', type=str_to_bool, default="False",
                         help='Order by field descending', location='args')
     # Pagination parameters
@@ -64,12 +71,46 @@ def build_base_search_parser():
 flight_search_parser = build_base_search_parser()
 flight_search_parser.add_argument('departure_date', type=str, required=True,
                                  help='Departure date (DD-MM-YYYY)', location='args')
+flight_search_parser.add_argument('cursor', type=str,
+                                 help='Cursor returned by the previous page, replaces page_number', location='args')
+
+# Parser for streamed exact date searches, journeys are sent round by round
+flight_stream_parser = build_base_search_parser()
+flight_stream_parser.add_argument('departure_date', type=str, required=True,
+                                  help='Departure date (DD-MM-YYYY)', location='args')
+flight_stream_parser.add_argument('format', type=str, choices=('ndjson', 'sse'), default='ndjson',
+                                  help='Newline-delimited JSON or Server-Sent Events', location='args')
 
 # Parser for flexible date searches (month-based)
 flexible_date_search_parser = build_base_search_parser()
 flexible_date_search_parser.add_argument('departure_date', type=str, required=True,
                                          help='Departure date (MM-YYYY)', location='args')
 
+# Parser for round trip searches
+round_trip_search_parser = build_base_search_parser()
+round_trip_search_parser.add_argument('departure_date', type=str, required=True,
+                                      help='Outbound departure date (DD-MM-YYYY)', location='args')
+round_trip_search_parser.add_argument('return_date', type=str, required=True,
+                                      help='Return departure date (DD-MM-YYYY)', location='args')
+
+# Parser for one-to-all searches from a departure location (month-based)
+explore_search_parser = reqparse.RequestParser()
+explore_search_parser.add_argument('departure_id', type=int, required=True,
+                                   help='Departure id', location='args')
+explore_search_parser.add_argument('departure_type', type=str, choices=('airport', 'city'), required=True,
+                                   help='Type of departure location: "airport" or "city"', location='args')
+explore_search_parser.add_argument('departure_date', type=str, required=True,
+                                   help='Departure date (MM-YYYY)', location='args')
+explore_search_parser.add_argument('airline_id', type=str,
+                                   help='Filter by specific airline ID', location='args')
+explore_search_parser.add_argument('price_max', type=float,
+                                   help='Maximum price (economy class)', location='args')
+explore_search_parser.add_argument('departure_time_min', type=str,
+                                   help='Minimum departure time (HH:MM)', location='args')
+explore_search_parser.add_argument('departure_time_max', type=str,
+                                   help='Maximum departure time (HH:MM)', location='args')
+explore_search_parser.add_argument('max_transfers', type=int, default=3)
+
 segment_model = api.model('FlightSegment', {
     'id': fields.String(description='Flight segment ID'),
     'flight_number': fields.String(description='Flight number for this segment'),
@@ -110,6 +151,87 @@ journey_model = api.model('Journey', {
 search_output_model = api.model('SearchOutput', {
     'journeys': fields.List(fields.Nested(journey_model), description='List of flight journeys'),
     'total_pages': fields.Integer(description='Total number of pages for pagination'),
+    'next_cursor': fields.String(description='Cursor of the next page, null on the last page', allow_null=True),
+})
+
+round_trip_model = api.model('RoundTrip', {
+    'outbound': fields.Nested(journey_model, description='Outbound journey'),
+    'return': fields.Nested(journey_model, description='Return journey'),
+    'price_economy': fields.Float(description='Total economy class price of both journeys'),
+    'duration_minutes': fields.Integer(description='Total duration of both journeys in minutes'),
+    'stops': fields.Integer(description='Total number of stops of both journeys'),
+})
+
+round_trip_output_model = api.model('RoundTripOutput', {
+    'round_trips': fields.List(fields.Nested(round_trip_model), description='Best outbound and return pairs'),
+})
+
+# Longest multi-city trip accepted in a single request
+MULTI_CITY_MAX_LEGS = 6
+
+multi_city_leg_input_model = api.model('MultiCityLegInput', {
+    'departure_id': fields.Integer(required=True, description='Departure id'),
+    'departure_type': fields.String(required=True, enum=['airport', 'city'],
+                                    description='Type of departure location: "airport" or "city"'),
+    'arrival_id': fields.Integer(required=True, description='Arrival id'),
+    'arrival_type': fields.String(required=True, enum=['airport', 'city'],
+                                  description='Type of arrival location: "airport" or "city"'),
+    'departure_date': fields.String(required=True, description='Departure date (DD-MM-YYYY)'),
+})
+
+multi_city_input_model = api.model('MultiCityInput', {
+    'legs': fields.List(fields.Nested(multi_city_leg_input_model), required=True, min_items=2,
+                        max_items=MULTI_CITY_MAX_LEGS, description='Ordered legs of the trip'),
+    'airline_id': fields.String(description='Filter by specific airline ID'),
+    'price_max': fields.Float(description='Maximum price of the whole itinerary (economy class)'),
+    'departure_time_min': fields.String(description='Minimum departure time of every leg (HH:MM)'),
+    'departure_time_max': fields.String(description='Maximum departure time of every leg (HH:MM)'),
+    'order_by': fields.String(enum=['price', 'duration', 'stops'], description='Order by field'),
+    'order_by_desc': fields.Boolean(default=False, description='Order by field descending'),
+    'limit': fields.Integer(description='Number of journeys per leg and of itineraries returned'),
+    'max_transfers': fields.Integer(default=3, description='Maximum transfers of every leg'),
+})
+
+multi_city_leg_model = api.model('MultiCityLeg', {
+    'journeys': fields.List(fields.Nested(journey_model), description='Best journeys of the leg'),
+})
+
+itinerary_model = api.model('Itinerary', {
+    'legs': fields.List(fields.Nested(journey_model), description='One journey per leg, in order'),
+    'price_economy': fields.Float(description='Total economy class price of the itinerary'),
+    'duration_minutes': fields.Integer(description='Total flight duration of the itinerary in minutes'),
+    'stops': fields.Integer(description='Total number of stops of the itinerary'),
+})
+
+multi_city_output_model = api.model('MultiCityOutput', {
+    'legs': fields.List(fields.Nested(multi_city_leg_model), description='Best journeys of every leg'),
+    'itineraries': fields.List(fields.Nested(itinerary_model), description='Best combined itineraries'),
+})
+
+explore_airport_model = api.model('ExploreAirport', {
+    'id': fields.Integer(description='Destination airport ID'),
+    'iata_code': fields.String(description='Destination airport code'),
+    'name': fields.String(description='Destination airport name'),
+    'price_economy': fields.Float(description='Lowest economy class price to this airport'),
+    'duration_minutes': fields.Integer(description='Shortest journey duration to this airport'),
+    'departure_date': fields.String(description='Departure date of the lowest price (YYYY-MM-DD)'),
+})
+
+explore_city_model = api.model('ExploreCity', {
+    'id': fields.Integer(description='Destination city ID'),
+    'name': fields.String(description='Destination city name'),
+    'price_economy': fields.Float(description='Lowest economy class price to this city'),
+    'duration_minutes': fields.Integer(description='Shortest journey duration to this city'),
+    'departure_date': fields.String(description='Departure date of the lowest price (YYYY-MM-DD)'),
+    'airports': fields.List(fields.Nested(explore_airport_model), description='Reachable airports of the city'),
+})
+
+explore_nation_model = api.model('ExploreNation', {
+    'id': fields.Integer(description='Destination nation ID', allow_null=True),
+    'name': fields.String(description='Destination nation name', allow_null=True),
+    'alpha2': fields.String(description='Destination nation alpha2 code', allow_null=True),
+    'price_economy': fields.Float(description='Lowest economy class price to this nation'),
+    'cities': fields.List(fields.Nested(explore_city_model), description='Reachable cities of the nation'),
 })
 
 @api.route('/flights')
@@ -139,47 +261,265 @@ class FlightSearch(Resource):
         if departure_date < datetime.datetime.now().date():
             return {'error': 'Departure date cannot be in the past', 'code': 400}, 400
 
-        # Initialize results container
-        unfiltered_departure_journeys = []
+        error = validate_time_filters(args)
+        if error:
+            return error
 
         # Get valid departure and arrival airports based on search criteria
         departure_airports, arrival_airports, error = get_airports(args)
         if error:
             return error
 
-        # Generate journeys for each valid airport pair
-        for departure_airport in departure_airports:
-            for arrival_airport in arrival_airports:
-                # Use RAPTOR algorithm to find optimal routes
-                departure_results = generate_journey(
-                    departure_airport,
-                    arrival_airport,
-                    departure_date,
-                    max_transfers=int(args['max_transfers']),
-                    args=args
-                )
-                unfiltered_departure_journeys.extend(departure_results)
-        
-        # Apply filters and sorting based on user preferences
-        departure_journeys = filter_journeys(unfiltered_departure_journeys, args)
-        departure_journeys = sort_journeys(departure_journeys, args)
+        # Flights the user already booked, loaded once and skipped by the search
+        booked_flight_ids = get_booked_flight_ids(args['user_id'])
+
+        def search():
+            # Generate journeys for all airport pairs in a single multi-source/multi-target RAPTOR pass
+            unfiltered_departure_journeys = generate_journey(
+                departure_airports,
+                arrival_airports,
+                departure_date,
+                max_transfers=int(args['max_transfers']),
+                args=args,
+                excluded_flight_ids=booked_flight_ids
+            )
+
+            # Apply filters based on user preferences, ordering is applied per page
+            journeys = filter_journeys(unfiltered_departure_journeys, args, booked_flight_ids)
+            return marshal(journeys, journey_model)
+
+        # Identical searches (any page) are served from the cache while the timetable days they read are
+        # unchanged, and concurrent identical searches wait for a single computation
+        date_min = datetime.datetime.combine(departure_date, datetime.time.min, datetime.timezone.utc)
+        cache_key = search_cache_key(args, date_min, date_min + datetime.timedelta(days=2), booked_flight_ids)
+        departure_journeys = cached_search(cache_key, search)
 
         # Store original length for pagination calculation
         original_len = len(departure_journeys)
-        
-        # Apply pagination if requested
+
+        # Select only the requested page with a bounded heap, resuming after the cursor if given
         args['limit'] = args['limit'] if args['limit'] else 10
-        if args['page_number'] and args['limit']:
-            start = (args['page_number'] - 1) * args['limit']
-            end = start + args['limit']
-            if start >= len(departure_journeys) or start < 0:
-                departure_journeys = []
-            else:
-                end = min(end, len(departure_journeys))
-                departure_journeys = departure_journeys[start:end]
-
-        # Return paginated results with total page count
-        return marshal({'journeys':departure_journeys,'total_pages':math.ceil(original_len/args['limit'])},search_output_model), 200
+        after = None
+        skip = 0
+        limit = original_len
+        if args.get('cursor'):
+            after = decode_cursor(args['cursor'], args)
+            if after is None:
+                return {'error': 'Invalid cursor', 'code': 400}, 400
+            limit = args['limit']
+        elif args['page_number'] and args['limit']:
+            skip = (args['page_number'] - 1) * args['limit']
+            limit = args['limit']
+            if skip < 0:
+                skip, limit = 0, 0
+
+        # One extra journey tells whether there is a next page
+        selected = select_journeys(departure_journeys, args, skip + limit + 1, after)[skip:]
+        next_cursor = encode_cursor(args, selected[limit - 1][0]) if limit and len(selected) > limit else None
+        departure_journeys = [journey for _, journey in selected[:limit]]
+
+        # Return paginated results with total page count, journeys are already marshalled
+        return {
+            'journeys': departure_journeys,
+            'total_pages': math.ceil(original_len/args['limit']),
+            'next_cursor': next_cursor,
+        }, 200
+
+@api.route('/flights/stream')
+class FlightSearchStream(Resource):
+    @api.doc(security=None)
+    @api.expect(flight_stream_parser)
+    @api.response(200, 'OK')
+    @api.response(400, 'Bad Request')
+    def get(self):
+        """
+        Search for flights like /flights, streaming the journeys of each RAPTOR round as soon as it ends:
+        direct flights first, then 1 stop, 2 stops... Every message is {"stops", "journeys"} and the last
+        one {"done", "total"}, as newline-delimited JSON or Server-Sent Events
+        """
+        args = flight_stream_parser.parse_args()
+        output_format = args.pop('format')
+        args['user_id'] = None
+        try:
+            verify_jwt_in_request(optional=True)
+            args['user_id'] = get_jwt_identity()
+        except Exception:
+            current_user = None
+
+        try:
+            departure_date = datetime.datetime.strptime(args['departure_date'], '%d-%m-%Y').date()
+        except ValueError:
+            return {'error': 'Invalid departure date format. Use DD-MM-YYYY', 'code': 400}, 400
+
+        if departure_date < datetime.datetime.now().date():
+            return {'error': 'Departure date cannot be in the past', 'code': 400}, 400
+
+        error = validate_time_filters(args)
+        if error:
+            return error
+
+        departure_airports, arrival_airports, error = get_airports(args)
+        if error:
+            return error
+
+        booked_flight_ids = get_booked_flight_ids(args['user_id'])
+
+        # Same cache entry as /flights: a cached search is replayed, a computed one is stored for both
+        date_min = datetime.datetime.combine(departure_date, datetime.time.min, datetime.timezone.utc)
+        cache_key = search_cache_key(args, date_min, date_min + datetime.timedelta(days=2), booked_flight_ids)
+
+        def rounds():
+            cached = get_cached(cache_key)
+            if cached is not None:
+                by_stops = defaultdict(list)
+                for journey in cached:
+                    by_stops[journey['stops']].append(journey)
+                for stops in range(int(args['max_transfers']) + 1):
+                    yield stops, [journey for _, journey in select_journeys(by_stops[stops], args, len(cached))]
+                return
+
+            journeys = []
+            for stops, found in stream_journeys(departure_airports, arrival_airports, departure_date, args,
+                                                booked_flight_ids):
+                found = marshal(found, journey_model)
+                journeys.extend(found)
+                yield stops, found
+            set_cached(cache_key, journeys)
+
+        def messages():
+            total = 0
+            for stops, journeys in rounds():
+                total += len(journeys)
+                yield 'journeys', {'stops': stops, 'journeys': journeys}
+            yield 'done', {'done': True, 'total': total}
+
+        if output_format == 'sse':
+            body = ('event: {}\ndata: {}\n\n'.format(event, json.dumps(data)) for event, data in messages())
+            mimetype = 'text/event-stream'
+        else:
+            body = (json.dumps(data) + '\n' for _, data in messages())
+            mimetype = 'application/x-ndjson'
+        # Proxies must not buffer the stream, or the first round would wait for the last one
+        return Response(stream_with_context(body), mimetype=mimetype,
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@api.route('/round-trip')
+class RoundTripSearch(Resource):
+    @api.doc(security=None)
+    @api.expect(round_trip_search_parser)
+    @api.response(200, 'OK', round_trip_output_model)
+    @api.response(400, 'Bad Request')
+    def get(self):
+        """Search outbound and return journeys together and return the best pairs"""
+        args = round_trip_search_parser.parse_args()
+        args['user_id'] = None
+        try:
+            verify_jwt_in_request(optional=True)
+            args['user_id'] = get_jwt_identity()
+        except Exception:
+            current_user = None
+
+        try:
+            departure_date = datetime.datetime.strptime(args['departure_date'], '%d-%m-%Y').date()
+            return_date = datetime.datetime.strptime(args['return_date'], '%d-%m-%Y').date()
+        except ValueError:
+            return {'error': 'Invalid date format. Use DD-MM-YYYY', 'code': 400}, 400
+
+        if departure_date < datetime.datetime.now().date():
+            return {'error': 'Departure date cannot be in the past', 'code': 400}, 400
+        if return_date < departure_date:
+            return {'error': 'Return date cannot be before the departure date', 'code': 400}, 400
+
+        error = validate_time_filters(args)
+        if error:
+            return error
+
+        departure_airports, arrival_airports, error = get_airports(args)
+        if error:
+            return error
+
+        booked_flight_ids = get_booked_flight_ids(args['user_id'])
+        limit = args['limit'] if args['limit'] else 10
+
+        # Both legs read the days from the departure to two days after the return, the number and
+        # order of the pairs are part of the result
+        date_min = datetime.datetime.combine(departure_date, datetime.time.min, datetime.timezone.utc)
+        date_max = datetime.datetime.combine(return_date + datetime.timedelta(days=2), datetime.time.min,
+                                             datetime.timezone.utc)
+        cache_key = search_cache_key({**args, 'pairs': limit, 'ranking': [args['order_by'], args['order_by_desc']]},
+                                     date_min, date_max, booked_flight_ids, kind='round-trip')
+        round_trips = cached_search(cache_key, lambda: marshal(generate_round_trips(
+            departure_airports,
+            arrival_airports,
+            departure_date,
+            return_date,
+            args,
+            limit,
+            booked_flight_ids
+        ), round_trip_model))
+
+        return {'round_trips': round_trips}, 200
+
+@api.route('/multi-city')
+class MultiCitySearch(Resource):
+    @api.doc(security=None)
+    @api.expect(multi_city_input_model)
+    @api.response(200, 'OK', multi_city_output_model)
+    @api.response(400, 'Bad Request')
+    def post(self):
+        """Search every leg of a multi-city trip and return the best journeys and itineraries"""
+        data = request.json
+        args = {name: data.get(name) for name in ('airline_id', 'price_max', 'departure_time_min',
+                                                  'departure_time_max', 'order_by', 'limit')}
+        args['order_by_desc'] = bool(data.get('order_by_desc', False))
+        args['max_transfers'] = data.get('max_transfers', 3)
+        args['user_id'] = None
+        try:
+            verify_jwt_in_request(optional=True)
+            args['user_id'] = get_jwt_identity()
+        except Exception:
+            current_user = None
+
+        error = validate_time_filters(args)
+        if error:
+            return error
+
+        legs = []
+        previous_date = datetime.datetime.now().date()
+        for leg in data['legs']:
+            try:
+                departure_date = datetime.datetime.strptime(leg['departure_date'], '%d-%m-%Y').date()
+            except ValueError:
+                return {'error': 'Invalid departure date format. Use DD-MM-YYYY', 'code': 400}, 400
+            if departure_date < previous_date:
+                return {'error': 'Leg dates must not be in the past and must be in order', 'code': 400}, 400
+            previous_date = departure_date
+
+            departure_airports, arrival_airports, error = get_airports(leg)
+            if error:
+                return error
+            legs.append((departure_airports, arrival_airports, departure_date))
+
+        booked_flight_ids = get_booked_flight_ids(args['user_id'])
+        limit = args['limit'] if args['limit'] else 10
+
+        # Every leg reads the days from its date to two days later
+        date_min = datetime.datetime.combine(legs[0][2], datetime.time.min, datetime.timezone.utc)
+        date_max = datetime.datetime.combine(legs[-1][2] + datetime.timedelta(days=2), datetime.time.min,
+                                             datetime.timezone.utc)
+        cache_key = search_cache_key({**args, 'legs': data['legs'], 'pairs': limit,
+                                      'ranking': [args['order_by'], args['order_by_desc']]},
+                                     date_min, date_max, booked_flight_ids, kind='multi-city')
+
+        def search():
+            leg_journeys, itineraries = generate_multi_city(legs, args, limit, booked_flight_ids)
+            return marshal({
+                'legs': [{'journeys': journeys} for journeys in leg_journeys],
+                'itineraries': itineraries,
+            }, multi_city_output_model)
+
+        # Legs cut by the search budget have no journeys, such results are kept only for the burst
+        return cached_search(cache_key, search, ttl=SEARCH_LOCK_TTL), 200
 
 @api.route('/flexible-dates')
 class FlexibleFlightSearch(Resource):
@@ -187,15 +527,7 @@ class FlexibleFlightSearch(Resource):
     def _calculate_dates(self,date):
         """Calculate the start and end dates for a given month"""
 
-        start_date = datetime.date(date.year, date.month, 1)
-        if date.month == 12:
-            end_date = datetime.date(date.year + 1, 1, 1) - datetime.timedelta(days=1)
-        else:
-            end_date = datetime.date(date.year, date.month + 1, 1) - datetime.timedelta(days=1)
-        
-        date_range = [start_date + datetime.timedelta(days=i) for i in range((end_date - start_date).days + 1)]
-        
-        return date_range
+        return month_dates(date)
     
     
     #generare ricerca per nazione -> città 
@@ -218,6 +550,10 @@ class FlexibleFlightSearch(Resource):
         except ValueError:
             return {'error': 'Invalid departure date format. Use MM', 'code': 400}, 400
 
+        error = validate_time_filters(args)
+        if error:
+            return error
+
         # Get airports
         departure_airports, arrival_airports ,error = get_airports(args)
         if error:
@@ -233,12 +569,83 @@ class FlexibleFlightSearch(Resource):
             departure_journeys = [None] * today_d.day
 
         # for each day in the range of dates, generate journeys
-        possible_journeys = lowest_price_multiple_dates(
-            departure_date_range,
-            departure_airports,
-            arrival_airports,
-            args
-        )
+        # Calendars without per-user filters are served from the materialized fare calendar
+        booked_flight_ids = get_booked_flight_ids(args['user_id'])
+        if fare_calendar.is_materialized(args, booked_flight_ids):
+            fare_calendar.record_request(args, departure_date.strftime('%Y-%m'))
+            compute = lambda: materialized_lowest_prices(
+                departure_date_range,
+                departure_airports,
+                arrival_airports,
+                args
+            )
+        else:
+            compute = lambda: lowest_price_multiple_dates(
+                departure_date_range,
+                departure_airports,
+                arrival_airports,
+                args,
+                booked_flight_ids
+            )
+
+        # Concurrent identical calendars wait for a single computation, kept only for the burst since
+        # days cut by the search budget are returned as None
+        date_min = datetime.datetime.combine(departure_date_range[0], datetime.time.min, datetime.timezone.utc) \
+            if departure_date_range else datetime.datetime.now(datetime.timezone.utc)
+        cache_key = search_cache_key({**args, 'dates': departure_date_range}, date_min,
+                                     date_min + datetime.timedelta(days=len(departure_date_range) + 2),
+                                     booked_flight_ids, kind='calendar')
+        possible_journeys = cached_search(cache_key, compute, ttl=SEARCH_LOCK_TTL)
         departure_journeys.extend(possible_journeys)
 
         return departure_journeys, 200
+
+
+@api.route('/explore')
+class ExploreSearch(Resource):
+    @api.doc(security=None)
+    @api.expect(explore_search_parser)
+    @api.response(200, 'OK', [explore_nation_model])
+    @api.response(400, 'Bad Request')
+    def get(self):
+        """Get the lowest price to every destination reachable from a departure location in a month"""
+        args = explore_search_parser.parse_args()
+        args['user_id'] = None
+        try:
+            verify_jwt_in_request(optional=True)
+            args['user_id'] = get_jwt_identity()
+        except Exception:
+            current_user = None
+
+        try:
+            departure_date = datetime.datetime.strptime(args['departure_date'], '%m-%Y').date()
+        except ValueError:
+            return {'error': 'Invalid departure date format. Use MM-YYYY', 'code': 400}, 400
+
+        error = validate_time_filters(args)
+        if error:
+            return error
+
+        departure_airports, error = get_departure_airports(args)
+        if error:
+            return error
+
+        # Past days of the current month are skipped
+        today_d = datetime.date.today()
+        departure_date_range = [date for date in month_dates(departure_date) if date >= today_d]
+        if not departure_date_range:
+            return [], 200
+
+        # A single one-to-all scan of the month, cached while the timetable days it reads are unchanged
+        booked_flight_ids = get_booked_flight_ids(args['user_id'])
+        date_min = datetime.datetime.combine(departure_date_range[0], datetime.time.min, datetime.timezone.utc)
+        cache_key = search_cache_key(args, date_min, date_min + datetime.timedelta(days=len(departure_date_range) + 2),
+                                     booked_flight_ids, kind='explore')
+        nations = cached_search(cache_key, lambda: marshal(explore_destinations(
+            departure_airports,
+            departure_date_range,
+            args,
+            booked_flight_ids
+        ), explore_nation_model))
+
+        return nations, 200
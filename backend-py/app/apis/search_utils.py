@@ -1,240 +1,620 @@
 import datetime
+import heapq
+import math
+import time
 import uuid
-from typing import Dict, List, Optional, Set, Tuple
+from bisect import bisect_right
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 from collections import defaultdict
 
-from app.models import Aircraft, Nation, City
+from flask import current_app
+from sqlalchemy import Row
+
+from app.core import fare_calendar
+from app.core.search_executor import run_searches, search_deadline
+from app.core.timetable import TimetableAirport, TimetableBucket, TimetableIndex, TimetableWindow, timetable_index, \
+    to_minutes
+from app.extensions import db
+from app.models import Aircraft
 from app.models.airlines import Airline, AirlineAircraft
 from app.models.airport import Airport
 from app.models.booking import BookingDepartureFlight, BookingReturnFlight, Booking
 from app.models.flight import Flight, Route
+from app.models.location import City, Nation
+
+
+# A flight of the timetable is referenced by its bucket and its position in the bucket columns
+FlightRef = Tuple[TimetableBucket, int]
+
+
+def minute_of_day(value: Optional[str]) -> Optional[int]:
+    """Parse an HH:MM filter into minutes since midnight"""
+    if not value:
+        return None
+    parsed = datetime.datetime.strptime(value, '%H:%M')
+    return parsed.hour * 60 + parsed.minute
+
+
+class SearchFilter:
+    """
+    Search constraints parsed once per request. Checking a flight is then a few integer
+    and float comparisons on the timetable columns, and the outcome for the departures of
+    an airport is kept as a bytearray mask reused by every scan of the same request.
+    """
+
+    def __init__(self, args: dict, window: Optional[TimetableWindow] = None,
+                 excluded_flight_ids: Optional[Set[bytes]] = None):
+        self.airline_id = args.get('airline_id')
+        self.airline_position = window.airline_position(self.airline_id) if window and self.airline_id else -1
+        self.price_max = args.get('price_max') or None
+        self.minute_min = minute_of_day(args.get('departure_time_min'))
+        self.minute_max = minute_of_day(args.get('departure_time_max'))
+        self.excluded_flight_ids = excluded_flight_ids or None
+        self.active = bool(self.airline_id or self.price_max or self.minute_min is not None
+                           or self.minute_max is not None or self.excluded_flight_ids)
+        self._masks: Dict[Tuple[datetime.date, int], bytearray] = {}
+
+    def passes(self, bucket: TimetableBucket, i: int) -> bool:
+        # Airline filter (the shared index holds every airline)
+        if self.airline_id and bucket.airline[i] != self.airline_position:
+            return False
+
+        # Price filter
+        if self.price_max and bucket.price_economy[i] > self.price_max:
+            return False
+
+        # Time range filters
+        minute = bucket.departure[i] % 1440
+        if self.minute_min is not None and minute < self.minute_min:
+            return False
+        if self.minute_max is not None and minute > self.minute_max:
+            return False
 
+        # Flights the user already booked
+        if self.excluded_flight_ids and bytes(bucket.flight_ids[16 * i:16 * (i + 1)]) in self.excluded_flight_ids:
+            return False
+
+        return True
 
-class PreloadedData:
-    """Container for preloaded data to minimize database queries"""
-    def __init__(self):
-        self.flights: Dict[int, List[Flight]] = defaultdict(list)  # airport_id -> flights
-        self.airports: Dict[int, Airport] = {}
-        self.routes: Dict[int, Route] = {}
-        self.airline_aircraft: Dict[str, AirlineAircraft] = {}
+    def mask(self, bucket: TimetableBucket, airport_id: int) -> Optional[bytearray]:
+        """Allowed flags of the departures of an airport in a bucket, None when nothing is filtered"""
+        if not self.active:
+            return None
+        key = (bucket.day, airport_id)
+        mask = self._masks.get(key)
+        if mask is None:
+            start, end = bucket.offsets[airport_id]
+            mask = self._masks[key] = bytearray(self.passes(bucket, i) for i in range(start, end))
+        return mask
+
+
+class DetourLimit:
+    """
+    Bound on the great-circle distance flown by a journey: `factor` times the direct distance
+    between its origin and the closest destination. Distances to the destinations are computed
+    once per airport, and a partial journey is pruned when the distance flown plus the remaining
+    straight-line distance already exceeds the bound.
+    """
+
+    def __init__(self, window: TimetableWindow, origin_ids: Iterable[int], destination_ids: Iterable[int],
+                 factor: float):
+        self.window = window
+        self.destination_ids = list(destination_ids)
+        self._remaining: Dict[int, Optional[float]] = {}
+        self.limits: Dict[int, Optional[float]] = {}
+        for origin_id in origin_ids:
+            direct = self.remaining(origin_id)
+            # Unknown coordinates or an origin that is also a destination disable the bound
+            self.limits[origin_id] = factor * direct if direct else None
+
+    def remaining(self, airport_id: int) -> Optional[float]:
+        """Distance from an airport to the closest destination"""
+        if airport_id not in self._remaining:
+            distances = [self.window.distance(airport_id, destination_id) for destination_id in self.destination_ids]
+            self._remaining[airport_id] = min((d for d in distances if d is not None), default=None)
+        return self._remaining[airport_id]
+
+    def allows(self, origin_id: int, distance: float, airport_id: int) -> bool:
+        limit = self.limits.get(origin_id)
+        if limit is None:
+            return True
+        remaining = self.remaining(airport_id)
+        return remaining is None or distance + remaining <= limit
 
 
-class EarliestArrival:
-    """Container for earliest arrival information at an airport"""
-    def __init__(self, time: datetime.datetime, path: List[Flight], cost: float):
+class Label:
+    """Pareto label of a partial journey: arrival time, economy cost and number of flights taken"""
+    __slots__ = ('time', 'cost', 'trips', 'flight', 'parent', 'alive', 'origin', 'distance')
+
+    def __init__(self, time: int, cost: float, trips: int = 0,
+                 flight: Optional[FlightRef] = None, parent: Optional['Label'] = None,
+                 origin: Optional[int] = None, distance: float = 0.0):
         self.time = time
-        self.path = path
         self.cost = cost
+        self.trips = trips
+        self.flight = flight
+        self.parent = parent
+        self.alive = True
+        # Origin airport and great-circle distance flown, used by the detour bound
+        self.origin = origin
+        self.distance = distance
+
+    def dominates(self, other: 'Label') -> bool:
+        return self.time <= other.time and self.cost <= other.cost and self.trips <= other.trips
+
+    def path(self) -> List[FlightRef]:
+        path = []
+        label = self
+        while label.flight is not None:
+            path.append(label.flight)
+            label = label.parent
+        path.reverse()
+        return path
+
+
+def insert_label(bag: List[Label], label: Label, kill_dominated: bool = True) -> bool:
+    """Insert a label in a Pareto bag, dropping the labels it dominates. False if the label is dominated"""
+    for other in bag:
+        if other.dominates(label):
+            return False
+
+    survivors = []
+    for other in bag:
+        if label.dominates(other):
+            if kill_dominated:
+                other.alive = False
+        else:
+            survivors.append(other)
+    survivors.append(label)
+    bag[:] = survivors
+    return True
+
+
+# Profile and explore sweeps check their deadline once every this many flights
+SWEEP_DEADLINE_STRIDE = 1024
 
 
 class SearchFlight:
-    def __init__(self):
-        self.preloaded_data: Optional[PreloadedData] = None
-        self.preloaded_date_range: Optional[Tuple[datetime.datetime, datetime.datetime]] = None
-    
-    def _is_data_preloaded_for_range(self, date_min: datetime.datetime, date_max: datetime.datetime) -> bool:
-        """Check if data is already preloaded for the given date range"""
-        if not self.preloaded_data or not self.preloaded_date_range:
-            return False
-        
-        preloaded_min, preloaded_max = self.preloaded_date_range
-        return preloaded_min <= date_min and preloaded_max >= date_max
-    
-    def raptor_search(self, origin_id: int, destination_id: int, departure_date: datetime.date,
-                      max_transfers: int, min_transfer_minutes: int, args: dict) -> Dict[int, List[dict]]:
+    def __init__(self, index: Optional[TimetableIndex] = None, deadline: Optional[float] = None):
+        self.index = index or timetable_index
+        self.window: Optional[TimetableWindow] = None
+        # time.monotonic() after which no further round is started, None to search until done
+        self.deadline = deadline
+        # Work done by the last McRAPTOR run: stops scanned and labels added to their bags
+        self.stops_marked = 0
+        self.labels_inserted = 0
+
+    def _out_of_time(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def raptor_search(self, origin_ids: Iterable[int], destination_ids: Iterable[int], departure_date: datetime.date,
+                      max_transfers: int, min_transfer_minutes: int, args: dict,
+                      excluded_flight_ids: Optional[Set[bytes]] = None) -> Dict[int, List[dict]]:
         """
-        Optimized RAPTOR search with proper earliest arrival tracking and data preloading.
+        Multi-criteria (McRAPTOR-style) search over the columnar timetable.
+        Round 0 is seeded with every origin airport and every destination airport is a target,
+        so a single pass answers a whole city-to-city search. Every journey on the Pareto front of
+        arrival time, economy price and transfers is returned, so cheaper but later itineraries
+        are kept for price ordering.
+        Times are compared as epoch minutes, flight details are only fetched for the returned journeys.
+        Flights in excluded_flight_ids (raw UUID bytes) are skipped during the scan.
         Returns a dict mapping k transfers -> list of journey results.
         """
+        found = self._leg_paths(origin_ids, destination_ids, departure_date, max_transfers, min_transfer_minutes,
+                                args, excluded_flight_ids)
+
+        # Storage for all itineraries by exact #transfers
+        all_by_transfers: Dict[int, List[dict]] = {k: [] for k in range(max_transfers + 1)}
+        details = self._load_segment_details(path for _, path in found)
+        for transfers, path in found:
+            result = self._format_journey_result(path, details)
+            if result:
+                all_by_transfers[transfers].append(result)
+
+        return all_by_transfers
+
+    def stream_search(self, origin_ids: Iterable[int], destination_ids: Iterable[int], departure_date: datetime.date,
+                      max_transfers: int, min_transfer_minutes: int, args: dict,
+                      excluded_flight_ids: Optional[Set[bytes]] = None) -> Iterator[Tuple[int, List[dict]]]:
+        """
+        Same search as raptor_search, yielding (#transfers, journeys) as soon as each round ends,
+        so direct flights are available before the deeper rounds run.
+        """
+        for transfers, paths in self._leg_rounds(origin_ids, destination_ids, departure_date, max_transfers,
+                                                 min_transfer_minutes, args, excluded_flight_ids):
+            details = self._load_segment_details(paths)
+            journeys = (self._format_journey_result(path, details) for path in paths)
+            yield transfers, [journey for journey in journeys if journey]
+
+    def round_trip_search(self, origin_ids: Iterable[int], destination_ids: Iterable[int],
+                          outbound_date: datetime.date, return_date: datetime.date, max_transfers: int,
+                          min_transfer_minutes: int, args: dict,
+                          excluded_flight_ids: Optional[Set[bytes]] = None) -> Tuple[List[dict], List[dict]]:
+        """
+        Outbound and return journeys of a round trip. Both legs are searched on the shared
+        timetable and their flight details are fetched with a single query.
+        """
+        origin_ids = list(origin_ids)
+        destination_ids = list(destination_ids)
+        outbound = self._leg_paths(origin_ids, destination_ids, outbound_date, max_transfers, min_transfer_minutes,
+                                   args, excluded_flight_ids)
+        inbound = self._leg_paths(destination_ids, origin_ids, return_date, max_transfers, min_transfer_minutes,
+                                  args, excluded_flight_ids)
+
+        details = self._load_segment_details(path for _, path in outbound + inbound)
+        legs = []
+        for found in (outbound, inbound):
+            journeys = (self._format_journey_result(path, details) for _, path in found)
+            legs.append([journey for journey in journeys if journey])
+        return legs[0], legs[1]
+
+    def _leg_paths(self, origin_ids: Iterable[int], destination_ids: Iterable[int], departure_date: datetime.date,
+                   max_transfers: int, min_transfer_minutes: int, args: dict,
+                   excluded_flight_ids: Optional[Set[bytes]] = None) -> List[Tuple[int, List[FlightRef]]]:
+        """Pareto-optimal journeys of one leg leaving on departure_date, as (#transfers, path)"""
+        return [(transfers, path)
+                for transfers, paths in self._leg_rounds(origin_ids, destination_ids, departure_date, max_transfers,
+                                                         min_transfer_minutes, args, excluded_flight_ids)
+                for path in paths]
+
+    def _leg_rounds(self, origin_ids: Iterable[int], destination_ids: Iterable[int], departure_date: datetime.date,
+                    max_transfers: int, min_transfer_minutes: int, args: dict,
+                    excluded_flight_ids: Optional[Set[bytes]] = None) -> Iterator[Tuple[int, List[List[FlightRef]]]]:
+        """Paths reaching the destination in each round of a leg leaving on departure_date"""
         # Prepare extended date window (support multi-day journeys)
         start_of_day = datetime.datetime.combine(departure_date, datetime.time.min, datetime.timezone.utc)
         date_min = start_of_day
         date_max = datetime.datetime.combine(departure_date + datetime.timedelta(days=2), datetime.time.min, datetime.timezone.utc)
 
-        # Preload all relevant data to minimize DB queries (only if not already preloaded)
-        if not self.preloaded_data:
-            self._preload_data(date_min, date_max, args)
-
-        # Storage for all itineraries by exact #transfers
-        all_by_transfers: Dict[int, List[dict]] = {k: [] for k in range(max_transfers + 1)}
+        # Buckets are shared by every search of this worker, only missing or stale days hit the DB
+        self.window = self.index.window(date_min, date_max)
 
-        # RAPTOR's earliest arrival times per round
-        earliest_arrival: List[Dict[int, EarliestArrival]] = [
-            {} for _ in range(max_transfers + 2)
-        ]
+        for transfers, labels in self._pareto_rounds(origin_ids, destination_ids, to_minutes(date_min),
+                                                     to_minutes(date_max), max_transfers, min_transfer_minutes, args,
+                                                     excluded_flight_ids,
+                                                     current_app.config.get('SEARCH_DETOUR_FACTOR', 0)):
+            yield transfers, [label.path() for label in labels]
 
-        # Initialize round 0 - direct flights from origin
-        earliest_arrival[0][origin_id] = EarliestArrival(start_of_day, [], 0.0)
+    def _pareto_rounds(self, origin_ids: Iterable[int], destination_ids: Iterable[int], start_minute: int,
+                       end_minute: int, max_transfers: int, min_transfer_minutes: int, args: dict,
+                       excluded_flight_ids: Optional[Set[bytes]] = None,
+                       detour_factor: float = 0) -> Iterator[Tuple[int, List[Label]]]:
+        """
+        Run the McRAPTOR rounds on the current window, yielding after each round the
+        (#transfers, labels) of the Pareto-optimal journeys reaching a destination in that round.
 
-        processed_paths = set()
-        marked_stops = set()
+        Each stop keeps a bag of non-dominated (arrival time, cost) labels per round. A new label
+        is discarded when it is dominated by the bag of its stop or by a journey already found
+        (target pruning), which keeps the search space bounded. With a detour factor, journeys
+        flying more than that multiple of the direct distance are not explored.
+        """
+        destination_ids = set(destination_ids)
+        origin_ids = list(origin_ids)
+        search_filter = SearchFilter(args, self.window, excluded_flight_ids)
+        detour = DetourLimit(self.window, origin_ids, destination_ids, detour_factor) if detour_factor else None
+
+        # Bags of the current round per airport, and the labels created in the previous round
+        bags: Dict[int, List[Label]] = defaultdict(list)
+        new_labels: Dict[int, List[Label]] = defaultdict(list)
+        # Pareto front of the journeys found so far, over every destination airport
+        target_bag: List[Label] = []
+        self.stops_marked = self.labels_inserted = 0
+
+        # Initialize round 0 - every origin at the start of the day
+        for origin_id in origin_ids:
+            label = Label(start_minute, 0.0, origin=origin_id)
+            bags[origin_id].append(label)
+            new_labels[origin_id].append(label)
 
         # RAPTOR rounds
         for k in range(1, max_transfers + 2):
-            marked_stops.clear()
-            
-            # Mark stops improved in previous round
-            for airport_id, arrival_info in earliest_arrival[k - 1].items():
-                if arrival_info:
-                    marked_stops.add(airport_id)
-
+            # Only stops improved in the previous round are marked
+            marked_stops = new_labels
             if not marked_stops:
                 break  # No improvements possible
+            if k > 1 and self._out_of_time():
+                break  # Budget spent, the journeys of the rounds already yielded are kept
 
-            # Process each marked stop
-            for current_airport in marked_stops:
-                current_state = earliest_arrival[k - 1].get(current_airport)
-                if not current_state:
-                    continue
+            new_labels = defaultdict(list)
+            reached: List[Label] = []
+            self.stops_marked += len(marked_stops)
 
-                # Get all flights from this airport using preloaded data
-                flights = self.preloaded_data.flights.get(current_airport, [])
-                
-                # Filter flights to only those relevant for this specific date
-                relevant_flights = [
-                    flight for flight in flights 
-                    if flight.departure_time >= date_min and flight.departure_time < date_max
-                ]
-                
-                for flight in relevant_flights:
-                    route = self.preloaded_data.routes.get(flight.route_id)
-                    if not route:
+            # Process each marked stop
+            for current_airport, labels in marked_stops.items():
+                for current in labels:
+                    if not current.alive:
                         continue
 
                     # Calculate minimum departure time
-                    min_dep_time = current_state.time
-                    if current_state.path:
-                        min_dep_time = current_state.time + datetime.timedelta(minutes=min_transfer_minutes)
-
-                    # Check if flight is valid
-                    if flight.departure_time < min_dep_time or flight.departure_time >= date_max:
-                        continue
-
-                    # Apply filters
-                    if not self._passes_filters(flight, args):
-                        continue
-
-                    dest_airport = route.arrival_airport_id
-                    new_path = current_state.path + [flight]
-                    new_cost = current_state.cost + flight.price_economy_class
-
-                    # Check if this improves the arrival time at destination
-                    existing_arrival = earliest_arrival[k].get(dest_airport)
-                    should_update = (
-                        not existing_arrival or 
-                        flight.arrival_time < existing_arrival.time or
-                        (flight.arrival_time == existing_arrival.time and new_cost < existing_arrival.cost)
-                    )
-
-                    if should_update:
-                        earliest_arrival[k][dest_airport] = EarliestArrival(
-                            flight.arrival_time, new_path, new_cost
-                        )
-
-                        # If this reaches the destination, record the journey
-                        if dest_airport == destination_id and len(new_path) - 1 == k - 1:
-                            flight_ids = tuple(f.id for f in new_path)
-                            if flight_ids not in processed_paths:
-                                processed_paths.add(flight_ids)
-                                result = self._format_journey_result(new_path, origin_id, destination_id)
-                                if result:
-                                    all_by_transfers[k - 1].append(result)
-
-            # Copy non-improved arrivals from previous round
-            for airport_id, arrival_info in earliest_arrival[k - 1].items():
-                if airport_id not in earliest_arrival[k] and arrival_info:
-                    earliest_arrival[k][airport_id] = arrival_info
-
-        return all_by_transfers
-
-    def _preload_data(self, date_min: datetime.datetime, date_max: datetime.datetime, args: dict) -> None:
-        """Preload all relevant data to minimize database queries"""
-        # Check if data is already preloaded for this range
-        if self._is_data_preloaded_for_range(date_min, date_max):
-            return
-        
-        # Store the date range for future checks
-        self.preloaded_date_range = (date_min, date_max)
-        
-        # Build where clause for flights
-        where_conditions = [
-            Flight.departure_time >= date_min,
-            Flight.departure_time < date_max,
-            Flight.fully_booked == False,
-        ]
-
-        # Apply airline filter to reduce data load
-        query = Flight.query.join(Route, Flight.route_id == Route.id)
-        
-        if args.get('airline_id'):
-            try:
-                where_conditions.append(Route.airline_id == args['airline_id'])
-            except ValueError:
-                pass  # Invalid airline_id
-
-        flights = query.filter(*where_conditions).all()
-
-        # Initialize preloaded data
-        self.preloaded_data = PreloadedData()
-
-        # Group flights by departure airport
-        for flight in flights:
-            route = Route.query.get(flight.route_id)
-            if route:
-                self.preloaded_data.flights[route.departure_airport_id].append(flight)
-                self.preloaded_data.routes[flight.route_id] = route
-
-        # Preload airports (batch query)
-        airport_ids = set()
-        for flight in flights:
-            route = self.preloaded_data.routes.get(flight.route_id)
-            if route:
-                airport_ids.add(route.departure_airport_id)
-                airport_ids.add(route.arrival_airport_id)
-
-        airports = Airport.query.filter(Airport.id.in_(list(airport_ids))).all()
-        for airport in airports:
-            self.preloaded_data.airports[airport.id] = airport
-
-        # Preload aircraft data (batch query)
-        aircraft_ids = [f.aircraft_id for f in flights if f.aircraft_id]
-        aircraft_data = AirlineAircraft.query.filter(
-            AirlineAircraft.id.in_(aircraft_ids)
-        ).all()
-        for ac in aircraft_data:
-            self.preloaded_data.airline_aircraft[str(ac.id)] = ac
-
-    def _passes_filters(self, flight: Flight, args: dict) -> bool:
-        """Optimized filter checking using preloaded data"""
-        # Price filter
-        if args.get('price_max') and flight.price_economy_class > args['price_max']:
-            return False
+                    min_dep_time = current.time
+                    if current.flight is not None:
+                        min_dep_time = current.time + min_transfer_minutes
+
+                    # Only the feasible departures [min_dep_time, end_minute) are visited
+                    for bucket, start, end in self.window.departures(current_airport, min_dep_time, end_minute):
+                        allowed = search_filter.mask(bucket, current_airport)
+                        first = bucket.offsets[current_airport][0]
+                        for i in range(start, end):
+                            # Apply filters
+                            if allowed is not None and not allowed[i - first]:
+                                continue
+
+                            dest_airport = bucket.arrival_airport[i]
+
+                            # Detour pruning on the great-circle distance flown
+                            distance = 0.0
+                            if detour is not None:
+                                leg = self.window.distance(current_airport, dest_airport) or 0.0
+                                distance = current.distance + leg
+                                if not detour.allows(current.origin, distance, dest_airport):
+                                    continue
+
+                            label = Label(bucket.arrival[i], current.cost + bucket.price_economy[i], k,
+                                          (bucket, i), current, current.origin, distance)
+
+                            # Target pruning: no extension can beat a journey already found
+                            if any(found.dominates(label) for found in target_bag):
+                                continue
+
+                            if not insert_label(bags[dest_airport], label):
+                                continue
+                            new_labels[dest_airport].append(label)
+
+                            # If this reaches a destination, record the journey
+                            if dest_airport in destination_ids and insert_label(target_bag, label, kill_dominated=False):
+                                reached.append(label)
+
+            self.labels_inserted += sum(len(labels) for labels in new_labels.values())
+            # Labels of this round can only be evicted by labels of the same round
+            yield k - 1, [label for label in reached if label in target_bag]
+
+    def profile_search(self, origin_ids: Iterable[int], destination_ids: Iterable[int],
+                       departure_dates: List[datetime.date], max_transfers: int, min_transfer_minutes: int,
+                       args: dict, excluded_flight_ids: Optional[Set[bytes]] = None) -> Dict[datetime.date, Optional[float]]:
+        """
+        Range (profile) search returning the cheapest economy price for every departure date in one sweep.
+
+        Flights of the whole range are scanned once by decreasing departure time. Each airport keeps a
+        profile of the cheapest onward cost to a destination for departures at or after a given time,
+        so labels computed for later departures are reused by every earlier one instead of restarting
+        a search per day. A journey belongs to the day of its first departure and, as in raptor_search,
+        must leave within two days of that day's start; since that bound only depends on the first
+        day, every flight is labelled for the two windows it can be part of.
+        When the deadline passes mid-sweep, only the days whose flights were all visited are returned.
+        """
+        if not departure_dates:
+            return {}
+
+        origin_ids = set(origin_ids)
+        destination_ids = set(destination_ids)
+        first_day = min(departure_dates)
+        last_day = max(departure_dates)
+        date_min = datetime.datetime.combine(first_day, datetime.time.min, datetime.timezone.utc)
+        date_max = datetime.datetime.combine(last_day + datetime.timedelta(days=2), datetime.time.min, datetime.timezone.utc)
+
+        self.window = self.index.window(date_min, date_max)
+        search_filter = SearchFilter(args, self.window, excluded_flight_ids)
+
+        # All candidate flights of the range, latest departure first
+        candidates = []
+        for bucket in self.window.buckets:
+            day_start = to_minutes(datetime.datetime.combine(bucket.day, datetime.time.min, datetime.timezone.utc))
+            for i in range(len(bucket)):
+                if not search_filter.active or search_filter.passes(bucket, i):
+                    candidates.append((bucket.departure[i], day_start, bucket, i))
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+
+        infinity = float('inf')
+        rounds = max_transfers + 1
+        # (window end, airport) -> negated departure times (ascending) and, for each entry, the cheapest
+        # cost with 0..max_transfers further transfers among the departures at or after that time
+        profile_times: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+        profile_costs: Dict[Tuple[int, int], List[List[float]]] = defaultdict(list)
+        best_by_day: Dict[datetime.date, float] = {}
+        # Departure time of the first flight left unvisited when the deadline passed
+        cutoff = None
+
+        for position, (departure_time, day_start, bucket, i) in enumerate(candidates):
+            if position % SWEEP_DEADLINE_STRIDE == 0 and position and self._out_of_time():
+                cutoff = departure_time
+                break
+            arrival_airport = bucket.arrival_airport[i]
+            departure_airport = bucket.departure_airport[i]
+            price = bucket.price_economy[i]
+            connection_time = bucket.arrival[i] + min_transfer_minutes
+            reaches_target = arrival_airport in destination_ids
+
+            for days in (1, 2):
+                window_end = day_start + days * 1440
+
+                # Cheapest onward departures from the arrival airport, already labelled for this window
+                onward = None
+                times = profile_times.get((window_end, arrival_airport))
+                if times:
+                    j = bisect_right(times, -connection_time) - 1
+                    if j >= 0:
+                        onward = profile_costs[(window_end, arrival_airport)][j]
+
+                costs = []
+                for k in range(rounds):
+                    cost = price if reaches_target else infinity
+                    if k > 0 and onward is not None and onward[k - 1] < infinity:
+                        cost = min(cost, price + onward[k - 1])
+                    costs.append(cost)
+                if costs[-1] == infinity:
+                    continue
 
-        # Time range filters
-        if args.get('departure_time_min'):
-            time_str = flight.departure_time.strftime('%H:%M')
-            if time_str < args['departure_time_min']:
-                return False
+                # A journey starting with this flight belongs to the day it departs (window of two days)
+                if days == 2 and departure_airport in origin_ids and costs[-1] < best_by_day.get(bucket.day, infinity):
+                    best_by_day[bucket.day] = costs[-1]
+
+                # Departures are visited latest first, so the new entry is a prefix minimum
+                key = (window_end, departure_airport)
+                if profile_costs[key]:
+                    costs = [min(a, b) for a, b in zip(costs, profile_costs[key][-1])]
+                profile_times[key].append(-departure_time)
+                profile_costs[key].append(costs)
+
+        result = {}
+        for day in departure_dates:
+            # Later flights are visited first, a day is complete once the sweep went past its start
+            if cutoff is not None and to_minutes(datetime.datetime.combine(
+                    day, datetime.time.min, datetime.timezone.utc)) <= cutoff:
+                continue
+            cost = best_by_day.get(day)
+            if cost is not None and args.get('price_max') and cost > args['price_max']:
+                cost = None
+            result[day] = round(cost, 2) if cost is not None else None
+        return result
+
+    def explore_search(self, origin_ids: Iterable[int], departure_dates: List[datetime.date], max_transfers: int,
+                       min_transfer_minutes: int, args: dict,
+                       excluded_flight_ids: Optional[Set[bytes]] = None) -> Dict[int, dict]:
+        """
+        One-to-all search: cheapest economy price and shortest duration from the origin airports to
+        every reachable airport, for journeys starting on any of the departure dates.
+
+        Flights of the whole range are scanned once by increasing departure time. As in raptor_search
+        a journey must leave within two days of the start of its first day, so each flight is labelled
+        for the window of its own day and of the previous one. Labels wait in a heap until the minimum
+        transfer time has passed, then only the cheapest cost and the latest first departure per number
+        of flights are kept for each (window, airport).
+        When the deadline passes mid-sweep, the destinations reached by the flights visited so far are returned.
+        Returns a dict mapping airport id -> {'price', 'duration_minutes', 'departure_date'}.
+        """
+        if not departure_dates:
+            return {}
+
+        origin_ids = set(origin_ids)
+        dates = set(departure_dates)
+        date_min = datetime.datetime.combine(min(dates), datetime.time.min, datetime.timezone.utc)
+        date_max = datetime.datetime.combine(max(dates) + datetime.timedelta(days=2), datetime.time.min, datetime.timezone.utc)
+
+        self.window = self.index.window(date_min, date_max)
+        search_filter = SearchFilter(args, self.window, excluded_flight_ids)
+
+        # All candidate flights of the range, earliest departure first
+        candidates = []
+        for bucket in self.window.buckets:
+            for i in range(len(bucket)):
+                if not search_filter.active or search_filter.passes(bucket, i):
+                    candidates.append((bucket.departure[i], bucket.day, bucket, i))
+        candidates.sort(key=lambda candidate: candidate[0])
+
+        infinity = float('inf')
+        rounds = max_transfers + 1
+        one_day = datetime.timedelta(days=1)
+        # (window day, airport) -> heap of labels not reachable yet, and the best values of the reachable ones
+        pending: Dict[Tuple[datetime.date, int], list] = defaultdict(list)
+        best_costs: Dict[Tuple[datetime.date, int], List[float]] = {}
+        best_departures: Dict[Tuple[datetime.date, int], List[float]] = {}
+        reached: Dict[int, dict] = {}
+        sequence = 0
+
+        for position, (departure_time, day, bucket, i) in enumerate(candidates):
+            if position % SWEEP_DEADLINE_STRIDE == 0 and position and self._out_of_time():
+                break
+            departure_airport = bucket.departure_airport[i]
+            arrival_airport = bucket.arrival_airport[i]
+            arrival_time = bucket.arrival[i]
+            price = bucket.price_economy[i]
+
+            for window_day in (day, day - one_day):
+                if window_day not in dates:
+                    continue
+                key = (window_day, departure_airport)
+
+                # Costs and first departures of the journeys ending with this flight, by number of flights - 1
+                costs = [infinity] * rounds
+                first_departures = [-infinity] * rounds
+                if window_day == day and departure_airport in origin_ids:
+                    costs[0] = price
+                    first_departures[0] = departure_time
+
+                # Labels arrived early enough become usable for this and every later departure
+                heap = pending.get(key)
+                while heap and heap[0][0] + min_transfer_minutes <= departure_time:
+                    _, _, label_costs, label_departures = heapq.heappop(heap)
+                    if key not in best_costs:
+                        best_costs[key] = [infinity] * rounds
+                        best_departures[key] = [-infinity] * rounds
+                    for k in range(rounds):
+                        best_costs[key][k] = min(best_costs[key][k], label_costs[k])
+                        best_departures[key][k] = max(best_departures[key][k], label_departures[k])
+
+                usable_costs = best_costs.get(key)
+                if usable_costs is not None:
+                    usable_departures = best_departures[key]
+                    for k in range(1, rounds):
+                        costs[k] = min(costs[k], usable_costs[k - 1] + price)
+                        first_departures[k] = max(first_departures[k], usable_departures[k - 1])
+
+                cost = min(costs)
+                if cost == infinity:
+                    continue
 
-        if args.get('departure_time_max'):
-            time_str = flight.departure_time.strftime('%H:%M')
-            if time_str > args['departure_time_max']:
-                return False
+                if arrival_airport not in origin_ids:
+                    duration = arrival_time - max(first_departures)
+                    result = reached.get(arrival_airport)
+                    if result is None:
+                        result = reached[arrival_airport] = {'price': infinity, 'duration_minutes': None,
+                                                             'departure_date': None}
+                    if cost < result['price']:
+                        result['price'] = cost
+                        result['departure_date'] = window_day
+                    if result['duration_minutes'] is None or duration < result['duration_minutes']:
+                        result['duration_minutes'] = duration
+
+                sequence += 1
+                heapq.heappush(pending[(window_day, arrival_airport)], (arrival_time, sequence, costs, first_departures))
+
+        results = {}
+        for airport_id, result in reached.items():
+            if args.get('price_max') and result['price'] > args['price_max']:
+                continue
+            result['price'] = round(result['price'], 2)
+            results[airport_id] = result
+        return results
+
+    def _load_segment_details(self, paths: Iterable[List[FlightRef]]) -> Dict[uuid.UUID, Row]:
+        """Fetch the descriptive flight columns for the flights of the returned journeys only"""
+        flight_ids = {bucket.flight_id(i) for path in paths for bucket, i in path}
+        if not flight_ids:
+            return {}
+
+        rows = db.session.query(
+            Flight.id,
+            Flight.departure_time,
+            Flight.arrival_time,
+            Flight.gate,
+            Flight.terminal,
+            Route.flight_number,
+            Airline.id.label('airline_id'),
+            Airline.name.label('airline_name'),
+            Aircraft.name.label('aircraft_name'),
+        ).join(Route, Flight.route_id == Route.id) \
+            .join(Airline, Route.airline_id == Airline.id) \
+            .join(AirlineAircraft, Flight.aircraft_id == AirlineAircraft.id) \
+            .join(Aircraft, AirlineAircraft.aircraft_id == Aircraft.id) \
+            .filter(Flight.id.in_(flight_ids)).all()
+
+        return {row.id: row for row in rows}
+
+    def _format_journey_result(self, flight_path: List[FlightRef], details: Dict[uuid.UUID, Row]) -> Optional[dict]:
+        """Format a journey into the expected result format using the timetable window"""
+        if not flight_path or not self.window:
+            return None
 
-        return True
+        airports = self.window.airports
 
-    def _format_journey_result(self, flight_path: List[Flight], origin_id: int, destination_id: int) -> Optional[dict]:
-        """Format a journey into the expected result format using preloaded data"""
-        if not flight_path or not self.preloaded_data:
+        # Flights removed since the bucket was loaded have no details
+        flight_rows = [details.get(bucket.flight_id(i)) for bucket, i in flight_path]
+        if not all(flight_rows):
             return None
 
-        # Get first and last flight
-        first_flight = flight_path[0]
-        last_flight = flight_path[-1]
-
-        # Get origin and destination airports from preloaded data
-        origin_airport = self.preloaded_data.airports.get(origin_id)
-        destination_airport = self.preloaded_data.airports.get(destination_id)
+        # Get origin and destination airports of this journey from the timetable
+        origin_airport = airports.get(flight_path[0][0].departure_airport[flight_path[0][1]])
+        destination_airport = airports.get(flight_path[-1][0].arrival_airport[flight_path[-1][1]])
 
         if not origin_airport or not destination_airport:
             return None
@@ -243,45 +623,36 @@ class SearchFlight:
             return None
 
         # Calculate total duration
-        total_duration_minutes = int((last_flight.arrival_time - first_flight.departure_time).total_seconds() / 60)
+        total_duration_minutes = int((flight_rows[-1].arrival_time - flight_rows[0].departure_time).total_seconds() / 60)
 
         # Calculate total prices
-        total_economy_price = sum(flight.price_economy_class for flight in flight_path)
-        total_business_price = sum(flight.price_business_class for flight in flight_path)
-        total_first_price = sum(flight.price_first_class for flight in flight_path)
+        total_economy_price = sum(bucket.price_economy[i] for bucket, i in flight_path)
+        total_business_price = sum(bucket.price_business[i] for bucket, i in flight_path)
+        total_first_price = sum(bucket.price_first[i] for bucket, i in flight_path)
 
-        # Create segments using preloaded data
+        # Create segments
         segments = []
-        for flight in flight_path:
-            route = self.preloaded_data.routes.get(flight.route_id)
-            if not route:
-                continue
-
-            departure_airport = self.preloaded_data.airports.get(route.departure_airport_id)
-            arrival_airport = self.preloaded_data.airports.get(route.arrival_airport_id)
+        for (bucket, i), row in zip(flight_path, flight_rows):
+            departure_airport = airports.get(bucket.departure_airport[i])
+            arrival_airport = airports.get(bucket.arrival_airport[i])
 
             if not departure_airport or not arrival_airport:
                 continue
 
-            segment = self._process_flight_segment(flight, route, departure_airport, arrival_airport)
+            segment = self._process_flight_segment(bucket, i, row, departure_airport, arrival_airport)
             if segment:
                 segments.append(segment)
 
         # Create layover information
         layovers = []
         for i in range(len(flight_path) - 1):
-            current_flight = flight_path[i]
-            next_flight = flight_path[i + 1]
-            
-            current_route = self.preloaded_data.routes.get(current_flight.route_id)
-            if not current_route:
-                continue
+            bucket, position = flight_path[i]
 
-            airport = self.preloaded_data.airports.get(current_route.arrival_airport_id)
+            airport = airports.get(bucket.arrival_airport[position])
             if not airport or not airport.iata_code:
                 continue
 
-            layover_duration = int((next_flight.departure_time - current_flight.arrival_time).total_seconds() / 60)
+            layover_duration = int((flight_rows[i + 1].departure_time - flight_rows[i].arrival_time).total_seconds() / 60)
 
             layovers.append({
                 'airport': airport.iata_code,
@@ -301,95 +672,71 @@ class SearchFlight:
             'layovers': layovers
         }
 
-    def _process_flight_segment(self, flight: Flight, route: Route, 
-                              departure_airport: Airport, arrival_airport: Airport) -> Optional[dict]:
-        """Process flight segment using preloaded data"""
+    def _process_flight_segment(self, bucket: TimetableBucket, i: int, row: Row,
+                                departure_airport: TimetableAirport, arrival_airport: TimetableAirport) -> Optional[dict]:
+        """Process flight segment from the timetable columns and the fetched details"""
         if not departure_airport.iata_code or not arrival_airport.iata_code:
             return None
-        
-        aircraft_instance = self.preloaded_data.airline_aircraft.get(str(flight.aircraft_id))
-        if not aircraft_instance or not aircraft_instance.aircraft:
-            return None
-
-        aircraft = aircraft_instance.aircraft
-        airline = Airline.query.get(route.airline_id)
 
         # Calculate flight duration in minutes
-        duration_minutes = int((flight.arrival_time - flight.departure_time).total_seconds() / 60)
+        duration_minutes = int((row.arrival_time - row.departure_time).total_seconds() / 60)
 
         return {
-            'id': str(flight.id),
-            'flight_number': route.flight_number,
-            'airline_name': airline.name if airline else 'Unknown Airline',
-            'airline_id': str(airline.id) if airline else '',
+            'id': str(row.id),
+            'flight_number': row.flight_number,
+            'airline_name': row.airline_name,
+            'airline_id': str(row.airline_id),
             'departure_airport': departure_airport.iata_code,
             'arrival_airport': arrival_airport.iata_code,
-            'departure_time': flight.departure_time,
-            'arrival_time': flight.arrival_time,
+            'departure_time': row.departure_time,
+            'arrival_time': row.arrival_time,
             'duration_minutes': duration_minutes,
-            'price_economy': round(flight.price_economy_class, 2),
-            'price_business': round(flight.price_business_class, 2),
-            'price_first': round(flight.price_first_class, 2),
-            'aircraft_name': aircraft.name if aircraft else 'Unknown Aircraft',
-            'gate': flight.gate,
-            'terminal': flight.terminal
+            'price_economy': round(bucket.price_economy[i], 2),
+            'price_business': round(bucket.price_business[i], 2),
+            'price_first': round(bucket.price_first[i], 2),
+            'aircraft_name': row.aircraft_name,
+            'gate': row.gate,
+            'terminal': row.terminal
         }
 
-def check_duplicate_flight(journey: dict, args: dict) -> bool:
+def check_duplicate_flight(journey: dict, booked_flight_ids: Set[bytes]) -> bool:
     """Check if user already has a booking for any segment in the journey"""
-    if not args.get('user_id'):
+    if not booked_flight_ids:
         return False
-    
+
     for segment in journey['segments']:
-        # Check if the user has a booking with this flight as departure flight
-        booking_departure = BookingDepartureFlight.query.join(Booking).filter(
-            BookingDepartureFlight.flight_id == segment['id'],
-            Booking.user_id == args['user_id']
-        ).first()
-
-        # Check if the user has a booking with this flight as return flight
-        booking_return = BookingReturnFlight.query.join(Booking).filter(
-            BookingReturnFlight.flight_id == segment['id'],
-            Booking.user_id == args['user_id']
-        ).first()
-
-        if booking_departure or booking_return:
+        if uuid.UUID(str(segment['id'])).bytes in booked_flight_ids:
             return True
-    
+
     return False
 
 
-def filter_journeys(unfiltered_journeys: List[dict], args: dict) -> List[dict]:
-    """Filter journeys based on provided arguments with async-compatible duplicate checking"""
+def filter_journeys(unfiltered_journeys: List[dict], args: dict,
+                    booked_flight_ids: Optional[Set[bytes]] = None) -> List[dict]:
+    """Filter journeys based on provided arguments, booked flights are loaded once per request"""
     filtered_journeys = []
+    if booked_flight_ids is None:
+        booked_flight_ids = get_booked_flight_ids(args.get('user_id'))
+    search_filter = SearchFilter(args)
 
     for journey in unfiltered_journeys:
         if journey is None:
             continue
         
         # Remove journeys where user already has a booking for any segment
-        if args.get('user_id'):
-            user_has_booking = check_duplicate_flight(journey, args)
-            if user_has_booking:
-                continue
+        if check_duplicate_flight(journey, booked_flight_ids):
+            continue
 
         # Filter by departure time range
-        if args.get('departure_time_min'):
-            min_time = datetime.datetime.strptime(args['departure_time_min'], '%H:%M').time()
+        if search_filter.minute_min is not None or search_filter.minute_max is not None:
             departure_time = journey['segments'][0]['departure_time']
             if isinstance(departure_time, str):
                 departure_time = datetime.datetime.fromisoformat(departure_time.replace('Z', '+00:00'))
-            
-            if departure_time.time() < min_time:
-                continue
+            minute = departure_time.hour * 60 + departure_time.minute
 
-        if args.get('departure_time_max'):
-            max_time = datetime.datetime.strptime(args['departure_time_max'], '%H:%M').time()
-            departure_time = journey['segments'][0]['departure_time']
-            if isinstance(departure_time, str):
-                departure_time = datetime.datetime.fromisoformat(departure_time.replace('Z', '+00:00'))
-            
-            if departure_time.time() > max_time:
+            if search_filter.minute_min is not None and minute < search_filter.minute_min:
+                continue
+            if search_filter.minute_max is not None and minute > search_filter.minute_max:
                 continue
 
         if args.get('price_max'):
@@ -401,47 +748,142 @@ def filter_journeys(unfiltered_journeys: List[dict], args: dict) -> List[dict]:
     return filtered_journeys
 
 
-def sort_journeys(unfiltered_journeys: List[dict], args: dict) -> List[dict]:
-    """Sort journeys based on provided arguments"""
-    journeys = unfiltered_journeys.copy()
+# Journey field used for each `order_by` value
+SORT_FIELDS = {'price': 'price_economy', 'duration': 'duration_minutes', 'stops': 'stops'}
+
+SortKey = Tuple
+
+
+def journey_id(journey: dict) -> str:
+    """Stable identifier of a journey, used to break ties between equal sort values"""
+    return '-'.join(str(segment['id']) for segment in journey['segments'])
+
 
-    if args.get('order_by') == 'price':
-        journeys.sort(key=lambda x: x['price_economy'], reverse=args.get('order_by_desc', False))
-    elif args.get('order_by') == 'duration':
-        journeys.sort(key=lambda x: x['duration_minutes'], reverse=args.get('order_by_desc', False))
-    elif args.get('order_by') == 'stops':
-        journeys.sort(key=lambda x: x['stops'], reverse=args.get('order_by_desc', False))
+def journey_departure(journey: dict) -> str:
+    """ISO departure time of the first segment, journeys are compared before and after being marshalled"""
+    if not journey['segments']:
+        return ''
+    departure = journey['segments'][0]['departure_time']
+    return departure.isoformat() if isinstance(departure, datetime.datetime) else departure
 
-    return journeys
+
+def journey_sort_key(journey: dict, args: dict) -> SortKey:
+    """
+    Sort key of a journey for the requested order, by departure time then duration when no order is
+    requested. Keys only depend on the journey, so a cursor stays valid when the search is recomputed
+    """
+    field = SORT_FIELDS.get(args.get('order_by'))
+    if field is None:
+        return journey_departure(journey), journey['duration_minutes'], journey_id(journey)
+    value = journey[field]
+    return (-value if args.get('order_by_desc') else value), journey_id(journey)
+
+
+def select_journeys(journeys: List[dict], args: dict, limit: int,
+                    after: Optional[SortKey] = None) -> List[Tuple[SortKey, dict]]:
+    """
+    First `limit` journeys in the requested order whose sort key comes after `after`,
+    as (sort key, journey) pairs. A bounded heap keeps this O(n log limit) instead of
+    sorting every journey for each page.
+    """
+    keyed = ((journey_sort_key(journey, args), journey) for journey in journeys)
+    if after is not None:
+        keyed = (item for item in keyed if item[0] > after)
+    return heapq.nsmallest(limit, keyed, key=lambda item: item[0])
+
+
+# Upper bound on the leg combinations examined for a single round-trip or multi-city response
+ITINERARY_MAX_COMBINATIONS = 10000
+
+
+def combine_legs(legs: List[List[dict]], args: dict, limit: int) -> List[dict]:
+    """
+    Best itineraries made of one journey per leg, by combined `order_by` value (price by
+    default). Combinations are enumerated in order with a heap over the sorted legs (k smallest
+    sums), so at most ITINERARY_MAX_COMBINATIONS are examined. Each journey must leave after
+    the previous leg has landed, the price filter applies to the whole itinerary.
+    """
+    field = SORT_FIELDS.get(args.get('order_by')) or 'price_economy'
+    sign = -1 if args.get('order_by_desc') else 1
+    legs = [sorted(journeys, key=lambda journey: sign * journey[field]) for journeys in legs]
+    if not legs or not all(legs) or limit <= 0:
+        return []
+
+    def combined(positions: Tuple[int, ...]) -> float:
+        return sign * sum(journeys[i][field] for journeys, i in zip(legs, positions))
+
+    itineraries = []
+    start = (0,) * len(legs)
+    heap = [(combined(start), start)]
+    seen = {start}
+    examined = 0
+    while heap and len(itineraries) < limit and examined < ITINERARY_MAX_COMBINATIONS:
+        _, positions = heapq.heappop(heap)
+        examined += 1
+        for leg, i in enumerate(positions):
+            if i + 1 < len(legs[leg]):
+                following = positions[:leg] + (i + 1,) + positions[leg + 1:]
+                if following not in seen:
+                    seen.add(following)
+                    heapq.heappush(heap, (combined(following), following))
+
+        journeys = [legs[leg][i] for leg, i in enumerate(positions)]
+        if any(current['segments'][0]['departure_time'] < previous['segments'][-1]['arrival_time']
+               for previous, current in zip(journeys, journeys[1:])):
+            continue
+        price = round(sum(journey['price_economy'] for journey in journeys), 2)
+        if args.get('price_max') and price > args['price_max']:
+            continue
+        itineraries.append({
+            'legs': journeys,
+            'price_economy': price,
+            'duration_minutes': sum(journey['duration_minutes'] for journey in journeys),
+            'stops': sum(journey['stops'] for journey in journeys),
+        })
+    return itineraries
+
+
+def pair_round_trips(outbound: List[dict], inbound: List[dict], args: dict, limit: int) -> List[dict]:
+    """Best round trips, the return leg must leave after the outbound leg has landed"""
+    round_trips = []
+    for itinerary in combine_legs([outbound, inbound], args, limit):
+        itinerary['outbound'], itinerary['return'] = itinerary.pop('legs')
+        round_trips.append(itinerary)
+    return round_trips
+
+
+def _find_airports(location_type: str, location_id: Optional[int], label: str) -> Tuple[List[Airport], Optional[Tuple[dict, int]]]:
+    """Airports of a location given as an airport or a city id"""
+    if location_type == 'airport':
+        if not location_id:
+            return [], ({'error': f'{label} airport ID is required', 'code': 400}, 400)
+        return Airport.query.filter_by(id=location_id).all(), None
+    if not location_id:
+        return [], ({'error': f'{label} city ID is required', 'code': 400}, 400)
+    return Airport.query.filter_by(city_id=location_id).all(), None
+
+
+def get_departure_airports(args: dict) -> Tuple[List[Airport], Optional[Tuple[dict, int]]]:
+    """Get departure airports based on search arguments"""
+    departure_airports, error = _find_airports(args['departure_type'], args.get('departure_id'), 'Departure')
+    if error:
+        return [], error
+    if not departure_airports:
+        error = ({'error': 'No valid departure airports found', 'code': 400}, 400)
+    return departure_airports, error
 
 
 def get_airports(args: dict) -> Tuple[List[Airport], List[Airport], Optional[Tuple[dict, int]]]:
     """Get departure and arrival airports based on search arguments"""
-    error = None
-    
     # Get departure airports
-    if args['departure_type'] == 'airport':
-        if not args.get('departure_id'):
-            error = ({'error': 'Departure airport ID is required', 'code': 400}, 400)
-            return [], [], error
-        departure_airports = Airport.query.filter_by(id=args['departure_id']).all()
-    else:
-        if not args.get('departure_id'):
-            error = ({'error': 'Departure city ID is required', 'code': 400}, 400)
-            return [], [], error
-        departure_airports = Airport.query.filter_by(city_id=args['departure_id']).all()
+    departure_airports, error = _find_airports(args['departure_type'], args.get('departure_id'), 'Departure')
+    if error:
+        return [], [], error
 
     # Get arrival airports
-    if args['arrival_type'] == 'airport':
-        if not args.get('arrival_id'):
-            error = ({'error': 'Arrival airport ID is required', 'code': 400}, 400)
-            return [], [], error
-        arrival_airports = Airport.query.filter_by(id=args['arrival_id']).all()
-    else:
-        if not args.get('arrival_id'):
-            error = ({'error': 'Arrival city ID is required', 'code': 400}, 400)
-            return [], [], error
-        arrival_airports = Airport.query.filter_by(city_id=args['arrival_id']).all()
+    arrival_airports, error = _find_airports(args['arrival_type'], args.get('arrival_id'), 'Arrival')
+    if error:
+        return [], [], error
 
     if not departure_airports or not arrival_airports:
         error = ({'error': 'No valid departure or arrival airports found', 'code': 400}, 400)
@@ -449,77 +891,148 @@ def get_airports(args: dict) -> Tuple[List[Airport], List[Airport], Optional[Tup
     return departure_airports, arrival_airports, error
 
 
+def month_dates(date: datetime.date) -> List[datetime.date]:
+    """Every day of the month of the given date"""
+    start_date = datetime.date(date.year, date.month, 1)
+    if date.month == 12:
+        end_date = datetime.date(date.year + 1, 1, 1) - datetime.timedelta(days=1)
+    else:
+        end_date = datetime.date(date.year, date.month + 1, 1) - datetime.timedelta(days=1)
+    return [start_date + datetime.timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+
+
+def validate_time_filters(args: dict) -> Optional[Tuple[dict, int]]:
+    """Error response if the departure time filters are not HH:MM"""
+    try:
+        minute_of_day(args.get('departure_time_min'))
+        minute_of_day(args.get('departure_time_max'))
+    except ValueError:
+        return {'error': 'Invalid departure time format. Use HH:MM', 'code': 400}, 400
+    return None
+
+
+def get_booked_flight_ids(user_id) -> Set[bytes]:
+    """Raw ids of every flight the user already booked, as departure or return flight"""
+    if not user_id:
+        return set()
+
+    departure = db.session.query(BookingDepartureFlight.flight_id) \
+        .join(Booking, BookingDepartureFlight.booking_id == Booking.id) \
+        .filter(Booking.user_id == user_id)
+    ret = db.session.query(BookingReturnFlight.flight_id) \
+        .join(Booking, BookingReturnFlight.booking_id == Booking.id) \
+        .filter(Booking.user_id == user_id)
+
+    return {uuid.UUID(str(row[0])).bytes for row in departure.union(ret).all()}
+
+
+def profile_chunk(origin_ids: List[int], destination_ids: List[int], departure_dates: List[datetime.date],
+                  max_transfers: int, min_transfer_time: int, args: dict,
+                  excluded_flight_ids: Set[bytes], deadline: Optional[float] = None) -> Dict[datetime.date, Optional[float]]:
+    """Lowest prices of a chunk of dates, run by the search executor"""
+    return SearchFlight(deadline=deadline).profile_search(origin_ids, destination_ids, departure_dates, max_transfers,
+                                         min_transfer_time, args, excluded_flight_ids=excluded_flight_ids)
+
+
+def lowest_prices_by_date(departure_date_range: List[datetime.date],
+                          departure_airports: List[Airport],
+                          arrival_airports: List[Airport],
+                          args: dict,
+                          booked_flight_ids: Optional[Set[bytes]] = None) -> Dict[datetime.date, Optional[float]]:
+    """
+    Lowest price of every date computed with profile searches over the range, split in one
+    chunk of consecutive dates per search worker. Dates not computed within the budget are left out.
+    """
+    if not departure_date_range:
+        return {}
+
+    workers = max(current_app.config.get('SEARCH_WORKERS', 0), 1)
+    chunk_size = math.ceil(len(departure_date_range) / workers)
+    common = (
+        [airport.id for airport in departure_airports],
+        [airport.id for airport in arrival_airports],
+    )
+    rest = (
+        args.get('max_transfers', 3),
+        120,  # min_transfer_time
+        dict(args),
+        booked_flight_ids if booked_flight_ids is not None else get_booked_flight_ids(args.get('user_id')),
+    )
+    tasks = [common + (departure_date_range[start:start + chunk_size],) + rest
+             for start in range(0, len(departure_date_range), chunk_size)]
+
+    best_by_day = {}
+    for result in run_searches(profile_chunk, tasks):
+        best_by_day.update(result or {})
+    return best_by_day
+
+
 def lowest_price_multiple_dates(departure_date_range: List[datetime.date], 
                                departure_airports: List[Airport], 
                                arrival_airports: List[Airport], 
+                               args: dict,
+                               booked_flight_ids: Optional[Set[bytes]] = None) -> List[Optional[float]]:
+    """Get lowest prices for multiple dates, dates not computed within the budget are None"""
+    best_by_day = lowest_prices_by_date(departure_date_range, departure_airports, arrival_airports, args,
+                                        booked_flight_ids)
+    return [best_by_day.get(date) for date in departure_date_range]
+
+
+def materialized_lowest_prices(departure_date_range: List[datetime.date],
+                               departure_airports: List[Airport],
+                               arrival_airports: List[Airport],
                                args: dict) -> List[Optional[float]]:
-    """Get lowest prices for multiple dates using optimized bulk search"""
+    """
+    Lowest prices served from the materialized fare calendar of the month. Only missing days
+    and days whose timetable changed since they were stored are computed, then stored back.
+    """
     if not departure_date_range:
         return []
-    
-    # Create a single SearchFlight instance for reuse
-    search_flight = SearchFlight()
-    
-    # Prepare extended date window covering all dates in the range
-    start_date = min(departure_date_range)
-    end_date = max(departure_date_range)
-    
-    # Extend to next day to ensure we get all flights
-    date_min = datetime.datetime.combine(start_date, datetime.time.min, datetime.timezone.utc)
-    date_max = datetime.datetime.combine(end_date + datetime.timedelta(days=2), datetime.time.min, datetime.timezone.utc)
-    
-    # Preload data once for all dates
-    search_flight._preload_data(date_min, date_max, args)
-    
-    departure_journeys = []
-    
-    # Process each date using preloaded data
-    for date in departure_date_range:
-        journey_departure = []
-        
-        for departure_airport in departure_airports:
-            for arrival_airport in arrival_airports:
-                # Use the same search instance with preloaded data
-                departure_results = search_flight.raptor_search(
-                    departure_airport.id,
-                    arrival_airport.id,
-                    date,
-                    args.get('max_transfers', 3),
-                    120,  # min_transfer_time
-                    args
-                )
-                
-                # Collect results from all transfer levels
-                for k_step in departure_results:
-                    journey_departure.extend(departure_results[k_step])
-
-        # Sort and filter journeys
-        journey_departure = sort_journeys(journey_departure, args)
-        filtered = filter_journeys(journey_departure, args)
-
-        # Get the best price for each day
-        if filtered:
-            departure_journeys.append(filtered[0]['price_economy'])
-        else:
-            departure_journeys.append(None)
-    
-    return departure_journeys
+
+    month = departure_date_range[0].strftime('%Y-%m')
+    versions = fare_calendar.day_versions(departure_date_range)
+    fares = fare_calendar.get_fares(args, month, versions)
+
+    missing = [date for date in departure_date_range if date not in fares]
+    if missing:
+        computed = lowest_prices_by_date(missing, departure_airports, arrival_airports, args, set())
+        fare_calendar.store_fares(args, month, computed, versions)
+        fares.update(computed)
+
+    return [fares.get(date) for date in departure_date_range]
 
 
-def generate_journey(departure_airport: Airport, arrival_airport: Airport, 
+def refresh_fare_calendar(calendar: dict) -> None:
+    """Recompute the stale days of a stored fare calendar, used by the background refresh"""
+    year, month = map(int, calendar['month'].split('-'))
+    dates = month_dates(datetime.date(year, month, 1))
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    dates = [date for date in dates if date >= today]
+    if not dates:
+        return
+
+    departure_airports, arrival_airports, error = get_airports(calendar)
+    if error:
+        return
+    materialized_lowest_prices(dates, departure_airports, arrival_airports, calendar)
+
+
+def generate_journey(departure_airports: List[Airport], arrival_airports: List[Airport],
                     departure_date: datetime.date, max_transfers: int = 3,
-                    min_transfer_time: int = 120, args: Optional[dict] = None) -> List[dict]:
-    """Generate journeys using the optimized RAPTOR search algorithm"""
+                    min_transfer_time: int = 120, args: Optional[dict] = None,
+                    excluded_flight_ids: Optional[Set[bytes]] = None) -> List[dict]:
+    """Generate journeys between any departure and any arrival airport using the RAPTOR search algorithm"""
     result = []
     
-    search_flight = SearchFlight()
+    search_flight = SearchFlight(deadline=search_deadline())
     departure_results = search_flight.raptor_search(
-        departure_airport.id,
-        arrival_airport.id,
+        [airport.id for airport in departure_airports],
+        [airport.id for airport in arrival_airports],
         departure_date,
         max_transfers,
         min_transfer_time,
-        args or {}
+        args or {},
+        excluded_flight_ids
     )
 
     # Collect results from all transfer levels
@@ -527,3 +1040,151 @@ def generate_journey(departure_airport: Airport, arrival_airport: Airport,
         result.extend(departure_results[k_step])
 
     return result
+
+
+def stream_journeys(departure_airports: List[Airport], arrival_airports: List[Airport],
+                    departure_date: datetime.date, args: dict,
+                    booked_flight_ids: Optional[Set[bytes]] = None) -> Iterator[Tuple[int, List[dict]]]:
+    """Filtered and ordered journeys of each RAPTOR round as (#transfers, journeys), as soon as the round ends"""
+    rounds = SearchFlight(deadline=search_deadline()).stream_search(
+        [airport.id for airport in departure_airports],
+        [airport.id for airport in arrival_airports],
+        departure_date,
+        int(args['max_transfers']),
+        120,  # min_transfer_time
+        args,
+        booked_flight_ids
+    )
+    for transfers, journeys in rounds:
+        journeys = filter_journeys(journeys, args, booked_flight_ids)
+        yield transfers, [journey for _, journey in select_journeys(journeys, args, len(journeys))]
+
+
+def explore_destinations(departure_airports: List[Airport], departure_dates: List[datetime.date], args: dict,
+                         booked_flight_ids: Optional[Set[bytes]] = None) -> List[dict]:
+    """
+    Cheapest price and shortest duration to every destination reachable from the departure
+    airports on the given dates, from a single one-to-all search, grouped by nation and city
+    and ordered by price. Airports of the departure cities are left out.
+    """
+    reached = SearchFlight(deadline=search_deadline()).explore_search(
+        [airport.id for airport in departure_airports],
+        departure_dates,
+        args.get('max_transfers', 3),
+        120,  # min_transfer_time
+        args,
+        booked_flight_ids
+    )
+    if not reached:
+        return []
+
+    departure_cities = {airport.city_id for airport in departure_airports}
+    rows = db.session.query(
+        Airport.id,
+        Airport.iata_code,
+        Airport.name,
+        City.id.label('city_id'),
+        City.name.label('city_name'),
+        Nation.id.label('nation_id'),
+        Nation.name.label('nation_name'),
+        Nation.alpha2,
+    ).join(
+        City, Airport.city_id == City.id
+    ).outerjoin(
+        Nation, City.nation_id == Nation.id
+    ).filter(
+        Airport.id.in_(reached)
+    ).all()
+
+    nations: Dict[Optional[int], dict] = {}
+    cities: Dict[int, dict] = {}
+    for row in rows:
+        if row.city_id in departure_cities:
+            continue
+        result = reached[row.id]
+        airport = {
+            'id': row.id,
+            'iata_code': row.iata_code,
+            'name': row.name,
+            'price_economy': result['price'],
+            'duration_minutes': result['duration_minutes'],
+            'departure_date': result['departure_date'].isoformat(),
+        }
+
+        nation = nations.get(row.nation_id)
+        if nation is None:
+            nation = nations[row.nation_id] = {'id': row.nation_id, 'name': row.nation_name, 'alpha2': row.alpha2,
+                                               'price_economy': airport['price_economy'], 'cities': []}
+        city = cities.get(row.city_id)
+        if city is None:
+            city = cities[row.city_id] = {'id': row.city_id, 'name': row.city_name,
+                                          'price_economy': airport['price_economy'],
+                                          'duration_minutes': airport['duration_minutes'],
+                                          'departure_date': airport['departure_date'], 'airports': []}
+            nation['cities'].append(city)
+
+        city['airports'].append(airport)
+        if airport['price_economy'] < city['price_economy']:
+            city['price_economy'] = airport['price_economy']
+            city['departure_date'] = airport['departure_date']
+        city['duration_minutes'] = min(city['duration_minutes'], airport['duration_minutes'])
+        nation['price_economy'] = min(nation['price_economy'], airport['price_economy'])
+
+    for city in cities.values():
+        city['airports'].sort(key=lambda airport: airport['price_economy'])
+    for nation in nations.values():
+        nation['cities'].sort(key=lambda city: city['price_economy'])
+    return sorted(nations.values(), key=lambda nation: nation['price_economy'])
+
+
+def generate_round_trips(departure_airports: List[Airport], arrival_airports: List[Airport],
+                         outbound_date: datetime.date, return_date: datetime.date, args: dict, limit: int,
+                         booked_flight_ids: Optional[Set[bytes]] = None) -> List[dict]:
+    """Paired outbound and return itineraries from a single round-trip search"""
+    outbound, inbound = SearchFlight(deadline=search_deadline()).round_trip_search(
+        [airport.id for airport in departure_airports],
+        [airport.id for airport in arrival_airports],
+        outbound_date,
+        return_date,
+        int(args['max_transfers']),
+        120,  # min_transfer_time
+        args,
+        booked_flight_ids
+    )
+
+    # The price cap applies to the whole trip, the other filters to each leg
+    leg_args = {**args, 'price_max': None}
+    outbound = filter_journeys(outbound, leg_args, booked_flight_ids)
+    inbound = filter_journeys(inbound, leg_args, booked_flight_ids)
+    return pair_round_trips(outbound, inbound, args, limit)
+
+
+def leg_journeys(origin_ids: List[int], destination_ids: List[int], departure_date: datetime.date,
+                 args: dict, limit: int, excluded_flight_ids: Set[bytes],
+                 deadline: Optional[float] = None) -> List[dict]:
+    """Best `limit` journeys of one leg of a multi-city trip, run by the search executor"""
+    results = SearchFlight(deadline=deadline).raptor_search(origin_ids, destination_ids, departure_date, int(args['max_transfers']),
+                                           120, args, excluded_flight_ids)
+    journeys = [journey for k_step in results for journey in results[k_step]]
+    journeys = filter_journeys(journeys, {**args, 'price_max': None}, excluded_flight_ids)
+    return [journey for _, journey in select_journeys(journeys, args, limit)]
+
+
+def generate_multi_city(legs: List[Tuple[List[Airport], List[Airport], datetime.date]], args: dict, limit: int,
+                        booked_flight_ids: Optional[Set[bytes]] = None) -> Tuple[List[List[dict]], List[dict]]:
+    """
+    Best journeys of every leg and the best itineraries combining them. Legs are searched
+    concurrently on the search executor and share the timetable index of each process.
+    Legs cut short by the budget only keep the journeys of the rounds completed in time.
+    """
+    tasks = [(
+        [airport.id for airport in departure_airports],
+        [airport.id for airport in arrival_airports],
+        departure_date,
+        dict(args),
+        limit,
+        booked_flight_ids or set(),
+    ) for departure_airports, arrival_airports, departure_date in legs]
+
+    journeys = [result or [] for result in run_searches(leg_journeys, tasks)]
+    return journeys, combine_legs(journeys, args, limit)
@@ -2,17 +2,21 @@ from flask import request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from flask_restx import Namespace, Resource, fields, reqparse, marshal
 import datetime
-from sqlalchemy import text
-from sqlalchemy.orm import sessionmaker
 
 from app.core.auth import roles_required
-from app.extensions import db
-from app.models.airlines import AirlineAircraftSeat
-from app.models.booking import ClassType
-from app.models.seat_session import SeatSession, Seat
+from app.core.seat_holds import (
+    CLAIM_EXPIRED,
+    CLAIM_HELD,
+    CLAIM_NO_SEAT_MAP,
+    CLAIM_TAKEN,
+    claim_seat,
+    create_session,
+    get_session,
+    get_user_session,
+    release_session,
+)
+from app.core.seat_map import seat_layout
 from app.models.flight import Flight
-from sqlalchemy.exc import IntegrityError
-from app.schemas.seat_session import seat_session_schema
 
 api = Namespace('seat_session', description='Seat reservation session operations')
 SESSION_GRAY_TIME = datetime.timedelta(minutes=2)
@@ -52,12 +56,11 @@ class SeatSessionList(Resource):
         user_id = get_jwt_identity()
 
         now = datetime.datetime.now(datetime.UTC) + SESSION_GRAY_TIME
-        already_session = SeatSession.query.filter(SeatSession.session_end_time > now,
-                                                   SeatSession.user_id == user_id).first()
-        if already_session is None:
+        already_session = get_user_session(user_id)
+        if already_session is None or already_session.session_end_time <= now:
             return {'error': 'You do not have a session',"code":404}, 404
 
-        return marshal(seat_session_schema.dump(already_session), seat_session_model), 201
+        return marshal(already_session, seat_session_model), 201
 
     #CATATOIO CONCORRENZA POSTI
     @jwt_required()
@@ -68,24 +71,10 @@ class SeatSessionList(Resource):
         """Create a new seat reservation session"""
         user_id = get_jwt_identity()
 
-        now = datetime.datetime.now(datetime.UTC)
-        session_end = now + datetime.timedelta(minutes=15)  # 15 minute session 13 for the user to book
-        already_session = SeatSession.query.filter(SeatSession.session_end_time > now,SeatSession.user_id == user_id).first()
-        if already_session is not None:
-            db.session.delete(already_session)
-            db.session.commit()
-            #return {'error': 'You already have an active session'}, 409
+        # A previous session of the user is released with its seats
+        new_session = create_session(user_id)
 
-        # Create new seat session
-        new_session = SeatSession(
-            user_id=user_id,
-            session_start_time=now,
-            session_end_time=session_end
-        )
-        db.session.add(new_session)
-        db.session.commit()
-
-        return marshal(seat_session_schema.dump(new_session),seat_session_model), 201
+        return marshal(new_session, seat_session_model), 201
 
 
 @api.route('/<uuid:session_id>')
@@ -100,7 +89,7 @@ class SeatSessionResource(Resource):
         """Fetch a specific seat session"""
         user_id = get_jwt_identity()
 
-        session = SeatSession.query.get(session_id)
+        session = get_session(session_id)
         if session is None:
             return {'error': 'Seat session not found',"code": 400}, 400
 
@@ -123,7 +112,9 @@ class SeatSessionResource(Resource):
 
         user_id = get_jwt_identity()
 
-        session:SeatSession = SeatSession.query.get_or_404(session_id)
+        session = get_session(session_id)
+        if session is None:
+            return {'error': 'Seat session not found', 'code': 404}, 404
         # Check if the user owns this session
         if str(session.user_id) != user_id:
             return {'error': 'You do not have permission to update this session',"code": 403}, 403
@@ -134,43 +125,26 @@ class SeatSessionResource(Resource):
 
         flight_id = data['flight_id']
         seat_number = data['seat_number']
-        with db.engine.begin() as connection:
-            connection.execute(text("SET TRANSACTION ISOLATION LEVEL SERIALIZABLE"))
-
-            # Use a new session bound to this connection
-            Session = sessionmaker(bind=connection)
-            sql_session = Session()
-            # sql_session.execute(text("SET TRANSACTION ISOLATION LEVEL SERIALIZABLE"))
-
-            try:
-
-                # Check if flight exists
-                flight = Flight.query.get(flight_id)
-                if not flight:
-                    return {'error': 'Flight not found', 'code': 404}, 404
-                # Check if seat is in flight's booked_seats array
-                if seat_number in flight.booked_seats:
-                    return {'error': 'Seat is already in use', 'code': 409}, 409
-
-                seat_class = AirlineAircraftSeat.query.filter_by(airline_aircraft_id=flight.aircraft_id,seat_number=seat_number).first()
-                if not seat_class:
-                    return {'error': 'Seat not found in aircraft', 'code': 404}, 404
-
-                # Create new seat session
-                new_seat = Seat(
-                    session_id=session.id,
-                    seat_number=seat_number,
-                    class_type=seat_class.class_type,
-                    flight_id=flight.id
-                )
-                sql_session.add(new_seat)
-                sql_session.commit()
-
-                return  {'message': 'Ok','code':201}, 201
-
-            except IntegrityError:
-                db.session.rollback()
-                return {'error': 'Seat is already in use or seat already selected', 'code': 409}, 409
+
+        # Check if flight exists
+        flight = Flight.query.get(flight_id)
+        if not flight:
+            return {'error': 'Flight not found', 'code': 404}, 404
+        layout = seat_layout(flight.aircraft_id)
+        if seat_number not in layout.positions:
+            return {'error': 'Seat not found in aircraft', 'code': 404}, 404
+
+        # Booked bit and holds are both checked by the claim itself
+        result = claim_seat(session.id, flight, layout, seat_number)
+        if result == CLAIM_HELD:
+            return  {'message': 'Ok','code':201}, 201
+        if result == CLAIM_EXPIRED:
+            return {'error': 'Session expired', 'code': 400}, 400
+        if result == CLAIM_TAKEN:
+            return {'error': 'Seat is already in use', 'code': 409}, 409
+        if result == CLAIM_NO_SEAT_MAP:
+            return {'error': 'Seat map is being updated, please retry', 'code': 409}, 409
+        return {'error': 'Seat is already in use or seat already selected', 'code': 409}, 409
 
     @jwt_required()
     @roles_required(['user'])
@@ -182,15 +156,14 @@ class SeatSessionResource(Resource):
         """Delete (release) a seat session"""
         user_id = get_jwt_identity()
 
-        session = SeatSession.query.get(session_id)
+        session = get_session(session_id)
         if session is None:
             return {'error': 'Seat session not found', "code": 400}, 400
 
         # Check if the user owns this session
         if str(session.user_id) != user_id:
             return {'error': 'You do not have permission to delete this session'}, 403
-        db.session.delete(session)
-        db.session.commit()
+        release_session(session.id, user_id)
 
         return {'message': 'Ok', "code": 200}, 200
 
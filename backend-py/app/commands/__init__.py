@@ -6,6 +6,8 @@ from .add_flight import init_app as init_flight
 from .add_nations import init_app as init_nations
 from .add_extras import init_app as init_extras
 from .add_bookings import init_app as init_bookings
+from .build_snapshot import init_app as init_snapshot
+from .bench_search import init_app as init_bench_search
 
 def init_app(app):
     """Register all seed commands with the Flask app."""
@@ -17,3 +19,5 @@ def init_app(app):
     init_nations(app)
     init_extras(app)
     init_bookings(app)
+    init_snapshot(app)
+    init_bench_search(app)
@@ -6,6 +6,7 @@ import click
 from flask.cli import with_appcontext
 from sqlalchemy import func
 
+from app.core.seat_map import mark_booked, reset_seat_maps
 from app.extensions import db_session
 from app.models import Booking
 from app.models.flight import Flight,FlightExtra
@@ -199,6 +200,11 @@ def create_realistic_booking(user: User, departure_flight: Flight, return_flight
         db_session.rollback()
         click.echo(f"Error creating booking: {e}")
         return None         
+
+    # Keep the seat maps already in Redis in sync
+    mark_booked(departure_flight.id, departure_flight.aircraft_id, [departure_seat])
+    if return_booking:
+        mark_booked(return_flight.id, return_flight.aircraft_id, [return_seat])
     
     return booking
 
@@ -359,6 +365,7 @@ def generate_bookings(single_trips, round_trips, business_bookings, clear_existi
         db_session.query(BookingReturnFlight).delete()
         db_session.query(Booking).delete()
         db_session.commit()
+        reset_seat_maps()
         click.echo("✅ Existing bookings cleared")
     
     # Check prerequisites
@@ -262,6 +262,22 @@ class RealisticFlightGenerator:
         flight_time = (distance_km / avg_speed) * 60  # Convert to minutes
         return int(flight_time + ground_time)
     
+    def calculate_flights_per_week(self, distance_km: float, is_popular: bool = False, is_intercontinental: bool = False) -> int:
+        """Determine flight frequency based on route type and distance"""
+        if is_intercontinental:
+            if is_popular:
+                return random.randint(7, 14)   # 1-2 times daily for popular long haul
+            return random.randint(3, 7)        # 3-7 times per week
+        if is_popular:
+            if distance_km < 1000:  # Short popular routes - high frequency
+                return random.randint(10, 21)  # 1-3 times daily
+            return random.randint(7, 14)       # Long popular routes, 1-2 times daily
+        if distance_km < 500:  # Short regional routes
+            return random.randint(3, 10)
+        if distance_km < 2000:  # Medium haul
+            return random.randint(2, 7)
+        return random.randint(1, 4)            # Long haul
+    
     def calculate_realistic_price(self, distance_km: float, class_type: str, is_popular_route: bool = False, is_intercontinental: bool = False) -> float:
         """Calculate realistic prices based on distance and market factors"""
         base_rates = {
@@ -424,24 +440,7 @@ class RealisticFlightGenerator:
         db_session.add(route)
         db_session.flush()
         
-        # Determine flight frequency based on route type and distance
-        if is_intercontinental:
-            if is_popular:
-                flights_per_week = random.randint(7, 14)   # 1-2 times daily for popular long haul
-            else:
-                flights_per_week = random.randint(3, 7)    # 3-7 times per week
-        elif is_popular:
-            if distance < 1000:  # Short popular routes - high frequency
-                flights_per_week = random.randint(10, 21)  # 1-3 times daily
-            else:  # Long popular routes
-                flights_per_week = random.randint(7, 14)   # 1-2 times daily
-        else:
-            if distance < 500:  # Short regional routes
-                flights_per_week = random.randint(3, 10)
-            elif distance < 2000:  # Medium haul
-                flights_per_week = random.randint(2, 7)
-            else:  # Long haul
-                flights_per_week = random.randint(1, 4)
+        flights_per_week = self.calculate_flights_per_week(distance, is_popular, is_intercontinental)
         
         # Generate flights over the route period
         period_days = (period_end - period_start).days
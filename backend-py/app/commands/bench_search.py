@@ -0,0 +1,252 @@
+import datetime
+import json
+import math
+import multiprocessing
+import platform
+import random
+import resource
+import statistics
+import time
+import uuid
+from typing import Dict, List, Tuple
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from app.apis.search_utils import SearchFlight
+from app.commands.add_flight import WORLD_AIRPORTS, RealisticFlightGenerator
+from app.core.timetable import TimetableAirport, TimetableBucket, TimetableWindow, to_minutes
+
+BENCHMARK_AIRLINES = 20
+BENCHMARK_VERSION = (0, 0)  # Synthetic buckets are never compared with Redis versions
+
+
+class SyntheticTimetable:
+    """
+    In-memory timetable with a hub and spoke network. Hubs are fully connected, every spoke
+    flies to its nearest hubs and to its nearest spoke. Distances, durations, prices, departure
+    hours and weekly frequencies come from the `seed-flights` generator, frequencies are then
+    scaled so that the timetable holds the requested number of flights.
+    """
+
+    def __init__(self, flights: int, days: int, airports: int, hubs: int, spoke_hubs: int, seed: int):
+        random.seed(seed)
+        self.generator = RealisticFlightGenerator()
+        self.start = datetime.date.today() + datetime.timedelta(days=1)
+        self.airports = self._generate_airports(airports)
+        self.hubs = random.sample(list(self.airports), min(hubs, len(self.airports)))
+        self.routes = self._generate_routes(spoke_hubs)
+        self.buckets = self._generate_buckets(flights, days)
+        self.distances: Dict[Tuple[int, int], float] = {}
+        self.airlines = [uuid.UUID(int=random.getrandbits(128)) for _ in range(BENCHMARK_AIRLINES)]
+
+    def _generate_airports(self, count: int) -> Dict[int, TimetableAirport]:
+        """Real airports first, then airports scattered around them"""
+        anchors = list(WORLD_AIRPORTS.items())
+        airports = {}
+        for airport_id in range(1, count + 1):
+            iata, data = anchors[(airport_id - 1) % len(anchors)]
+            latitude, longitude = data['lat'], data['lon']
+            if airport_id > len(anchors):
+                latitude = max(min(latitude + random.uniform(-4, 4), 89), -89)
+                longitude = longitude + random.uniform(-4, 4)
+            airports[airport_id] = TimetableAirport(airport_id, iata, airport_id, latitude, longitude)
+        return airports
+
+    def _distance(self, a: int, b: int) -> float:
+        a, b = self.airports[a], self.airports[b]
+        return self.generator.calculate_distance(a.latitude, a.longitude, b.latitude, b.longitude)
+
+    def _generate_routes(self, spoke_hubs: int) -> List[dict]:
+        pairs = {}
+        hubs = set(self.hubs)
+        for a in self.hubs:
+            for b in self.hubs:
+                if a != b:
+                    pairs[(a, b)] = True
+        spokes = [airport_id for airport_id in self.airports if airport_id not in hubs]
+        for spoke in spokes:
+            nearest_hubs = sorted(self.hubs, key=lambda hub: self._distance(spoke, hub))[:spoke_hubs]
+            nearest_spoke = min((other for other in spokes if other != spoke),
+                                key=lambda other: self._distance(spoke, other), default=None)
+            for other in nearest_hubs + ([nearest_spoke] if nearest_spoke else []):
+                # Routes are created in both directions, like the generator's return routes
+                pairs.setdefault((spoke, other), False)
+                pairs.setdefault((other, spoke), False)
+
+        routes = []
+        for (departure, arrival), is_popular in pairs.items():
+            distance = self._distance(departure, arrival)
+            is_intercontinental = distance > 4000
+            routes.append({
+                'id': len(routes),
+                'departure': departure,
+                'arrival': arrival,
+                'airline': random.randrange(BENCHMARK_AIRLINES),
+                'intercontinental': is_intercontinental,
+                'duration': self.generator.calculate_flight_duration(distance),
+                'price_economy': self.generator.calculate_realistic_price(distance, 'economy', is_popular, is_intercontinental),
+                'price_business': self.generator.calculate_realistic_price(distance, 'business', is_popular, is_intercontinental),
+                'price_first': self.generator.calculate_realistic_price(distance, 'first', is_popular, is_intercontinental),
+                'per_week': self.generator.calculate_flights_per_week(distance, is_popular, is_intercontinental),
+            })
+        return routes
+
+    def _generate_buckets(self, flights: int, days: int) -> List[TimetableBucket]:
+        """One bucket per day, built day by day so only a single day of rows is held at once"""
+        scale = flights / (days * sum(route['per_week'] for route in self.routes) / 7)
+        buckets = []
+        for offset in range(days):
+            day = self.start + datetime.timedelta(days=offset)
+            day_start = datetime.datetime.combine(day, datetime.time.min, datetime.timezone.utc)
+            rows = []
+            for route in self.routes:
+                expected = route['per_week'] / 7 * scale
+                count = int(expected) + (random.random() < expected - int(expected))
+                for _ in range(count):
+                    departure = to_minutes(self.generator.get_realistic_departure_time(day_start, route['intercontinental']))
+                    price_var = random.uniform(0.9, 1.1)
+                    rows.append((route['departure'], departure, route, price_var))
+            rows.sort(key=lambda row: (row[0], row[1]))
+
+            bucket = TimetableBucket(day, BENCHMARK_VERSION)
+            for position, (departure_airport, departure, route, price_var) in enumerate(rows):
+                bucket.flight_ids += random.getrandbits(128).to_bytes(16, 'big')
+                bucket.departure.append(departure)
+                bucket.arrival.append(departure + route['duration'])
+                bucket.route.append(route['id'])
+                bucket.departure_airport.append(departure_airport)
+                bucket.arrival_airport.append(route['arrival'])
+                bucket.price_economy.append(round(route['price_economy'] * price_var, 2))
+                bucket.price_business.append(round(route['price_business'] * price_var, 2))
+                bucket.price_first.append(round(route['price_first'] * price_var, 2))
+                bucket.aircraft.append(0)
+                bucket.airline.append(route['airline'])
+                start, _ = bucket.offsets.get(departure_airport, (position, position))
+                bucket.offsets[departure_airport] = (start, position + 1)
+            buckets.append(bucket)
+        return buckets
+
+    def __len__(self) -> int:
+        return sum(len(bucket) for bucket in self.buckets)
+
+    def window(self, offset: int) -> TimetableWindow:
+        """Search window of a journey leaving `offset` days after the first day: that day and the next"""
+        return TimetableWindow(self.buckets[offset:offset + 2], self.airports, self.airlines, self.distances)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(math.ceil(fraction * len(ordered))) - 1, len(ordered) - 1)] if ordered else 0.0
+
+
+def run_benchmark(flights: int, days: int, queries: int, max_transfers: int, detour_factor: float,
+                  hubs: int, spoke_hubs: int, seed: int) -> dict:
+    """Build a synthetic timetable and time `queries` random airport to airport searches on it"""
+    airports = max(len(WORLD_AIRPORTS), int(math.sqrt(flights) * 2))
+    hubs = hubs or max(airports // 20, 2)
+
+    started = time.perf_counter()
+    timetable = SyntheticTimetable(flights, days, airports, hubs, spoke_hubs, seed)
+    build_seconds = time.perf_counter() - started
+
+    search = SearchFlight()
+    latencies, stops_marked, labels_inserted, journeys = [], [], [], []
+    for _ in range(queries):
+        origin, destination = random.sample(list(timetable.airports), 2)
+        offset = random.randrange(max(days - 1, 1))
+        search.window = timetable.window(offset)
+        start_minute = to_minutes(datetime.datetime.combine(timetable.buckets[offset].day, datetime.time.min,
+                                                            datetime.timezone.utc))
+
+        started = time.perf_counter()
+        found = 0
+        for _, labels in search._pareto_rounds([origin], [destination], start_minute, start_minute + 2 * 24 * 60,
+                                               max_transfers, 120, {}, None, detour_factor):
+            found += len(labels)
+        latencies.append((time.perf_counter() - started) * 1000)
+        stops_marked.append(search.stops_marked)
+        labels_inserted.append(search.labels_inserted)
+        journeys.append(found)
+
+    return {
+        'flights': len(timetable),
+        'airports': airports,
+        'hubs': len(timetable.hubs),
+        'routes': len(timetable.routes),
+        'queries': queries,
+        'build_seconds': round(build_seconds, 3),
+        'latency_ms': {
+            'p50': round(percentile(latencies, 0.5), 3),
+            'p99': round(percentile(latencies, 0.99), 3),
+            'mean': round(statistics.fmean(latencies), 3) if latencies else 0.0,
+            'max': round(max(latencies, default=0.0), 3),
+        },
+        # Search work per query
+        'stops_marked': {
+            'mean': round(statistics.fmean(stops_marked), 2) if stops_marked else 0.0,
+            'max': max(stops_marked, default=0),
+        },
+        'labels_inserted': {
+            'mean': round(statistics.fmean(labels_inserted), 2) if labels_inserted else 0.0,
+            'max': max(labels_inserted, default=0),
+        },
+        'journeys': {
+            'mean': round(statistics.fmean(journeys), 2) if journeys else 0.0,
+            'max': max(journeys, default=0),
+        },
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+@click.command('bench-search')
+@click.option('--flights', '-f', type=int, multiple=True, default=[10_000, 100_000, 1_000_000],
+              help='Number of flights of a timetable, repeat for several sizes (default: 10k, 100k, 1M)')
+@click.option('--days', default=7, help='Days covered by the timetable (default: 7)')
+@click.option('--queries', default=200, help='Searches per timetable (default: 200)')
+@click.option('--max-transfers', default=3, help='Maximum transfers per search (default: 3)')
+@click.option('--detour-factor', type=float, default=None, help='Detour pruning factor, defaults to SEARCH_DETOUR_FACTOR')
+@click.option('--hubs', default=0, help='Number of hubs, defaults to 5% of the airports')
+@click.option('--spoke-hubs', default=2, help='Hubs served by every spoke airport (default: 2)')
+@click.option('--seed', default=42, help='Random seed, the same seed generates the same timetables (default: 42)')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), help='Write the JSON report to a file instead of stdout')
+@with_appcontext
+def bench_search(flights, days, queries, max_transfers, detour_factor, hubs, spoke_hubs, seed, output):
+    """Benchmark the journey search on synthetic in-memory timetables, reported as JSON"""
+    if detour_factor is None:
+        detour_factor = current_app.config.get('SEARCH_DETOUR_FACTOR', 0)
+
+    # Each size runs in its own process so its peak RSS is not inflated by the previous sizes
+    context = multiprocessing.get_context('fork')
+    results = []
+    for size in flights:
+        click.echo(f'Benchmarking {size} flights...', err=True)
+        with context.Pool(1) as pool:
+            results.append(pool.apply(run_benchmark, (size, days, queries, max_transfers, detour_factor, hubs,
+                                                      spoke_hubs, seed)))
+
+    report = json.dumps({
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'settings': {
+            'days': days,
+            'queries': queries,
+            'max_transfers': max_transfers,
+            'detour_factor': detour_factor,
+            'spoke_hubs': spoke_hubs,
+            'seed': seed,
+        },
+        'results': results,
+    }, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(report + '\n')
+        click.echo(f'Benchmark report written to {output}.', err=True)
+    else:
+        click.echo(report)
+
+
+def init_app(app):
+    app.cli.add_command(bench_search)
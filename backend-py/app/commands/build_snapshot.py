@@ -0,0 +1,18 @@
+from flask import current_app
+from flask.cli import with_appcontext
+import click
+
+from app.core.timetable_snapshot import write_snapshot
+
+
+@click.command('build-timetable-snapshot')
+@click.option('--days', type=int, default=None, help='Number of days to include, defaults to TIMETABLE_SNAPSHOT_DAYS')
+@with_appcontext
+def build_timetable_snapshot(days):
+    click.echo('Building timetable snapshot...')
+    path = write_snapshot(current_app.config['TIMETABLE_SNAPSHOT_DIR'],
+                          days or current_app.config['TIMETABLE_SNAPSHOT_DAYS'])
+    click.echo(f'Timetable snapshot published at {path}.')
+
+def init_app(app):
+    app.cli.add_command(build_timetable_snapshot)
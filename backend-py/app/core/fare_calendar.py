@@ -0,0 +1,115 @@
+import datetime
+import json
+from typing import Dict, List, Optional, Tuple
+
+import redis
+
+from app.core.timetable import timetable_index
+from app.extensions import redis_client
+
+# Hash of day -> {price, versions} per (origin, destination, month, max_transfers)
+FARE_CALENDAR_KEY = 'fares:{pair}:{month}:{max_transfers}'
+# Requested calendars ranked by number of requests
+FARE_CALENDAR_POPULAR_KEY = 'fares:popular'
+FARE_CALENDAR_TTL = 62 * 24 * 3600  # seconds, a month stays useful until it is over
+FARE_CALENDAR_TRACKED = 1000  # calendars kept in the popularity ranking
+
+# Filters that make a calendar specific to a single request
+PER_REQUEST_ARGS = ('airline_id', 'price_max', 'departure_time_min', 'departure_time_max')
+
+# Versions of the days read by the search of a day: the day itself and the next one
+DayVersions = List[Tuple[int, int]]
+
+
+def calendar_member(args: dict, month: str) -> str:
+    """Identifier of a calendar: origin, destination, month and max transfers"""
+    return '{}:{}:{}:{}:{}:{}'.format(args['departure_type'], args['departure_id'], args['arrival_type'],
+                                      args['arrival_id'], month, args.get('max_transfers', 3))
+
+
+def parse_calendar_member(member: str) -> dict:
+    departure_type, departure_id, arrival_type, arrival_id, month, max_transfers = member.split(':')
+    return {
+        'departure_type': departure_type,
+        'departure_id': int(departure_id),
+        'arrival_type': arrival_type,
+        'arrival_id': int(arrival_id),
+        'month': month,
+        'max_transfers': int(max_transfers),
+    }
+
+
+def _calendar_key(args: dict, month: str) -> str:
+    pair = '{}:{}:{}:{}'.format(args['departure_type'], args['departure_id'], args['arrival_type'], args['arrival_id'])
+    return FARE_CALENDAR_KEY.format(pair=pair, month=month, max_transfers=args.get('max_transfers', 3))
+
+
+def is_materialized(args: dict, booked_flight_ids) -> bool:
+    """Only calendars without per-request filters or booked flights to exclude are shared"""
+    return not booked_flight_ids and not any(args.get(name) for name in PER_REQUEST_ARGS)
+
+
+def record_request(args: dict, month: str) -> None:
+    """Count a request of a calendar so the background refresh favours popular ones"""
+    try:
+        redis_client.zincrby(FARE_CALENDAR_POPULAR_KEY, 1, calendar_member(args, month))
+    except redis.RedisError:
+        pass
+
+
+def popular_calendars(count: int) -> List[dict]:
+    """Most requested calendars, the ranking is trimmed to FARE_CALENDAR_TRACKED entries"""
+    try:
+        members = redis_client.zrevrange(FARE_CALENDAR_POPULAR_KEY, 0, count - 1)
+        redis_client.zremrangebyrank(FARE_CALENDAR_POPULAR_KEY, 0, -FARE_CALENDAR_TRACKED - 1)
+    except redis.RedisError:
+        return []
+    return [parse_calendar_member(member.decode() if isinstance(member, bytes) else member) for member in members]
+
+
+def day_versions(dates: List[datetime.date]) -> Dict[datetime.date, DayVersions]:
+    """Timetable versions read by the search of each date, fetched with a single Redis call"""
+    if not dates:
+        return {}
+    first = min(dates)
+    date_min = datetime.datetime.combine(first, datetime.time.min, datetime.timezone.utc)
+    date_max = datetime.datetime.combine(max(dates) + datetime.timedelta(days=2), datetime.time.min,
+                                         datetime.timezone.utc)
+    versions = timetable_index.versions(date_min, date_max)
+    return {day: versions[(day - first).days:(day - first).days + 2] for day in dates}
+
+
+def get_fares(args: dict, month: str, versions: Dict[datetime.date, DayVersions]) -> Dict[datetime.date, Optional[float]]:
+    """Stored lowest prices of the given dates, days whose timetable changed since are left out"""
+    dates = list(versions)
+    try:
+        values = redis_client.hmget(_calendar_key(args, month), [day.isoformat() for day in dates])
+    except redis.RedisError:
+        return {}
+
+    fares = {}
+    for day, value in zip(dates, values):
+        if value is None:
+            continue
+        entry = json.loads(value)
+        if [tuple(version) for version in entry['versions']] == versions[day]:
+            fares[day] = entry['price']
+    return fares
+
+
+def store_fares(args: dict, month: str, fares: Dict[datetime.date, Optional[float]],
+                versions: Dict[datetime.date, DayVersions]) -> None:
+    """Store lowest prices tagged with the versions read before they were computed"""
+    if not fares:
+        return
+    key = _calendar_key(args, month)
+    try:
+        pipe = redis_client.pipeline()
+        pipe.hset(key, mapping={
+            day.isoformat(): json.dumps({'price': price, 'versions': versions[day]})
+            for day, price in fares.items()
+        })
+        pipe.expire(key, FARE_CALENDAR_TTL)
+        pipe.execute()
+    except redis.RedisError:
+        pass
@@ -0,0 +1,177 @@
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, exists, func
+from sqlalchemy.orm import aliased
+
+from app.extensions import db
+from app.models.aircraft import Aircraft
+from app.models.airlines import Airline, AirlineAircraft
+from app.models.airport import Airport
+from app.models.booking import BookingDepartureFlight, BookingReturnFlight
+from app.models.flight import Flight, Route
+from app.models.location import City, Nation
+
+# Lightweight read path: flights are read with projection queries into slotted records, so no
+# relationship (bookings, extras, seats...) is loaded unless an endpoint asks for it explicitly
+
+
+class Record:
+    """Fixed set of attributes filled in __slots__ order, marshalled like an object (not a list)"""
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def __repr__(self) -> str:
+        values = ', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)
+        return f'{type(self).__name__}({values})'
+
+
+class NationRow(Record):
+    __slots__ = ('id', 'name', 'code', 'alpha2')
+
+
+class CityRow(Record):
+    __slots__ = ('id', 'name', 'nation')
+
+
+class AirportRow(Record):
+    __slots__ = ('id', 'name', 'iata_code', 'icao_code', 'latitude', 'longitude', 'city_id', 'city')
+
+
+class AircraftRow(Record):
+    __slots__ = ('id', 'name', 'rows', 'columns', 'unavailable_seats')
+
+
+class AirlineAircraftRow(Record):
+    __slots__ = ('id', 'aircraft_id', 'airline_id', 'tail_number', 'aircraft')
+
+
+class AirlineRow(Record):
+    __slots__ = ('id', 'name', 'first_class_description', 'business_class_description', 'economy_class_description')
+
+
+class FlightListRow(Record):
+    """Flight of an airline listing"""
+    __slots__ = ('id', 'flight_number', 'route_id', 'departure_time', 'arrival_time', 'fully_booked',
+                 'departure_airport', 'arrival_airport', 'aircraft', 'is_editable')
+
+
+class FlightDetailRow(Record):
+    """Public description of a flight"""
+    __slots__ = ('id', 'flight_number', 'departure_time', 'arrival_time', 'price_first_class',
+                 'price_business_class', 'price_economy_class', 'price_insurance', 'airline', 'departure_airport',
+                 'arrival_airport')
+
+
+DepartureAirport = aliased(Airport)
+ArrivalAirport = aliased(Airport)
+DepartureCity = aliased(City)
+ArrivalCity = aliased(City)
+DepartureNation = aliased(Nation)
+ArrivalNation = aliased(Nation)
+
+_AIRPORT_COLUMNS = len(AirportRow.__slots__) + 5  # The city is two columns and its nation four
+
+
+def _airport_columns(airport, city, nation) -> tuple:
+    return (airport.id, airport.name, airport.iata_code, airport.icao_code, airport.latitude, airport.longitude,
+            airport.city_id, city.id, city.name, nation.id, nation.name, nation.code, nation.alpha2)
+
+
+def _airport(row, start: int) -> AirportRow:
+    values = row[start:start + _AIRPORT_COLUMNS]
+    # The nation of a city is optional
+    nation = NationRow(*values[9:]) if values[9] is not None else None
+    return AirportRow(*values[:7], CityRow(*values[7:9], nation))
+
+
+def _with_airports(query):
+    return query.join(Route, Flight.route_id == Route.id) \
+        .join(DepartureAirport, Route.departure_airport_id == DepartureAirport.id) \
+        .join(DepartureCity, DepartureAirport.city_id == DepartureCity.id) \
+        .outerjoin(DepartureNation, DepartureCity.nation_id == DepartureNation.id) \
+        .join(ArrivalAirport, Route.arrival_airport_id == ArrivalAirport.id) \
+        .join(ArrivalCity, ArrivalAirport.city_id == ArrivalCity.id) \
+        .outerjoin(ArrivalNation, ArrivalCity.nation_id == ArrivalNation.id)
+
+
+def airline_flight_page(airline_id, offset: int, limit: int) -> Tuple[int, List[FlightListRow]]:
+    """Number of flights of an airline and one page of them, ordered by departure time then id so pages never overlap"""
+    total = db.session.query(func.count(Flight.id)) \
+        .join(Route, Flight.route_id == Route.id) \
+        .filter(Route.airline_id == airline_id).scalar()
+    if not total:
+        return 0, []
+
+    # A flight stays editable until it is booked
+    is_editable = and_(
+        ~exists().where(BookingDepartureFlight.flight_id == Flight.id),
+        ~exists().where(BookingReturnFlight.flight_id == Flight.id),
+    )
+    rows = _with_airports(db.session.query(
+        Flight.id,
+        Route.flight_number,
+        Flight.route_id,
+        Flight.departure_time,
+        Flight.arrival_time,
+        Flight.fully_booked,
+        *_airport_columns(DepartureAirport, DepartureCity, DepartureNation),
+        *_airport_columns(ArrivalAirport, ArrivalCity, ArrivalNation),
+        AirlineAircraft.id,
+        AirlineAircraft.aircraft_id,
+        AirlineAircraft.airline_id,
+        AirlineAircraft.tail_number,
+        Aircraft.id,
+        Aircraft.name,
+        Aircraft.rows,
+        Aircraft.columns,
+        Aircraft.unavailable_seats,
+        is_editable,
+    )).join(AirlineAircraft, Flight.aircraft_id == AirlineAircraft.id) \
+        .join(Aircraft, AirlineAircraft.aircraft_id == Aircraft.id) \
+        .filter(Route.airline_id == airline_id) \
+        .order_by(Flight.departure_time, Flight.id) \
+        .offset(offset).limit(limit).all()
+
+    aircraft_start = 6 + 2 * _AIRPORT_COLUMNS
+    return total, [FlightListRow(
+        *row[:6],
+        _airport(row, 6),
+        _airport(row, 6 + _AIRPORT_COLUMNS),
+        AirlineAircraftRow(*row[aircraft_start:aircraft_start + 4],
+                           AircraftRow(*row[aircraft_start + 4:aircraft_start + 9])),
+        row[aircraft_start + 9],
+    ) for row in rows]
+
+
+def flight_detail(flight_id) -> Optional[FlightDetailRow]:
+    """Public description of a flight, None if it does not exist"""
+    row = _with_airports(db.session.query(
+        Flight.id,
+        Route.flight_number,
+        Flight.departure_time,
+        Flight.arrival_time,
+        Flight.price_first_class,
+        Flight.price_business_class,
+        Flight.price_economy_class,
+        Flight.price_insurance,
+        Airline.id,
+        Airline.name,
+        Airline.first_class_description,
+        Airline.business_class_description,
+        Airline.economy_class_description,
+        *_airport_columns(DepartureAirport, DepartureCity, DepartureNation),
+        *_airport_columns(ArrivalAirport, ArrivalCity, ArrivalNation),
+    )).join(Airline, Route.airline_id == Airline.id) \
+        .filter(Flight.id == flight_id).first()
+    if row is None:
+        return None
+
+    return FlightDetailRow(
+        *row[:8],
+        AirlineRow(*row[8:13]),
+        _airport(row, 13),
+        _airport(row, 13 + _AIRPORT_COLUMNS),
+    )
@@ -0,0 +1,184 @@
+import base64
+import binascii
+import datetime
+import hashlib
+import json
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+import redis
+
+from app.core.timetable import timetable_index
+from app.extensions import redis_client
+
+SEARCH_CACHE_KEY = 'search:{kind}:{digest}'
+SEARCH_CACHE_TTL = 900  # seconds, versions already invalidate stale results
+SEARCH_LOCK_TTL = 30  # seconds, upper bound of a single search computation
+SEARCH_POLL_INTERVAL = 0.05  # seconds between two reads of a result computed by another worker
+
+# Parsed arguments that do not change the result set, only the page returned
+PAGINATION_ARGS = ('page_number', 'limit', 'cursor', 'user_id')
+# Journeys are cached unsorted, every order is selected from the same entry
+ORDER_ARGS = ('order_by', 'order_by_desc')
+
+# Deletes the lock only if it is still owned by the caller
+RELEASE_LOCK_SCRIPT = redis_client.register_script("""
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+""")
+
+
+def search_cache_key(args: dict, date_min: datetime.datetime, date_max: datetime.datetime,
+                     booked_flight_ids: Optional[Iterable[bytes]] = None, kind: str = 'flights') -> str:
+    """
+    Key of a search result: the normalized parsed arguments, the timetable versions of the
+    days the search reads and the flights excluded for the user. Any flight change on those
+    days bumps a version, so stale results are never read back.
+    """
+    normalized = {name: value for name, value in args.items() if name not in PAGINATION_ARGS + ORDER_ARGS}
+    payload = json.dumps({
+        'args': normalized,
+        'versions': timetable_index.versions(date_min, date_max),
+        'booked': sorted(flight_id.hex() for flight_id in booked_flight_ids or ()),
+    }, sort_keys=True, default=str)
+    return SEARCH_CACHE_KEY.format(kind=kind, digest=hashlib.sha1(payload.encode()).hexdigest())
+
+
+def get_cached(key: str) -> Optional[Any]:
+    """Result of a previous identical search, None on a miss"""
+    try:
+        cached = redis_client.get(key)
+    except redis.RedisError:
+        return None
+    return json.loads(cached) if cached else None
+
+
+def set_cached(key: str, value: Any, ttl: int = SEARCH_CACHE_TTL) -> None:
+    try:
+        redis_client.set(key, json.dumps(value), ex=ttl)
+    except redis.RedisError:
+        pass
+
+
+class _InFlight:
+    """Search being computed by a thread of this process"""
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+_in_flight: Dict[str, _InFlight] = {}
+_in_flight_lock = threading.Lock()
+
+
+def cached_search(key: str, compute: Callable[[], Any], ttl: int = SEARCH_CACHE_TTL) -> Any:
+    """
+    Cached result of a search, computed once for every concurrent identical request.
+    Threads of the same process wait on the first caller, then workers coordinate through
+    a Redis lock: the owner computes and stores the result key, the others poll it.
+    `compute` must return a JSON serializable value.
+    """
+    cached = get_cached(key)
+    if cached is not None:
+        return cached
+
+    with _in_flight_lock:
+        call = _in_flight.get(key)
+        owner = call is None
+        if owner:
+            call = _in_flight[key] = _InFlight()
+
+    if not owner:
+        if call.event.wait(SEARCH_LOCK_TTL):
+            if call.error is not None:
+                raise call.error
+            return call.result
+        # The first caller outlived its lock, take over through the Redis lock like any other worker
+        return _compute_once(key, compute, ttl)
+
+    try:
+        call.result = _compute_once(key, compute, ttl)
+        return call.result
+    except BaseException as e:
+        call.error = e
+        raise
+    finally:
+        with _in_flight_lock:
+            _in_flight.pop(key, None)
+        call.event.set()
+
+
+def _compute_once(key: str, compute: Callable[[], Any], ttl: int) -> Any:
+    lock_key = key + ':lock'
+    token = uuid.uuid4().hex
+    while not _acquire_lock(lock_key, token):
+        # Another worker is computing the same search, wait for its result. Once its lock is gone
+        # (failed or expired owner) the waiters race for the lock again and a single one computes.
+        cached = _wait_for_result(key, lock_key)
+        if cached is not None:
+            return cached
+
+    try:
+        cached = get_cached(key)  # Stored by an owner that released the lock right before
+        if cached is not None:
+            return cached
+        result = compute()
+        set_cached(key, result, ttl)
+        return result
+    finally:
+        try:
+            RELEASE_LOCK_SCRIPT(keys=[lock_key], args=[token])
+        except redis.RedisError:
+            pass
+
+
+def _acquire_lock(lock_key: str, token: str) -> bool:
+    try:
+        return bool(redis_client.set(lock_key, token, nx=True, ex=SEARCH_LOCK_TTL))
+    except redis.RedisError:
+        return True  # No coordination possible, compute locally
+
+
+def _wait_for_result(key: str, lock_key: str) -> Optional[Any]:
+    """Result stored by the lock owner, None once the lock is released without one"""
+    deadline = time.monotonic() + SEARCH_LOCK_TTL
+    while time.monotonic() < deadline:
+        time.sleep(SEARCH_POLL_INTERVAL)
+        cached = get_cached(key)
+        if cached is not None:
+            return cached
+        try:
+            if not redis_client.exists(lock_key):
+                break
+        except redis.RedisError:
+            break
+    return None
+
+
+def _search_fingerprint(args: dict) -> str:
+    normalized = {name: value for name, value in args.items() if name not in PAGINATION_ARGS}
+    return hashlib.sha1(json.dumps(normalized, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def encode_cursor(args: dict, last_key: Tuple) -> str:
+    """Opaque cursor resuming a search right after the journey with the given sort key"""
+    payload = json.dumps({'search': _search_fingerprint(args), 'after': list(last_key)})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str, args: dict) -> Optional[Tuple]:
+    """Sort key stored in a cursor, None if the cursor is malformed or belongs to another search"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if payload['search'] != _search_fingerprint(args):
+            return None
+        return tuple(payload['after'])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        return None
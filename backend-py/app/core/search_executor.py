@@ -0,0 +1,90 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from typing import Any, Callable, List, Optional, Sequence
+
+from flask import current_app, Flask
+
+from app.core.timetable import timetable_index
+from app.extensions import db
+
+# One pool per web worker process, forked by start_search_executor before the server starts its threads
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def _init_search_process(app: Flask) -> None:
+    """Prepare a forked search process: own app context, DB connections and index lock"""
+    app.app_context().push()
+    # Connections inherited from the parent must not be shared across processes
+    db.engine.dispose(close=False)
+    timetable_index._lock = threading.Lock()
+
+
+def _noop() -> None:
+    pass
+
+
+def start_search_executor(app: Flask) -> None:
+    """
+    Fork the search processes of this worker, when SEARCH_WORKERS is set. Must run while the process
+    is still single threaded (app start, post-fork hook), forking from a request thread could copy
+    locks held by other threads.
+    """
+    global _executor
+    workers = app.config.get('SEARCH_WORKERS', 0)
+    if workers <= 0 or _executor is not None:
+        return
+    # Forked processes inherit the loaded modules and the memory-mapped snapshot pages
+    _executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('fork'),
+        initializer=_init_search_process,
+        initargs=(app,),
+    )
+    # With the fork context every process is started by the first submit
+    _executor.submit(_noop).result()
+
+
+def get_search_executor() -> Optional[ProcessPoolExecutor]:
+    """Process pool used to fan searches out across cores, None when it was not started"""
+    return _executor
+
+
+def search_deadline(budget: Optional[float] = None) -> float:
+    """time.monotonic() at which the searches of the current request stop, SEARCH_BUDGET_SECONDS from now"""
+    if budget is None:
+        budget = current_app.config.get('SEARCH_BUDGET_SECONDS', 10)
+    # The monotonic clock is system-wide on Linux, so the forked search processes share the deadline
+    return time.monotonic() + budget
+
+
+def run_searches(fn: Callable, tasks: Sequence[tuple], budget: Optional[float] = None) -> List[Any]:
+    """
+    Run fn(*task, deadline=...) for every task and return the results in task order. Tasks are
+    spread over the search processes when SEARCH_WORKERS is set, otherwise run inline one after
+    the other. A running task cannot be cancelled, so fn must stop by itself once time.monotonic()
+    passes the deadline (the search engine checks it between rounds). Tasks not started or not
+    finished within the request budget (SEARCH_BUDGET_SECONDS) yield None.
+    """
+    deadline = search_deadline(budget)
+
+    executor = get_search_executor()
+    if executor is None or len(tasks) <= 1:
+        results = []
+        for task in tasks:
+            results.append(fn(*task, deadline=deadline) if time.monotonic() < deadline else None)
+        return results
+
+    futures = [executor.submit(fn, *task, deadline=deadline) for task in tasks]
+    wait(futures, timeout=max(deadline - time.monotonic(), 0))
+
+    results = []
+    for future in futures:
+        if future.done() and not future.cancelled():
+            results.append(future.result())
+        else:
+            # Only drops queued tasks, running ones return at their next deadline check
+            future.cancel()
+            results.append(None)
+    return results
@@ -0,0 +1,179 @@
+import datetime
+import uuid
+from typing import List, Optional
+
+from app.core.seat_map import BUMP_VERSION_LUA, SEAT_HOLDS_KEY, SEAT_MAP_KEY, SEAT_MAP_LOG_KEY, \
+    SEAT_MAP_VERSION_KEY, SeatLayout, ensure_seat_map
+from app.extensions import redis_client
+from app.models.common import ClassType
+
+# Seat sessions live in Redis only, Postgres is written when the booking is confirmed.
+# Hash of user_id, start, end and one `seat:<flight_id>` -> `<seat_number>:<class>` field per held seat
+SEAT_SESSION_KEY = 'seat_session:{session_id}'
+# Active session of a user
+SEAT_SESSION_USER_KEY = 'seat_session:user:{user_id}'
+SEAT_SESSION_DURATION = datetime.timedelta(minutes=15)  # 13 for the user to book
+# HEXPIREAT, used to expire a held seat on its own, is available from Redis 7.4
+MIN_REDIS_VERSION = (7, 4)
+
+
+def check_redis_version():
+    """Fails fast when the Redis server cannot expire hash fields"""
+    version = redis_client.info('server')['redis_version']
+    if tuple(int(part) for part in version.split('.')[:2]) < MIN_REDIS_VERSION:
+        raise RuntimeError(f'Seat holds need Redis >= {".".join(map(str, MIN_REDIS_VERSION))}, found {version}')
+
+
+# Holds a seat for a session, the seat must be neither booked nor held by another session.
+# Returns 1 when held, 0 when taken, -1 when the session expired, -2 when the session already holds
+# a seat on the flight and -3 when the flight's seat map has to be rebuilt first
+CLAIM_SEAT_SCRIPT = redis_client.register_script(BUMP_VERSION_LUA + """
+local session_end = redis.call('hget', KEYS[1], 'end')
+if not session_end then
+    return -1
+end
+if redis.call('exists', KEYS[3]) == 0 then
+    return -3
+end
+if redis.call('getbit', KEYS[3], ARGV[5]) == 1 then
+    return 0
+end
+local holder = redis.call('hget', KEYS[2], ARGV[2])
+if holder and holder ~= ARGV[1] then
+    return 0
+end
+local field = 'seat:' .. ARGV[3]
+if redis.call('hexists', KEYS[1], field) == 1 then
+    return -2
+end
+redis.call('hset', KEYS[2], ARGV[2], ARGV[1])
+redis.call('hexpireat', KEYS[2], session_end, 'FIELDS', 1, ARGV[2])
+redis.call('hset', KEYS[1], field, ARGV[2] .. ':' .. ARGV[4])
+bump(KEYS[4], KEYS[5], 'hold ' .. ARGV[2])
+return 1
+""")
+
+# Drops a session and the holds it still owns. Hold, version and log keys are derived from the session
+# fields, so the whole release is a single atomic step
+RELEASE_SESSION_SCRIPT = redis_client.register_script(BUMP_VERSION_LUA + """
+local fields = redis.call('hgetall', KEYS[1])
+for i = 1, #fields, 2 do
+    if string.sub(fields[i], 1, 5) == 'seat:' then
+        local holds = ARGV[2] .. string.sub(fields[i], 6)
+        local seat = string.match(fields[i + 1], '^(.*):[^:]*$')
+        if redis.call('hget', holds, seat) == ARGV[1] then
+            redis.call('hdel', holds, seat)
+            local flight = string.sub(fields[i], 6)
+            bump(ARGV[3] .. flight .. ARGV[4], ARGV[5] .. flight .. ARGV[6], 'release ' .. seat)
+        end
+    end
+end
+redis.call('del', KEYS[1])
+if redis.call('get', KEYS[2]) == ARGV[1] then
+    redis.call('del', KEYS[2])
+end
+return 1
+""")
+
+CLAIM_HELD = 1
+CLAIM_TAKEN = 0
+CLAIM_EXPIRED = -1
+CLAIM_ALREADY_SELECTED = -2
+CLAIM_NO_SEAT_MAP = -3
+
+
+class HeldSeat:
+    __slots__ = ('flight_id', 'seat_number', 'class_type')
+
+    def __init__(self, flight_id: uuid.UUID, seat_number: str, class_type: ClassType):
+        self.flight_id = flight_id
+        self.seat_number = seat_number
+        self.class_type = class_type
+
+
+class HoldSession:
+    """Seat session read back from Redis, marshalled like the former SeatSession rows"""
+    __slots__ = ('id', 'user_id', 'session_start_time', 'session_end_time', 'seats')
+
+    def __init__(self, session_id: uuid.UUID, user_id: str, session_start_time: datetime.datetime,
+                 session_end_time: datetime.datetime, seats: List[HeldSeat]):
+        self.id = session_id
+        self.user_id = user_id
+        self.session_start_time = session_start_time
+        self.session_end_time = session_end_time
+        self.seats = seats
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _timestamp(value) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(int(_decode(value)), datetime.UTC)
+
+
+def _holds_prefix() -> str:
+    return SEAT_HOLDS_KEY.format(flight_id='')
+
+
+def get_session(session_id) -> Optional[HoldSession]:
+    """Session with its held seats, None once it expired or was released"""
+    fields = {_decode(name): _decode(value)
+              for name, value in redis_client.hgetall(SEAT_SESSION_KEY.format(session_id=session_id)).items()}
+    if 'end' not in fields:
+        return None
+
+    seats = []
+    for name, value in fields.items():
+        if name.startswith('seat:'):
+            seat_number, class_name = value.rsplit(':', 1)
+            seats.append(HeldSeat(uuid.UUID(name[5:]), seat_number, ClassType[class_name]))
+    return HoldSession(uuid.UUID(str(session_id)), fields['user_id'], _timestamp(fields['start']),
+                       _timestamp(fields['end']), seats)
+
+
+def get_user_session(user_id) -> Optional[HoldSession]:
+    session_id = redis_client.get(SEAT_SESSION_USER_KEY.format(user_id=user_id))
+    return get_session(_decode(session_id)) if session_id else None
+
+
+def create_session(user_id) -> HoldSession:
+    """New session of a user, the previous one and its holds are released"""
+    previous = redis_client.get(SEAT_SESSION_USER_KEY.format(user_id=user_id))
+    if previous:
+        release_session(_decode(previous), user_id)
+
+    session_id = uuid.uuid4()
+    # Whole seconds, hold fields expire on the same second as their session
+    start = datetime.datetime.now(datetime.UTC).replace(microsecond=0)
+    end = start + SEAT_SESSION_DURATION
+    key = SEAT_SESSION_KEY.format(session_id=session_id)
+    pipe = redis_client.pipeline()
+    pipe.hset(key, mapping={'user_id': str(user_id), 'start': int(start.timestamp()), 'end': int(end.timestamp())})
+    pipe.expireat(key, end)
+    pipe.set(SEAT_SESSION_USER_KEY.format(user_id=user_id), str(session_id), exat=end)
+    pipe.execute()
+    return HoldSession(session_id, str(user_id), start, end, [])
+
+
+def claim_seat(session_id, flight, layout: SeatLayout, seat_number: str) -> int:
+    """Atomically hold a seat of a flight for a session, returns one of the CLAIM_* codes"""
+    keys = [SEAT_SESSION_KEY.format(session_id=session_id), SEAT_HOLDS_KEY.format(flight_id=flight.id),
+            SEAT_MAP_KEY.format(flight_id=flight.id, digest=layout.digest),
+            SEAT_MAP_VERSION_KEY.format(flight_id=flight.id), SEAT_MAP_LOG_KEY.format(flight_id=flight.id)]
+    args = [str(session_id), seat_number, str(flight.id), layout.class_of(seat_number).name,
+            layout.positions[seat_number]]
+    result = CLAIM_SEAT_SCRIPT(keys=keys, args=args)
+    if result == CLAIM_NO_SEAT_MAP:
+        ensure_seat_map(flight, layout)
+        result = CLAIM_SEAT_SCRIPT(keys=keys, args=args)
+    return result
+
+
+def release_session(session_id, user_id) -> None:
+    RELEASE_SESSION_SCRIPT(
+        keys=[SEAT_SESSION_KEY.format(session_id=session_id), SEAT_SESSION_USER_KEY.format(user_id=user_id)],
+        args=[str(session_id), _holds_prefix(), *SEAT_MAP_VERSION_KEY.split('{flight_id}'),
+              *SEAT_MAP_LOG_KEY.split('{flight_id}')],
+    )
+
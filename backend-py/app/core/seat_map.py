@@ -0,0 +1,317 @@
+import base64
+import hashlib
+import json
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from app.extensions import db, redis_client
+from app.models.aircraft import Aircraft
+from app.models.airlines import AirlineAircraft, AirlineAircraftSeat
+from app.models.common import ClassType
+
+# Seats of an AirlineAircraft in bitmap order: digest, rows and JSON list of [seat_number, class]
+SEAT_LAYOUT_KEY = 'seat_layout:{aircraft_id}'
+# Booked seats of a flight, bit i is the i-th seat of the layout with the given digest
+SEAT_MAP_KEY = 'seat_map:{flight_id}:{digest}'
+# Bumped on every hold, release, booking and cancellation of a flight
+SEAT_MAP_VERSION_KEY = 'seat_map_version:{flight_id}'
+# Bumped only by bookings and cancellations, guards the store of a map rebuilt from Postgres
+SEAT_MAP_BOOKINGS_KEY = 'seat_map_bookings:{flight_id}'
+# Latest changes of a flight, newest first: one `<version> <book|cancel|hold|release> <seats>` entry per version
+SEAT_MAP_LOG_KEY = 'seat_map_log:{flight_id}'
+SEAT_MAP_LOG_SIZE = 200
+# Hash of seat_number -> session_id per flight, every field expires with its session (HEXPIREAT)
+SEAT_HOLDS_KEY = 'seat_holds:{flight_id}'
+SEAT_MAP_TTL = 7 * 24 * 3600  # seconds, idle maps are rebuilt from Postgres
+SEAT_LAYOUT_TTL = 24 * 3600  # seconds
+
+# Stores a map built from Postgres unless a booking or cancellation happened since its counter was read
+STORE_SEAT_MAP_SCRIPT = redis_client.register_script("""
+local version = redis.call('get', KEYS[2]) or '0'
+if version ~= ARGV[1] then
+    return 0
+end
+redis.call('set', KEYS[1], ARGV[2], 'NX', 'EX', ARGV[3])
+return 1
+""")
+
+# Lua prelude of the scripts changing a seat map: bumps the flight's version and logs the change under it
+BUMP_VERSION_LUA = """
+local function bump(version_key, log_key, entry)
+    local version = redis.call('incr', version_key)
+    redis.call('expire', version_key, {ttl})
+    redis.call('lpush', log_key, version .. ' ' .. entry)
+    redis.call('ltrim', log_key, 0, {size} - 1)
+    redis.call('expire', log_key, {ttl})
+    return version
+end
+""".format(ttl=SEAT_MAP_TTL, size=SEAT_MAP_LOG_SIZE)
+
+# Sets (or clears) the bits of booked (or cancelled) seats, a missing map is rebuilt on its next read
+MARK_SEATS_SCRIPT = redis_client.register_script(BUMP_VERSION_LUA + """
+bump(KEYS[2], KEYS[3], ARGV[2] .. ' ' .. ARGV[3])
+redis.call('incr', KEYS[4])
+redis.call('expire', KEYS[4], {ttl})
+if redis.call('exists', KEYS[1]) == 1 then
+    for i = 4, #ARGV do
+        redis.call('setbit', KEYS[1], ARGV[i], ARGV[1])
+    end
+end
+return 1
+""".format(ttl=SEAT_MAP_TTL))
+
+_CLASS_ORDER = {class_type: order for order, class_type in enumerate(ClassType)}
+
+
+def _seat_order(seat: Tuple[str, ClassType]):
+    """Classes from first to economy, then row and letter"""
+    match = re.match(r'^(\d+)(.*)$', seat[0])
+    row, letter = (int(match.group(1)), match.group(2)) if match else (0, seat[0])
+    return _CLASS_ORDER[seat[1]], row, letter
+
+
+class SeatLayout:
+    """Ordered seats of an aircraft, each class is a contiguous range of positions"""
+    __slots__ = ('digest', 'seats', 'rows', 'positions', 'classes')
+
+    def __init__(self, seats: List[Tuple[str, ClassType]], rows: int):
+        self.seats = seats
+        self.rows = rows
+        self.positions: Dict[str, int] = {seat_number: position for position, (seat_number, _) in enumerate(seats)}
+        self.classes: Dict[ClassType, Tuple[int, int]] = {}
+        for position, (_, class_type) in enumerate(seats):
+            start, _ = self.classes.get(class_type, (position, position))
+            self.classes[class_type] = (start, position + 1)
+        payload = json.dumps([rows, [[seat_number, class_type.name] for seat_number, class_type in seats]])
+        self.digest = hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+    def __len__(self) -> int:
+        return len(self.seats)
+
+    def class_of(self, seat_number: str) -> Optional[ClassType]:
+        position = self.positions.get(seat_number)
+        return None if position is None else self.seats[position][1]
+
+    def class_seats(self, class_type: ClassType) -> List[str]:
+        start, end = self.classes.get(class_type, (0, 0))
+        return [seat_number for seat_number, _ in self.seats[start:end]]
+
+
+# Layouts parsed by this process, identical layouts of different aircraft are shared
+_layouts: Dict[str, SeatLayout] = {}
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def seat_layout(aircraft_id) -> SeatLayout:
+    """Layout of an AirlineAircraft, read from Postgres once and then from Redis"""
+    key = SEAT_LAYOUT_KEY.format(aircraft_id=aircraft_id)
+    digest = redis_client.hget(key, 'digest')
+    if digest is not None:
+        layout = _layouts.get(_decode(digest))
+        if layout is not None:
+            return layout
+        rows, seats = redis_client.hmget(key, ['rows', 'seats'])
+        if seats is not None:
+            layout = SeatLayout([(seat_number, ClassType[class_name]) for seat_number, class_name in json.loads(seats)],
+                                int(rows or 0))
+            return _layouts.setdefault(layout.digest, layout)
+
+    seats = db.session.query(AirlineAircraftSeat.seat_number, AirlineAircraftSeat.class_type) \
+        .filter(AirlineAircraftSeat.airline_aircraft_id == aircraft_id).all()
+    rows = db.session.query(Aircraft.rows).join(AirlineAircraft, AirlineAircraft.aircraft_id == Aircraft.id) \
+        .filter(AirlineAircraft.id == aircraft_id).scalar()
+    layout = SeatLayout(sorted(((seat_number, class_type) for seat_number, class_type in seats), key=_seat_order),
+                        rows or 0)
+    pipe = redis_client.pipeline()
+    pipe.hset(key, mapping={
+        'digest': layout.digest,
+        'rows': layout.rows,
+        'seats': json.dumps([[seat_number, class_type.name] for seat_number, class_type in layout.seats]),
+    })
+    pipe.expire(key, SEAT_LAYOUT_TTL)
+    pipe.execute()
+    return _layouts.setdefault(layout.digest, layout)
+
+
+def invalidate_layout(aircraft_id) -> None:
+    """Drop the cached layout of an aircraft whose seats changed, maps of the old layout are left to expire"""
+    redis_client.delete(SEAT_LAYOUT_KEY.format(aircraft_id=aircraft_id))
+
+
+def _bit(bitmap: bytes, position: int) -> bool:
+    # Redis bit 0 is the most significant bit of the first byte
+    return position >> 3 < len(bitmap) and bool(bitmap[position >> 3] & (0x80 >> (position & 7)))
+
+
+def _popcount(bitmap: bytes, start: int, end: int) -> int:
+    if start >= end:
+        return 0
+    value = int.from_bytes(bitmap.ljust((end + 7) >> 3, b'\0')[:(end + 7) >> 3], 'big')
+    return (value >> (-end & 7) & ((1 << (end - start)) - 1)).bit_count()
+
+
+class SeatMap:
+    """Booked seats of a flight as a bitmap over its layout, with the live holds on top"""
+    __slots__ = ('layout', 'bitmap', 'held', 'version')
+
+    def __init__(self, layout: SeatLayout, bitmap: bytes, held: Set[str], version: int):
+        self.layout = layout
+        self.bitmap = bitmap
+        self.held = held
+        self.version = version
+
+    def is_booked(self, seat_number: str) -> bool:
+        position = self.layout.positions.get(seat_number)
+        return position is not None and _bit(self.bitmap, position)
+
+    def is_taken(self, seat_number: str) -> bool:
+        return seat_number in self.held or self.is_booked(seat_number)
+
+    def booked_seats(self) -> List[str]:
+        return [seat_number for position, (seat_number, _) in enumerate(self.layout.seats) if _bit(self.bitmap, position)]
+
+    def taken_seats(self) -> List[str]:
+        """Booked seats, then seats held by live sessions"""
+        booked = self.booked_seats()
+        booked_set = set(booked)
+        return booked + [seat_number for seat_number in self.held
+                         if seat_number in self.layout.positions and seat_number not in booked_set]
+
+    def booked_by_class(self) -> Dict[ClassType, int]:
+        return {class_type: _popcount(self.bitmap, start, end) for class_type, (start, end) in self.layout.classes.items()}
+
+    def available_by_class(self) -> Dict[ClassType, int]:
+        """Seats neither booked nor held, per class"""
+        available = {class_type: end - start - _popcount(self.bitmap, start, end)
+                     for class_type, (start, end) in self.layout.classes.items()}
+        for seat_number in self.held:
+            position = self.layout.positions.get(seat_number)
+            if position is not None and not _bit(self.bitmap, position):
+                available[self.layout.seats[position][1]] -= 1
+        return available
+
+
+def _build_bitmap(layout: SeatLayout, seat_numbers: Iterable[str]) -> bytes:
+    bitmap = bytearray((len(layout) + 7) >> 3)
+    for seat_number in seat_numbers:
+        position = layout.positions.get(seat_number)
+        if position is not None:
+            bitmap[position >> 3] |= 0x80 >> (position & 7)
+    return bytes(bitmap)
+
+
+def ensure_seat_map(flight, layout: SeatLayout) -> bytes:
+    """Bitmap of a flight, rebuilt from its confirmed bookings when it is not in Redis"""
+    key = SEAT_MAP_KEY.format(flight_id=flight.id, digest=layout.digest)
+    bitmap = redis_client.get(key)
+    if bitmap is not None:
+        return bitmap
+
+    # The bookings counter is read before Postgres, a booking committed meanwhile makes the store a
+    # no-op. Holds and releases do not touch it, so they never abort a rebuild
+    bookings_key = SEAT_MAP_BOOKINGS_KEY.format(flight_id=flight.id)
+    bookings = redis_client.get(bookings_key)
+    bitmap = _build_bitmap(layout, flight.booked_seats_confirmed)
+    STORE_SEAT_MAP_SCRIPT(keys=[key, bookings_key], args=[_decode(bookings) if bookings else '0', bitmap, SEAT_MAP_TTL])
+    return bitmap
+
+
+def load_seat_map(flight) -> SeatMap:
+    """Seat map of a flight: layout, booked bitmap and held seats"""
+    layout = seat_layout(flight.aircraft_id)
+    pipe = redis_client.pipeline()
+    pipe.get(SEAT_MAP_KEY.format(flight_id=flight.id, digest=layout.digest))
+    pipe.hkeys(SEAT_HOLDS_KEY.format(flight_id=flight.id))
+    pipe.get(SEAT_MAP_VERSION_KEY.format(flight_id=flight.id))
+    bitmap, held, version = pipe.execute()
+    if bitmap is None:
+        bitmap = ensure_seat_map(flight, layout)
+    return SeatMap(layout, bitmap, {_decode(seat_number) for seat_number in held}, int(version or 0))
+
+
+def occupancy_state(flight_id, aircraft_id) -> Tuple[str, int, List[str]]:
+    """Layout digest, version and held seats of a flight in a single round trip, without its bitmap"""
+    pipe = redis_client.pipeline()
+    pipe.hget(SEAT_LAYOUT_KEY.format(aircraft_id=aircraft_id), 'digest')
+    pipe.get(SEAT_MAP_VERSION_KEY.format(flight_id=flight_id))
+    pipe.hkeys(SEAT_HOLDS_KEY.format(flight_id=flight_id))
+    digest, version, held = pipe.execute()
+    digest = _decode(digest) if digest is not None else seat_layout(aircraft_id).digest
+    return digest, int(version or 0), sorted(_decode(seat_number) for seat_number in held)
+
+
+def occupancy_etag(digest: str, version: int, held: int) -> str:
+    # Expired holds do not bump the version, the number of live holds still changes with them
+    return '"{}.{}.{}"'.format(digest, version, held)
+
+
+def encode_bitmap(bitmap: bytes) -> str:
+    return base64.b64encode(bitmap).decode()
+
+
+def seat_map_changes(flight_id, since: int, version: int) -> Optional[Tuple[List[str], List[str]]]:
+    """
+    Seats booked and cancelled after version `since` up to `version`, from the change log of the
+    flight. None when the log no longer covers that range, the caller then sends the whole map.
+    """
+    if since > version:
+        return None
+    entries = {}
+    for entry in redis_client.lrange(SEAT_MAP_LOG_KEY.format(flight_id=flight_id), 0, -1):
+        entry_version, operation, seats = _decode(entry).split(' ', 2)
+        if since < int(entry_version) <= version:
+            entries[int(entry_version)] = (operation, seats)
+    if len(entries) < version - since:
+        return None
+
+    # The last operation of a seat wins
+    booked = {}
+    for entry_version in sorted(entries):
+        operation, seats = entries[entry_version]
+        if operation in ('book', 'cancel'):
+            for seat_number in filter(None, seats.split(',')):
+                booked[seat_number] = operation == 'book'
+    return (sorted(seat_number for seat_number, is_booked in booked.items() if is_booked),
+            sorted(seat_number for seat_number, is_booked in booked.items() if not is_booked))
+
+
+def _mark_seats(flight_id, aircraft_id, seat_numbers: List[str], booked: bool) -> None:
+    layout = seat_layout(aircraft_id)
+    positions = [layout.positions[seat_number] for seat_number in seat_numbers if seat_number in layout.positions]
+    MARK_SEATS_SCRIPT(
+        keys=[SEAT_MAP_KEY.format(flight_id=flight_id, digest=layout.digest),
+              SEAT_MAP_VERSION_KEY.format(flight_id=flight_id), SEAT_MAP_LOG_KEY.format(flight_id=flight_id),
+              SEAT_MAP_BOOKINGS_KEY.format(flight_id=flight_id)],
+        args=[int(booked), 'book' if booked else 'cancel', ','.join(seat_numbers), *positions],
+    )
+
+
+def reset_seat_maps() -> None:
+    """
+    Drop every booked seat bitmap and change log, used when bookings are deleted in bulk. Versions
+    are bumped rather than deleted, so no occupancy ETag or `since` version of a client matches again
+    """
+    for key in redis_client.scan_iter(match=SEAT_MAP_KEY.format(flight_id='*', digest='*')):
+        redis_client.delete(key)
+    for key in redis_client.scan_iter(match=SEAT_MAP_LOG_KEY.format(flight_id='*')):
+        redis_client.delete(key)
+    # Rebuilds that read Postgres before the bulk delete must not store their maps either
+    for key in [*redis_client.scan_iter(match=SEAT_MAP_VERSION_KEY.format(flight_id='*')),
+                *redis_client.scan_iter(match=SEAT_MAP_BOOKINGS_KEY.format(flight_id='*'))]:
+        pipe = redis_client.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, SEAT_MAP_TTL)
+        pipe.execute()
+
+
+def mark_booked(flight_id, aircraft_id, seat_numbers: List[str]) -> None:
+    """Set the seats of a committed booking"""
+    _mark_seats(flight_id, aircraft_id, seat_numbers, True)
+
+
+def mark_cancelled(flight_id, aircraft_id, seat_numbers: List[str]) -> None:
+    """Clear the seats of a deleted booking"""
+    _mark_seats(flight_id, aircraft_id, seat_numbers, False)
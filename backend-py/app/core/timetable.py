@@ -0,0 +1,346 @@
+import datetime
+import math
+import os
+import threading
+import uuid
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import redis
+from sqlalchemy.orm import aliased
+
+from app.extensions import db, redis_client
+from app.models.airport import Airport
+from app.models.flight import Flight, Route
+from config import Config
+
+# Redis keys shared by every worker so that a change made through one worker
+# invalidates the buckets cached by the others
+TIMETABLE_EPOCH_KEY = 'timetable:epoch'
+TIMETABLE_DAY_KEY = 'timetable:day:{day}'
+
+EARTH_RADIUS_KM = 6371
+
+
+class TimetableAirport:
+    """Airport attributes needed by the search engine"""
+    __slots__ = ('id', 'iata_code', 'city_id', 'latitude', 'longitude')
+
+    def __init__(self, id: int, iata_code: Optional[str], city_id: int, latitude: float, longitude: float):
+        self.id = id
+        self.iata_code = iata_code
+        self.city_id = city_id
+        self.latitude = latitude
+        self.longitude = longitude
+
+
+class TimetableBucket:
+    """
+    Flights departing on a single UTC day stored as one typed array per field
+    (struct of arrays). Flights are grouped by departure airport and sorted by
+    departure time, `offsets` maps an airport to its [start, end) slice of the
+    columns.
+    """
+
+    def __init__(self, day: datetime.date, version: Tuple[int, int]):
+        self.day = day
+        self.version = version
+        self.flight_ids = bytearray()       # 16 bytes per flight (UUID)
+        self.departure = array('i')         # epoch minutes
+        self.arrival = array('i')           # epoch minutes
+        self.route = array('i')
+        self.departure_airport = array('i')
+        self.arrival_airport = array('i')
+        self.price_economy = array('d')
+        self.price_business = array('d')
+        self.price_first = array('d')
+        self.aircraft = array('i')          # position in TimetableIndex.aircraft
+        self.airline = array('i')           # position in TimetableIndex.airlines
+        self.offsets: Dict[int, Tuple[int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.departure)
+
+    def flight_id(self, i: int) -> uuid.UUID:
+        return uuid.UUID(bytes=bytes(self.flight_ids[16 * i:16 * (i + 1)]))
+
+
+class TimetableWindow:
+    """Read-only view over the buckets covering a search window"""
+
+    def __init__(self, buckets: List[TimetableBucket], airports: Dict[int, TimetableAirport],
+                 airlines: List[uuid.UUID], distances: Optional[Dict[Tuple[int, int], float]] = None):
+        self.buckets = buckets
+        self.airports = airports
+        self.airlines = airlines
+        self._distances = distances if distances is not None else {}
+
+    def departures(self, airport_id: int, min_minute: int, max_minute: int) -> Iterator[Tuple[TimetableBucket, int, int]]:
+        """
+        Yield (bucket, start, end) slices of the flights departing from an airport
+        in [min_minute, max_minute). Slices are sorted by departure time, so the
+        bounds are found by binary search instead of scanning the whole airport.
+        """
+        for bucket in self.buckets:
+            bounds = bucket.offsets.get(airport_id)
+            if not bounds:
+                continue
+            start = bisect_left(bucket.departure, min_minute, bounds[0], bounds[1])
+            end = bisect_left(bucket.departure, max_minute, start, bounds[1])
+            if start < end:
+                yield bucket, start, end
+
+    def distance(self, from_airport_id: int, to_airport_id: int) -> Optional[float]:
+        """Great-circle distance in km between two airports, None if an airport is unknown"""
+        key = (from_airport_id, to_airport_id) if from_airport_id < to_airport_id else (to_airport_id, from_airport_id)
+        distance = self._distances.get(key)
+        if distance is None:
+            a = self.airports.get(from_airport_id)
+            b = self.airports.get(to_airport_id)
+            if a is None or b is None:
+                return None
+            distance = self._distances[key] = great_circle_km(a, b)
+        return distance
+
+    def airline_position(self, airline_id) -> int:
+        """Position of an airline in the bucket `airline` column, -1 if it has no flights"""
+        for position, candidate in enumerate(self.airlines):
+            if str(candidate) == str(airline_id):
+                return position
+        return -1
+
+
+def great_circle_km(a: TimetableAirport, b: TimetableAirport) -> float:
+    """Distance between two airports using the Haversine formula"""
+    lat1_rad = math.radians(a.latitude)
+    lat2_rad = math.radians(b.latitude)
+    delta_lat = math.radians(b.latitude - a.latitude)
+    delta_lon = math.radians(b.longitude - a.longitude)
+
+    h = (math.sin(delta_lat / 2) ** 2 +
+         math.cos(lat1_rad) * math.cos(lat2_rad) *
+         math.sin(delta_lon / 2) ** 2)
+    return EARTH_RADIUS_KM * 2 * math.atan2(math.sqrt(h), math.sqrt(1 - h))
+
+
+def to_minutes(value: datetime.datetime) -> int:
+    """Epoch minutes used by the timetable columns"""
+    return int(value.timestamp()) // 60
+
+
+def from_minutes(value: int) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(value * 60, datetime.timezone.utc)
+
+
+def _day_start(day: datetime.date) -> datetime.datetime:
+    return datetime.datetime.combine(day, datetime.time.min, datetime.timezone.utc)
+
+
+def _days_between(date_min: datetime.datetime, date_max: datetime.datetime) -> List[datetime.date]:
+    """UTC days touched by the half-open interval [date_min, date_max)"""
+    first = date_min.astimezone(datetime.timezone.utc).date()
+    last = (date_max - datetime.timedelta(microseconds=1)).astimezone(datetime.timezone.utc).date()
+    return [first + datetime.timedelta(days=i) for i in range((last - first).days + 1)]
+
+
+class TimetableIndex:
+    """
+    Long-lived, per-worker index of bookable flights keyed by departure day.
+    Buckets are served from the published memory-mapped snapshot when its day
+    version is current, otherwise loaded lazily from Postgres the first time a
+    search touches a day. They are reused by every following search until a
+    flight change bumps the day version stored in Redis.
+    """
+
+    def __init__(self, snapshot_dir: Optional[str] = None):
+        self.snapshot_dir = snapshot_dir
+        self._snapshot = None
+        self._buckets: Dict[datetime.date, TimetableBucket] = {}
+        self._airports: Dict[int, TimetableAirport] = {}
+        # Interned ids referenced by position from the bucket columns
+        self.airlines: List[uuid.UUID] = []
+        self.aircraft: List[str] = []
+        self._airline_positions: Dict[uuid.UUID, int] = {}
+        self._aircraft_positions: Dict[str, int] = {}
+        # Airport distances computed once per process, keyed by (smaller id, larger id)
+        self._distances: Dict[Tuple[int, int], float] = {}
+        self._lock = threading.Lock()
+
+    def window(self, date_min: datetime.datetime, date_max: datetime.datetime) -> TimetableWindow:
+        """Return the buckets covering [date_min, date_max), loading the missing or stale ones"""
+        days = _days_between(date_min, date_max)
+        versions = self._remote_versions(days)
+
+        with self._lock:
+            self._refresh_snapshot()
+            self._evict_past()
+            buckets = []
+            for day in days:
+                bucket = self._buckets.get(day)
+                if bucket is None or bucket.version != versions[day]:
+                    bucket = self._snapshot and self._snapshot.bucket(day, versions[day])
+                    if bucket is None:
+                        bucket = self._load_bucket(day, versions[day])
+                    self._buckets[day] = bucket
+                buckets.append(bucket)
+            return TimetableWindow(buckets, self._airports, self.airlines, self._distances)
+
+    def invalidate(self, *times: Optional[datetime.datetime]) -> None:
+        """Drop the buckets containing the given departure times in every worker"""
+        days = {t.astimezone(datetime.timezone.utc).date() for t in times if t is not None}
+        if not days:
+            return
+        with self._lock:
+            for day in days:
+                self._buckets.pop(day, None)
+        try:
+            pipe = redis_client.pipeline()
+            for day in days:
+                pipe.incr(TIMETABLE_DAY_KEY.format(day=day.isoformat()))
+            pipe.execute()
+        except redis.RedisError:
+            pass
+
+    def invalidate_all(self) -> None:
+        """Drop every bucket, e.g. after a route change that affects many days"""
+        with self._lock:
+            self._buckets.clear()
+            self._airports.clear()
+            self._distances.clear()
+        try:
+            redis_client.incr(TIMETABLE_EPOCH_KEY)
+        except redis.RedisError:
+            pass
+
+    def versions(self, date_min: datetime.datetime, date_max: datetime.datetime) -> List[Tuple[int, int]]:
+        """Current versions of the days covering [date_min, date_max), used to tag results derived from them"""
+        days = _days_between(date_min, date_max)
+        versions = self._remote_versions(days)
+        return [versions[day] for day in days]
+
+    def _remote_versions(self, days: Iterable[datetime.date]) -> Dict[datetime.date, Tuple[int, int]]:
+        days = list(days)
+        keys = [TIMETABLE_EPOCH_KEY] + [TIMETABLE_DAY_KEY.format(day=day.isoformat()) for day in days]
+        try:
+            values = redis_client.mget(keys)
+        except redis.RedisError:
+            values = [None] * len(keys)
+        epoch = int(values[0] or 0)
+        return {day: (epoch, int(value or 0)) for day, value in zip(days, values[1:])}
+
+    def _refresh_snapshot(self) -> None:
+        """Switch to the latest published snapshot generation, if it changed"""
+        from app.core.timetable_snapshot import TimetableSnapshot, current_snapshot_name
+
+        if not self.snapshot_dir:
+            return
+        name = current_snapshot_name(self.snapshot_dir)
+        if name is None or (self._snapshot and self._snapshot.name == name):
+            return
+        try:
+            snapshot = TimetableSnapshot(os.path.join(self.snapshot_dir, name))
+        except (OSError, ValueError):
+            return
+
+        # Bucket columns reference the interned ids by position, so the snapshot lists become
+        # the prefix of this index and the buckets interned in the previous lists are dropped
+        self._snapshot = snapshot
+        self._buckets = {}
+        self._airports = {**self._airports, **snapshot.airports}
+        self.airlines = list(snapshot.airlines)
+        self.aircraft = list(snapshot.aircraft)
+        self._airline_positions = {value: position for position, value in enumerate(self.airlines)}
+        self._aircraft_positions = {value: position for position, value in enumerate(self.aircraft)}
+
+    def _evict_past(self) -> None:
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+        for day in [day for day in self._buckets if day < today]:
+            del self._buckets[day]
+
+    def _intern(self, value, values: list, positions: dict) -> int:
+        position = positions.get(value)
+        if position is None:
+            position = positions[value] = len(values)
+            values.append(value)
+        return position
+
+    def _load_bucket(self, day: datetime.date, version: Tuple[int, int]) -> TimetableBucket:
+        """
+        Load all bookable flights departing on the given day into a columnar bucket.
+        A single projected query returns plain tuples already ordered by departure
+        airport and time, so the columns and offsets are filled in one pass.
+        """
+        bucket = TimetableBucket(day, version)
+
+        departure_airport = aliased(Airport)
+        arrival_airport = aliased(Airport)
+        rows = db.session.query(
+            Flight.id,
+            Flight.departure_time,
+            Flight.arrival_time,
+            Flight.price_economy_class,
+            Flight.price_business_class,
+            Flight.price_first_class,
+            Flight.aircraft_id,
+            Route.id,
+            Route.airline_id,
+            departure_airport.id,
+            departure_airport.iata_code,
+            departure_airport.city_id,
+            departure_airport.latitude,
+            departure_airport.longitude,
+            arrival_airport.id,
+            arrival_airport.iata_code,
+            arrival_airport.city_id,
+            arrival_airport.latitude,
+            arrival_airport.longitude,
+        ).join(
+            Route, Flight.route_id == Route.id
+        ).join(
+            departure_airport, Route.departure_airport_id == departure_airport.id
+        ).join(
+            arrival_airport, Route.arrival_airport_id == arrival_airport.id
+        ).filter(
+            Flight.departure_time >= _day_start(day),
+            Flight.departure_time < _day_start(day + datetime.timedelta(days=1)),
+            Flight.fully_booked == False,
+        ).order_by(
+            Route.departure_airport_id, Flight.departure_time
+        ).all()
+
+        # Rows are grouped by departure airport so each airport owns a contiguous slice of the columns
+        start = 0
+        current_airport = None
+        for (flight_id, departure_time, arrival_time, price_economy, price_business, price_first, aircraft_id,
+             route_id, airline_id, *airports) in rows:
+            departure_airport_id = airports[0]
+            arrival_airport_id = airports[5]
+            if departure_airport_id != current_airport:
+                if current_airport is not None:
+                    bucket.offsets[current_airport] = (start, len(bucket))
+                current_airport = departure_airport_id
+                start = len(bucket)
+                if departure_airport_id not in self._airports:
+                    self._airports[departure_airport_id] = TimetableAirport(*airports[:5])
+            if arrival_airport_id not in self._airports:
+                self._airports[arrival_airport_id] = TimetableAirport(*airports[5:])
+
+            bucket.flight_ids += flight_id.bytes
+            bucket.departure.append(to_minutes(departure_time))
+            bucket.arrival.append(to_minutes(arrival_time))
+            bucket.route.append(route_id)
+            bucket.departure_airport.append(departure_airport_id)
+            bucket.arrival_airport.append(arrival_airport_id)
+            bucket.price_economy.append(price_economy)
+            bucket.price_business.append(price_business)
+            bucket.price_first.append(price_first)
+            bucket.aircraft.append(self._intern(str(aircraft_id), self.aircraft, self._aircraft_positions))
+            bucket.airline.append(self._intern(airline_id, self.airlines, self._airline_positions))
+        if current_airport is not None:
+            bucket.offsets[current_airport] = (start, len(bucket))
+        return bucket
+
+
+# Shared by every request served by this worker process
+timetable_index = TimetableIndex(Config.TIMETABLE_SNAPSHOT_DIR)
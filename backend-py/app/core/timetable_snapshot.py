@@ -0,0 +1,161 @@
+import datetime
+import glob
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from app.core.timetable import TimetableAirport, TimetableBucket, TimetableIndex, _days_between
+
+# File layout: fixed header, JSON metadata, then the bucket columns aligned on 8 bytes
+SNAPSHOT_MAGIC = b'FGTT'
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_HEADER = struct.Struct('<4sHcxQ')  # magic, format, byte order, metadata length
+SNAPSHOT_POINTER = 'CURRENT'
+SNAPSHOT_FILE = 'timetable-{generation}.bin'
+
+# Bucket columns and their array type codes
+SNAPSHOT_COLUMNS = (
+    ('flight_ids', 'B'),
+    ('departure', 'i'),
+    ('arrival', 'i'),
+    ('route', 'i'),
+    ('departure_airport', 'i'),
+    ('arrival_airport', 'i'),
+    ('price_economy', 'd'),
+    ('price_business', 'd'),
+    ('price_first', 'd'),
+    ('aircraft', 'i'),
+    ('airline', 'i'),
+)
+
+
+def _padding(size: int) -> bytes:
+    return b'\0' * (-size % 8)
+
+
+def write_snapshot(directory: str, days: int) -> str:
+    """
+    Write the bookable flights of the next `days` days to a new snapshot generation and
+    publish it. The file is written under a temporary name and the CURRENT pointer is
+    swapped with os.replace, so workers only ever see complete generations.
+    Returns the path of the published file.
+    """
+    os.makedirs(directory, exist_ok=True)
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    date_min = datetime.datetime.combine(today, datetime.time.min, datetime.timezone.utc)
+
+    # A private index, versions are read before the flights so a concurrent change is never hidden
+    index = TimetableIndex(snapshot_dir=None)
+    days = _days_between(date_min, date_min + datetime.timedelta(days=days))
+    versions = index._remote_versions(days)
+    buckets = [index._load_bucket(day, versions[day]) for day in days]
+
+    metadata = {
+        'generation': time.time_ns(),
+        'built_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'airports': [[a.id, a.iata_code, a.city_id, a.latitude, a.longitude] for a in index._airports.values()],
+        'airlines': [str(airline_id) for airline_id in index.airlines],
+        'aircraft': index.aircraft,
+        'buckets': [],
+    }
+
+    # Lay out the columns of every bucket one after the other
+    chunks: List[bytes] = []
+    position = 0
+    for bucket in buckets:
+        columns = {}
+        for name, _ in SNAPSHOT_COLUMNS:
+            data = bytes(getattr(bucket, name)) if name == 'flight_ids' else getattr(bucket, name).tobytes()
+            columns[name] = [position, len(data)]
+            chunks.append(data + _padding(len(data)))
+            position += len(data) + len(_padding(len(data)))
+        metadata['buckets'].append({
+            'day': bucket.day.isoformat(),
+            'version': list(bucket.version),
+            'offsets': [[airport_id, start, end] for airport_id, (start, end) in bucket.offsets.items()],
+            'columns': columns,
+        })
+
+    encoded = json.dumps(metadata).encode()
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT, sys.byteorder[0].encode(), len(encoded))
+    name = SNAPSHOT_FILE.format(generation=metadata['generation'])
+    path = os.path.join(directory, name)
+
+    with open(path + '.tmp', 'wb') as f:
+        f.write(header)
+        f.write(encoded)
+        f.write(_padding(len(header) + len(encoded)))
+        for chunk in chunks:
+            f.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+    # Publish the new generation
+    pointer = os.path.join(directory, SNAPSHOT_POINTER)
+    with open(pointer + '.tmp', 'w') as f:
+        f.write(name)
+    os.replace(pointer + '.tmp', pointer)
+
+    # Keep the previous generation for workers that have not switched yet
+    generations = sorted(glob.glob(os.path.join(directory, SNAPSHOT_FILE.format(generation='*'))))
+    for old in generations[:-2]:
+        try:
+            os.remove(old)
+        except OSError:
+            pass
+    return path
+
+
+def current_snapshot_name(directory: str) -> Optional[str]:
+    """File name of the published generation, None if nothing was published yet"""
+    try:
+        with open(os.path.join(directory, SNAPSHOT_POINTER)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+class TimetableSnapshot:
+    """
+    Read-only memory map of a snapshot generation. Bucket columns are memoryviews over the
+    map, so every worker process shares the same physical pages through the page cache.
+    """
+
+    def __init__(self, path: str):
+        self.name = os.path.basename(path)
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, byteorder, length = SNAPSHOT_HEADER.unpack_from(self._map, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_FORMAT or byteorder != sys.byteorder[0].encode():
+            raise ValueError(f'Unsupported timetable snapshot {path}')
+        metadata = json.loads(self._map[SNAPSHOT_HEADER.size:SNAPSHOT_HEADER.size + length])
+        data_start = SNAPSHOT_HEADER.size + length
+        data_start += -data_start % 8
+
+        self._data = memoryview(self._map)[data_start:]
+        self.airports: Dict[int, TimetableAirport] = {
+            row[0]: TimetableAirport(*row) for row in metadata['airports']
+        }
+        self.airlines: List[uuid.UUID] = [uuid.UUID(airline_id) for airline_id in metadata['airlines']]
+        self.aircraft: List[str] = metadata['aircraft']
+        self._buckets = {datetime.date.fromisoformat(b['day']): b for b in metadata['buckets']}
+
+    def bucket(self, day: datetime.date, version: Tuple[int, int]) -> Optional[TimetableBucket]:
+        """Bucket of a day backed by the map, None if the day is missing or its version is stale"""
+        metadata = self._buckets.get(day)
+        if metadata is None or tuple(metadata['version']) != version:
+            return None
+
+        bucket = TimetableBucket(day, version)
+        for name, typecode in SNAPSHOT_COLUMNS:
+            offset, length = metadata['columns'][name]
+            setattr(bucket, name, self._data[offset:offset + length].cast(typecode))
+        bucket.offsets = {airport_id: (start, end) for airport_id, start, end in metadata['offsets']}
+        return bucket
@@ -5,7 +5,6 @@ from .user import User,Role,PayementCard
 from .airport import Airport
 from .location import City,Nation
 from .booking import Booking
-from .seat_session import SeatSession
 from .flight import Flight
 
-__all__ = ["User", "Role", "PayementCard", "Airline", "AirlineAircraft", "Extra","SeatSession","City","Nation","Airport","Booking","Flight","SeatSession"]
+__all__ = ["User", "Role", "PayementCard", "Airline", "AirlineAircraft", "Extra","City","Nation","Airport","Booking","Flight"]
@@ -104,6 +104,10 @@ class AirlineAircraft(db.Model):
         db.session.add_all(new_seats)
         db.session.commit()
 
+        # Seat maps are indexed on the ordered seats of the aircraft
+        from app.core.seat_map import invalidate_layout
+        invalidate_layout(self.id)
+
     @first_class_seats.setter
     def first_class_seats(self, value: List[str]):
         self.add_seats(value, ClassType.FIRST_CLASS)
@@ -3,14 +3,14 @@ import datetime
 from typing import List
 
 from sqlalchemy import Table
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.orm import Mapped, mapped_column, object_session, relationship
 from sqlalchemy.dialects.postgresql import UUID, ARRAY
 
 from app.extensions import db
 from app.models import AirlineAircraft
-from app.models.seat_session import SeatSession, Seat
 from app.models.airlines import Airline
 from app.models.airport import Airport
+from app.models.common import ClassType
 from app.models.extra import Extra
 
 
@@ -79,8 +79,9 @@ class Flight(db.Model):
     aircraft: Mapped[AirlineAircraft] = relationship(AirlineAircraft, back_populates='flights', foreign_keys=[aircraft_id])
     available_extras: Mapped[List['FlightExtra']] = relationship('FlightExtra', back_populates='flight', cascade='all, delete-orphan',lazy='noload' )
 
-    departure_bookings = relationship("BookingDepartureFlight", back_populates="flight",lazy='joined',cascade='all, delete-orphan',)
-    return_bookings = relationship("BookingReturnFlight", back_populates="flight",lazy='joined',cascade='all, delete-orphan',)
+    # Bookings are loaded on access only, use joinedload/selectinload where they are needed for many flights
+    departure_bookings = relationship("BookingDepartureFlight", back_populates="flight",lazy='select',cascade='all, delete-orphan',)
+    return_bookings = relationship("BookingReturnFlight", back_populates="flight",lazy='select',cascade='all, delete-orphan',)
 
     __table_args__ = (
         db.Index('ix_flight_fully_booked', 'fully_booked'),
@@ -135,40 +136,40 @@ class Flight(db.Model):
 
     @property
     def booked_seats(self):
-        booked_seats = []
-        for booking in self.departure_bookings:
-            booked_seats.append(booking.seat_number)
-        for booking in self.return_bookings:
-            booked_seats.append(booking.seat_number)
-
-        session_seats_obj = (Seat.query.join(SeatSession)
-                             .filter(SeatSession.session_end_time > datetime.datetime.now(datetime.UTC),
-                                     Seat.flight_id == self.id).all())
-        session_seats = [seat.seat_number for seat in session_seats_obj]
-        return booked_seats + session_seats
+        # Booked seats from the flight's seat map, then seats held by live seat sessions
+        from app.core.seat_map import load_seat_map
+        return load_seat_map(self).taken_seats()
     @property
     def booked_seats_confirmed(self):
         """Get all booked seats that are confirmed (not in session)"""
-        booked_seats = []
-        for booking in self.departure_bookings:
-            booked_seats.append(booking.seat_number)
-        for booking in self.return_bookings:
-            booked_seats.append(booking.seat_number)
-
-        return booked_seats
+        if 'departure_bookings' in self.__dict__ and 'return_bookings' in self.__dict__:
+            # Bookings already loaded by the caller
+            return [booking.seat_number for booking in (*self.departure_bookings, *self.return_bookings)]
+
+        # Only the seat numbers, without loading the bookings and their joined booking, user and extras.
+        # Queried through the flight's own session, which sees the bookings it flushed but did not commit yet
+        from app.models.booking import BookingDepartureFlight, BookingReturnFlight
+        session = object_session(self)
+        departure = session.query(BookingDepartureFlight.seat_number).filter(BookingDepartureFlight.flight_id == self.id)
+        ret = session.query(BookingReturnFlight.seat_number).filter(BookingReturnFlight.flight_id == self.id)
+        return [seat_number for seat_number, in departure.union_all(ret)]
 
     @property
     def seats_info(self):
+        # Seats by class from the cached aircraft layout, no seat table query
+        from app.core.seat_map import load_seat_map
+        seat_map = load_seat_map(self)
         return {
-            "first_class_seats": self.aircraft.first_class_seats,
-            "business_class_seats": self.aircraft.business_class_seats,
-            "economy_class_seats": self.aircraft.economy_class_seats,
-            "booked_seats": self.booked_seats,
+            "first_class_seats": seat_map.layout.class_seats(ClassType.FIRST_CLASS),
+            "business_class_seats": seat_map.layout.class_seats(ClassType.BUSINESS_CLASS),
+            "economy_class_seats": seat_map.layout.class_seats(ClassType.ECONOMY_CLASS),
+            "booked_seats": seat_map.taken_seats(),
         }
     
     @property
     def rows(self):
-        return self.aircraft.aircraft.rows
+        from app.core.seat_map import seat_layout
+        return seat_layout(self.aircraft_id).rows
 
     
     
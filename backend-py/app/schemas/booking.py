@@ -3,7 +3,8 @@ import datetime
 from marshmallow import Schema, fields as ma_fields, validates, ValidationError
 
 from app.extensions import ma
-from app.models import SeatSession, Booking
+from app.core.seat_holds import get_session
+from app.models import Booking
 from app.models.booking import BookingDepartureFlight, BookingFlightExtra
 from app.models.common import ClassType
 from app.models.flight import Flight, FlightExtra
@@ -38,10 +39,8 @@ class BookingInputSchema(Schema):
     @validates('session_id')
     def validate_session_exists(self, session_id, **kwargs):
 
-        session = SeatSession.query.filter(SeatSession.id == session_id,
-                                                SeatSession.session_end_time > datetime.datetime.now(datetime.UTC)
-                                                ).first()
-        if not session:
+        session = get_session(session_id)
+        if not session or session.session_end_time <= datetime.datetime.now(datetime.UTC):
             raise ValidationError(f"Session with ID {session_id} not found")
 
     @validates('extras')
@@ -69,7 +68,8 @@ class BookingFlightExtraSchema(ma.SQLAlchemyAutoSchema):
 class BookedFlightSchema(ma.Schema):
 
     id = ma.UUID(dump_only=True)
-    flight = ma.Nested(FlightSchema())  # Avoid circular imports
+    # Booking outputs do not return the seat map, skip its Redis read for every booked flight
+    flight = ma.Nested(FlightSchema(exclude=('booked_seats',)))  # Avoid circular imports
     seat_number = ma.String()
     class_type = ma.Enum(attribute="class_type",enum=ClassType)
     price = ma.Float()
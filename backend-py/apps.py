@@ -10,6 +10,8 @@ from flask_security import SQLAlchemySessionUserDatastore, Security
 from sqlalchemy import text
 
 from app.commands import init_app as init_commands
+from app.core.search_executor import start_search_executor
+from app.core.seat_holds import check_redis_version
 from config import Config
 from flask_login import LoginManager
 from app.apis import api
@@ -53,10 +55,20 @@ with app_flask.app_context():
         interval=3600,  # every hour
         repeat=None
     )
+    # Seat holds expire on their own in Redis, drop the former session sweeper if it is still scheduled
+    for job in scheduler.get_jobs():
+        if job.func_name == "task.free_sessions":
+            scheduler.cancel(job)
     scheduler.schedule(
         scheduled_time=datetime.datetime.now(datetime.UTC),
-        func="task.free_sessions",
-        interval=60,  # every minute
+        func="task.build_timetable_snapshot",
+        interval=900,  # every 15 minutes, stale days fall back to Postgres in between
+        repeat=None
+    )
+    scheduler.schedule(
+        scheduled_time=datetime.datetime.now(datetime.UTC),
+        func="task.refresh_fare_calendars",
+        interval=600,  # every 10 minutes
         repeat=None
     )
 
@@ -68,7 +80,14 @@ with app_flask.app_context():
         print(f"Extension already exists or error: {e}")
 
     db.metadata.create_all(bind=db_session.bind, checkfirst=True)
-    
+    # Seat sessions moved to Redis, drop their former tables
+    with db.engine.begin() as conn:
+        conn.execute(text('DROP TABLE IF EXISTS seat, seat_session'))
+    check_redis_version()
+
+# Search processes are forked while the worker is single threaded, before the server starts its threads
+start_search_executor(app_flask)
+
 
 if __name__ == '__main__':
     # dashboard.bind(app_flask)  # Should be added after all endpoints have been defined
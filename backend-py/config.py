@@ -51,6 +51,17 @@ class Config:
     JWT_COOKIE_CSRF_PROTECT = True  # Enable CSRF protection
     REDIS_URL = os.environ.get('REDIS_URL', 'redis://:6379/0')
 
+    # Memory-mapped search timetable shared by the web workers
+    TIMETABLE_SNAPSHOT_DIR = os.environ.get('TIMETABLE_SNAPSHOT_DIR', os.path.join(basedir, 'instance', 'timetable'))
+    TIMETABLE_SNAPSHOT_DAYS = int(os.environ.get('TIMETABLE_SNAPSHOT_DAYS', 90))
+    # Search processes per web worker (0 runs searches in the request thread) and time budget per request
+    SEARCH_WORKERS = int(os.environ.get('SEARCH_WORKERS', 0))
+    SEARCH_BUDGET_SECONDS = float(os.environ.get('SEARCH_BUDGET_SECONDS', 10))
+    # Journeys flying more than this multiple of the direct distance are not explored (0 disables)
+    SEARCH_DETOUR_FACTOR = float(os.environ.get('SEARCH_DETOUR_FACTOR', 2.5))
+    # Most requested fare calendars recomputed by the background refresh
+    FARE_CALENDAR_REFRESH_TOP = int(os.environ.get('FARE_CALENDAR_REFRESH_TOP', 50))
+
     MAIL_SERVER = 'smtp.example.com'
     MAIL_PORT = 587
     MAIL_USE_TLS = True
@@ -3,8 +3,12 @@ import json
 from flask import  Flask
 
 from app.core.stats import calculate_airline_stats
+from app.apis.search_utils import refresh_fare_calendar
+from app.core.fare_calendar import popular_calendars
+from app.core.timetable_snapshot import write_snapshot
 from app.extensions import db, redis_client
-from app.models import SeatSession, Airline
+from app.models import Airline
+from config import Config
 
 
 
@@ -16,23 +20,15 @@ def update_airline_stats_cache():
         redis_client.set(f'airline_stats:{airline.id}', json.dumps(stats))
 
 
-def free_sessions():
-    """Free expired seat sessions"""
-    to_delete = SeatSession.query.filter(
-        SeatSession.session_end_time < datetime.datetime.now(tz=datetime.UTC)).all()
-    print(to_delete)
-    if not to_delete:
-        print("No sessions to delete.")
-        return
-    for seat in to_delete:
-        print(f"Deleting session: {seat.id} with end time: {seat.session_end_time}")
-        db.session.delete(seat)
-    db.session.commit()
-    print("Free sessions task executed successfully.")
-
-
-
-
-
+def build_timetable_snapshot():
+    """Publish a new generation of the memory-mapped search timetable"""
+    path = write_snapshot(Config.TIMETABLE_SNAPSHOT_DIR, Config.TIMETABLE_SNAPSHOT_DAYS)
+    print(f"Timetable snapshot published at {path}.")
 
 
+def refresh_fare_calendars():
+    """Recompute the stale days of the most requested fare calendars"""
+    calendars = popular_calendars(Config.FARE_CALENDAR_REFRESH_TOP)
+    for calendar in calendars:
+        refresh_fare_calendar(calendar)
+    print(f"Refreshed {len(calendars)} fare calendars.")
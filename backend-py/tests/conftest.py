@@ -0,0 +1,45 @@
+import pytest
+from flask import Flask
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from config import Config
+
+if not Config.SQLALCHEMY_DATABASE_URI:
+    # The app engine cannot even be created, every test needs a disposable Postgres database
+    collect_ignore_glob = ['test_*.py']
+else:
+    import app.models  # noqa: F401, registers every model before the extensions are used
+    from app.extensions import db
+
+
+@pytest.fixture(scope='session')
+def flask_app():
+    """Bare app bound to DATABASE_URI (a disposable Postgres database), without the API or the scheduler"""
+    flask_app = Flask(__name__)
+    flask_app.config.from_object(Config)
+    db.init_app(flask_app)
+    with flask_app.app_context():
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        except OperationalError as e:
+            pytest.skip(f'Postgres is not reachable: {e}')
+        db.create_all()
+        yield flask_app
+
+
+@pytest.fixture
+def session(flask_app):
+    """Session whose changes are rolled back once the test ends"""
+    connection = db.engine.connect()
+    transaction = connection.begin()
+    original = db.session
+    db.session = db._make_scoped_session({'bind': connection, 'join_transaction_mode': 'create_savepoint'})
+    try:
+        yield db.session
+    finally:
+        db.session.remove()
+        db.session = original
+        transaction.rollback()
+        connection.close()
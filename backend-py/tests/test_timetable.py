@@ -0,0 +1,84 @@
+import datetime
+import uuid
+
+from sqlalchemy import event
+
+from app.core.timetable import TimetableIndex
+from app.extensions import db
+from app.models import Aircraft, Airline, AirlineAircraft, Airport, City, Flight, Nation
+from app.models.flight import Route
+
+
+def _add_flights(session, count: int) -> datetime.date:
+    """`count` flights on one day, spread over two routes so the bucket holds two departure airports"""
+    suffix = uuid.uuid4().hex[:6]
+    nation = Nation(name='Test', code='TST', alpha2='TT')
+    city = City(name='Test', nation=nation)
+    airports = [Airport(name=f'Airport {i}', iata_code=None, latitude=45.0 + i, longitude=9.0 + i, city=city)
+                for i in range(3)]
+    aircraft = Aircraft(name=f'Test {suffix}', rows=10, columns=4, unavailable_seats=[])
+    airline = Airline(name=f'Airline {suffix}')
+    airline_aircraft = AirlineAircraft(aircraft=aircraft, airline=airline, tail_number=f'T-{suffix}')
+
+    day = datetime.datetime.now(datetime.UTC).date() + datetime.timedelta(days=7)
+    period_start = datetime.datetime.combine(day, datetime.time.min, datetime.UTC)
+    routes = [Route(flight_number=f'TS{suffix}{i}', departure_airport=airports[i], arrival_airport=airports[2],
+                    airline=airline, period_start=period_start, period_end=period_start + datetime.timedelta(days=1))
+              for i in range(2)]
+    session.add_all([*airports, airline_aircraft, *routes])
+    session.flush()
+
+    for i in range(count):
+        departure = period_start + datetime.timedelta(hours=2, minutes=i)
+        session.add(Flight(
+            route_id=routes[i % 2].id,
+            aircraft_id=airline_aircraft.id,
+            departure_time=departure,
+            arrival_time=departure + datetime.timedelta(hours=2),
+            checkin_start_time=departure - datetime.timedelta(hours=2),
+            checkin_end_time=departure - datetime.timedelta(minutes=50),
+            boarding_start_time=departure - datetime.timedelta(minutes=40),
+            boarding_end_time=departure - datetime.timedelta(minutes=10),
+            price_first_class=300,
+            price_business_class=200,
+            price_economy_class=100,
+            price_insurance=10,
+        ))
+    session.flush()
+    return day
+
+
+def _load_counting_statements(day: datetime.date):
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        bucket = TimetableIndex()._load_bucket(day, (0, 0))
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+    return bucket, statements
+
+
+def test_load_bucket_issues_one_statement_regardless_of_flight_count(session):
+    loaded = []
+    for count in (1, 40):
+        day = _add_flights(session, count)
+        bucket, statements = _load_counting_statements(day)
+        # The second bucket also holds the flight added by the first round
+        loaded.append(len(bucket))
+        assert len(statements) == 1, statements
+    assert loaded == [1, 41]
+
+
+def test_load_bucket_groups_flights_by_departure_airport(session):
+    day = _add_flights(session, 5)
+    bucket, _ = _load_counting_statements(day)
+
+    assert len(bucket) == 5
+    assert sorted(end - start for start, end in bucket.offsets.values()) == [2, 3]
+    for airport_id, (start, end) in bucket.offsets.items():
+        assert all(bucket.departure_airport[i] == airport_id for i in range(start, end))
+        assert list(bucket.departure[start:end]) == sorted(bucket.departure[start:end])